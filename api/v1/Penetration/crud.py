@@ -1,41 +1,182 @@
-from typing import Dict, Any, Optional, List
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
 from .model import TaskModel
+from .runner.status_store import get_status_writer
+
+# 持久化存储单次调用超时（秒）；存储不可用时的重试间隔（秒）
+STORE_TIMEOUT = 5
+STORE_RETRY_INTERVAL = 30
+# 写穿缓存的有效期（秒）：过期后从存储重新加载，以看到其他 worker 的更新
+CACHE_TTL = 2.0
+
+# 写入存储的任务字段
+STORE_FIELDS = ("target", "state", "stage", "percent", "hint", "blocked", "budget", "approved", "poll_count")
 
 
 class TaskCRUD:
-    """任务数据操作"""
+    """
+    任务数据操作：SQLAlchemy 异步存储（sys_task 表）+ 进程内写穿缓存。
+    多个 uvicorn worker 共享同一张表；存储不可用时退化为进程内缓存并定期重试，
+    缓存未命中时可从 runs/{task_id}/status.json 恢复任务。
+    """
 
     def __init__(self):
-        self._tasks: Dict[str, TaskModel] = {}
+        self._tasks: Dict[str, Tuple[TaskModel, float]] = {}
+        self._lock = threading.Lock()
+        self._store = None
+        self._store_failed_at: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ------------------------------
+    # 存储桥接：同步接口 -> 后台事件循环中的异步 CRUD
+    # ------------------------------
+    def _get_store(self):
+        if self._store_failed_at is not None and time.monotonic() - self._store_failed_at < STORE_RETRY_INTERVAL:
+            return None
+        if self._store is not None:
+            return self._store
+
+        with self._lock:
+            if self._store is not None:
+                return self._store
+            try:
+                # 延迟导入，避免与 app.api.v1.module_system 的循环依赖
+                from app.config.setting import settings
+                from app.api.v1.module_system.task.crud import TaskCRUD as TaskStore
+
+                if self._loop is None:
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._loop.run_forever, name="task-store", daemon=True).start()
+                store = TaskStore(settings)
+                self._submit(store.init_table())
+                self._store = store
+                self._store_failed_at = None
+            except Exception as e:
+                self._mark_store_failed(e)
+        return self._store
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout=STORE_TIMEOUT)
+
+    def _mark_store_failed(self, error: Exception):
+        if self._store_failed_at is None:
+            print(f"任务存储不可用，暂时使用进程内缓存: {error}")
+        self._store = None
+        self._store_failed_at = time.monotonic()
+
+    def _call_store(self, method: str, *args):
+        store = self._get_store()
+        if store is None:
+            return None
+        try:
+            return self._submit(getattr(store, method)(*args))
+        except Exception as e:
+            self._mark_store_failed(e)
+            return None
+
+    # ------------------------------
+    # 缓存
+    # ------------------------------
+    def _cache_put(self, task: TaskModel):
+        self._tasks[task.task_id] = (task, time.monotonic())
+
+    def _cache_get(self, task_id: str, fresh_only: bool) -> Optional[TaskModel]:
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return None
+        task, cached_at = entry
+        if fresh_only and time.monotonic() - cached_at > CACHE_TTL:
+            return None
+        return task
 
-    def create(self, task_id: str, budget: Dict[str, Any]) -> TaskModel:
+    @staticmethod
+    def _from_record(record) -> TaskModel:
+        task = TaskModel(record.task_id, record.budget or {}, target=record.target)
+        for key in STORE_FIELDS:
+            setattr(task, key, getattr(record, key))
+        if record.updated_time is not None:
+            task.updated_at = TaskModel.to_iso(record.updated_time)
+        return task
+
+    @staticmethod
+    def _from_runs(task_id: str) -> Optional[TaskModel]:
+        """从证据目录恢复任务（进程重启 / 存储不可用时）"""
+        status_path = f"runs/{task_id}/status.json"
+        if not task_id or not os.path.exists(status_path):
+            return None
+        status = get_status_writer(task_id).get()
+        if not status:
+            return None
+
+        task = TaskModel(task_id, status.get("budget") or {}, target=status.get("target"))
+        for key in ("state", "stage", "percent", "hint", "blocked"):
+            if status.get(key) is not None:
+                setattr(task, key, status[key])
+        return task
+
+    # ------------------------------
+    # 对外接口（保持原同步签名）
+    # ------------------------------
+    def create(self, task_id: str, budget: Dict[str, Any], target: Optional[str] = None) -> TaskModel:
         """创建任务"""
-        task = TaskModel(task_id, budget)
-        self._tasks[task_id] = task
+        task = TaskModel(task_id, budget, target=target)
+        self._call_store("create_task", {"task_id": task_id, **{k: getattr(task, k) for k in STORE_FIELDS}})
+        self._cache_put(task)
         return task
 
     def get(self, task_id: str) -> Optional[TaskModel]:
-        """获取任务"""
-        return self._tasks.get(task_id)
+        """获取任务：新鲜缓存 -> 存储 -> 过期缓存 -> runs/ 证据目录"""
+        task = self._cache_get(task_id, fresh_only=True)
+        if task is not None:
+            return task
+
+        record = self._call_store("get_task", task_id)
+        if record is not None:
+            task = self._from_record(record)
+            self._cache_put(task)
+            return task
+
+        task = self._cache_get(task_id, fresh_only=False)
+        if task is not None:
+            return task
+
+        task = self._from_runs(task_id)
+        if task is not None:
+            self._call_store("create_task", {"task_id": task_id, **{k: getattr(task, k) for k in STORE_FIELDS}})
+            self._cache_put(task)
+        return task
 
     def update(self, task_id: str, **kwargs) -> Optional[TaskModel]:
-        """更新任务"""
+        """更新任务（写穿：先写存储，再刷新缓存）"""
         task = self.get(task_id)
         if task:
             task.update(**kwargs)
+            fields = {k: v for k, v in kwargs.items() if k in STORE_FIELDS}
+            self._call_store("update_task", task_id, fields)
+            self._cache_put(task)
         return task
 
     def delete(self, task_id: str) -> bool:
         """删除任务"""
+        deleted = bool(self._call_store("delete_task", task_id))
         if task_id in self._tasks:
             del self._tasks[task_id]
             return True
-        return False
+        return deleted
+
+    def list_all(self, state: Optional[str] = None, stage: Optional[str] = None, limit: int = 100) -> List[TaskModel]:
+        """列出任务（存储可用时走索引查询，否则返回进程内缓存）"""
+        records = self._call_store("list_tasks", state, stage, limit)
+        if records is not None:
+            return [self._from_record(r) for r in records]
 
-    def list_all(self) -> List[TaskModel]:
-        """列出所有任务"""
-        return list(self._tasks.values())
+        tasks = [task for task, _ in self._tasks.values()
+                 if (not state or task.state == state) and (not stage or task.stage == stage)]
+        return sorted(tasks, key=lambda t: t.updated_at, reverse=True)[:limit]
 
 
 # 全局CRUD实例
-task_crud = TaskCRUD()
\ No newline at end of file
+task_crud = TaskCRUD()
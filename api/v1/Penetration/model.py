@@ -5,8 +5,9 @@ from datetime import datetime, timezone
 class TaskModel:
     """任务数据模型"""
 
-    def __init__(self, task_id: str, budget: Dict[str, Any]):
+    def __init__(self, task_id: str, budget: Dict[str, Any], target: Optional[str] = None):
         self.task_id = task_id
+        self.target = target
         self.state = "created"
         self.stage = "stage0_create"
         self.percent = 0
@@ -21,10 +22,16 @@ class TaskModel:
     def _now_iso():
         return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
+    @staticmethod
+    def to_iso(value: datetime) -> str:
+        """数据库时间（本地时区 naive）转为与 _now_iso 一致的 UTC ISO 字符串"""
+        return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
             "task_id": self.task_id,
+            "target": self.target,
             "state": self.state,
             "stage": self.stage,
             "percent": self.percent,
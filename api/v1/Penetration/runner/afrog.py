@@ -22,7 +22,8 @@ class AfrogRunner(BaseRunner):
         cmd = [
             binary,
             "-t", target_url,
-            "-j", str(tmp_output)
+            "-j", str(tmp_output),
+            *self.rate_limit_flags("afrog", target_url)
         ]
 
         self.run_tool(cmd, "tool_afrog")
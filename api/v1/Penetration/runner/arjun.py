@@ -16,7 +16,7 @@ class ArjunRunner(BaseRunner):
         tmp_output = self.base_dir / "arjun_raw.json"
 
         # arjun -u <url> -oJ <output>
-        cmd = ["arjun", "-u", target_url, "-oJ", str(tmp_output)]
+        cmd = ["arjun", "-u", target_url, "-oJ", str(tmp_output), *self.rate_limit_flags("arjun", target_url)]
 
         self.run_tool(cmd, "tool_arjun")
 
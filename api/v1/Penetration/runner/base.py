@@ -1,8 +1,32 @@
+import asyncio
+import contextvars
 import json
+import queue
 import subprocess
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, Tuple, Callable, List, Iterable
+
+from .status_store import get_status_writer
+from .task_logger import task_log_writer, log_record
+from .ratelimit import rate_limiter, split_rps, TOOL_RATE_FLAGS
+from .endpoint_index import merge_endpoints
+
+# 流式执行时读取线程与消费者之间的行缓冲上限，超过后读取线程阻塞，保证内存占用恒定
+STREAM_QUEUE_SIZE = 1024
+# 输出流全部关闭后等待子进程自行退出的宽限时间（秒），超时再终止
+STREAM_EXIT_GRACE = 5
+# follow_file 轮询文件增长的间隔（秒）与单次读取块大小
+FOLLOW_POLL_INTERVAL = 0.2
+FOLLOW_CHUNK_SIZE = 64 * 1024
+# 异步流式执行时单次读取子进程输出的块大小（行长度不受限制）
+STREAM_READ_CHUNK = 64 * 1024
+
+# 阶段性发现的回调（由作业队列在工作线程中设置），Runner 通过 emit_finding 上报部分结果
+finding_sink: contextvars.ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = \
+    contextvars.ContextVar("finding_sink", default=None)
 
 
 class BaseRunner:
@@ -15,69 +39,132 @@ class BaseRunner:
         # 严格遵守 Evidence Store 目录规范
         self.base_dir = Path(f"runs/{task_id}")
         self.log_dir = self.base_dir / "logs"
+        self._status = get_status_writer(task_id)
         self._initialize_environment()
 
     def _initialize_environment(self):
         """确保物理目录存在并初始化状态文件"""
         self.log_dir.mkdir(parents=True, exist_ok=True)
-        status_path = self.base_dir / "status.json"
-        if not status_path.exists():
+        if not self._status.exists():
             self.update_status({
                 "state": "init",
                 "stage": "Stage0_Create",
                 "percent": 0,
                 "hint": "任务初始化完成",
                 "blocked": {"is_blocked": False}
-            })
+            }, flush=True)
 
-    def update_status(self, status_update: Dict[str, Any]):
-        """更新物理 status.json 证据文件，确保状态合同一致"""
-        status_path = self.base_dir / "status.json"
-        current_status = {}
-        if status_path.exists():
-            try:
-                with open(status_path, "r", encoding="utf-8") as f:
-                    current_status = json.load(f)
-            except Exception:
-                current_status = {}
+    def update_status(self, status_update: Dict[str, Any], flush: bool = False):
+        """
+        更新 status.json 证据文件，确保状态合同一致。
+        同一任务的更新在进程内共享并合并落盘（原子替换 + 文件锁），flush=True 时立即落盘
+        """
+        self._status.update(status_update, flush=flush)
 
-        current_status.update(status_update)
-        current_status["task_id"] = self.task_id
-        current_status["updated_at"] = datetime.now().isoformat()
+    def read_status(self) -> Dict[str, Any]:
+        """读取当前任务状态（优先使用进程内最新状态，不重复解析文件）"""
+        return self._status.get()
 
-        with open(status_path, "w", encoding="utf-8") as f:
-            json.dump(current_status, f, ensure_ascii=False, indent=2)
+    @property
+    def tool_name(self) -> str:
+        """日志中的工具名，默认取 Runner 类名去掉 Runner 后缀"""
+        return type(self).__name__.replace("Runner", "").lower() or "base"
 
-    def write_log(self, stage_name: str, message: str):
-        """记录标准日志至 logs/stageX.log"""
-        log_path = self.log_dir / f"{stage_name}.log"
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] {message}\n")
+    def write_log(self, stage_name: str, message: str, **fields):
+        """
+        记录结构化日志至 logs/{stage}.log（JSON Lines：ts/task_id/stage/tool/pid/msg 及附加字段），
+        由后台线程批量落盘
+        """
+        fields.setdefault("tool", self.tool_name)
+        task_log_writer.log(
+            self.log_dir / f"{stage_name}.log",
+            log_record(self.task_id, stage_name, message, **fields)
+        )
 
     def save_artifact(self, filename: str, data: Dict[str, Any]):
         """将生成的证据存入 Evidence Store"""
         file_path = self.base_dir / filename
         with open(file_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-        self.write_log("system", f"产物已落盘: {filename}")
+        self.write_log("system", f"产物已落盘: {filename}", artifact=filename)
 
-    def _get_budget_timeout(self) -> int:
-        """从状态文件中读取预算的超时时间，默认 900 秒"""
-        status_path = self.base_dir / "status.json"
-        if status_path.exists():
+    def merge_endpoints(self, items, source: Optional[str] = None, **fields) -> Dict[str, Any]:
+        """把产出的 URL 规范化后按模板去重合并进 endpoints.json，返回合并后的内容（含本次新增数 added）"""
+        data = merge_endpoints(self.base_dir, self.task_id, items, source, **fields)
+        self.write_log("system", f"endpoints.json 合并 {data['added']} 个新端点（{source or self.tool_name}），"
+                                 f"共 {len(data['endpoints'])} 个", artifact="endpoints.json", added=data["added"])
+        return data
+
+    def emit_finding(self, finding: Dict[str, Any]):
+        """上报一条阶段性发现，供作业队列对外暴露部分结果；无订阅者时为空操作"""
+        sink = finding_sink.get()
+        if sink is not None:
             try:
-                with open(status_path, "r", encoding="utf-8") as f:
-                    return json.load(f).get("budget", {}).get("timeout_seconds", 900)
-            except Exception:
-                pass
-        return 900
+                sink(finding)
+            except Exception as e:
+                self.write_log("system", f"上报阶段性发现失败: {e}")
+
+    def _get_budget_timeout(self) -> int:
+        """从任务状态中读取预算的超时时间，默认 900 秒"""
+        return (self.read_status().get("budget") or {}).get("timeout_seconds", 900)
+
+    def rate_limit_flags(self, tool: str, target: str = "") -> List[str]:
+        """按任务预算（rate_limit_rps）生成外部工具的原生限速参数；任务未设置预算时返回空列表"""
+        return rate_limiter.tool_flags(tool, self.task_id, target)
+
+    def rate_limit_workers(self, tool: str, workers: int, target: str = "") -> Tuple[int, List[str]]:
+        """
+        多个工具进程并行时，将任务预算在各进程间均分：返回 (实际并发进程数, 每个进程的限速参数)。
+        任务未设置预算时并发数不变、限速参数为空
+        """
+        rps = self.rate_limit_rps(target)
+        if rps is None or tool not in TOOL_RATE_FLAGS:
+            return workers, []
+        workers, per_worker = split_rps(rps, workers)
+        return workers, TOOL_RATE_FLAGS[tool](per_worker)
+
+    def rate_limit_rps(self, target: str = "") -> Optional[float]:
+        """当前任务对该目标可用的请求速率（次/秒）；任务未设置预算时返回 None"""
+        return rate_limiter.effective_rps(self.task_id, target)
+
+    def throttle(self, target: str = ""):
+        """Python 原生 HTTP 请求发出前调用：按全局 / 任务 / 目标主机令牌桶等待"""
+        rate_limiter.acquire(self.task_id, target)
+
+    async def athrottle(self, target: str = ""):
+        await rate_limiter.aacquire(self.task_id, target)
+
+    @staticmethod
+    def submit_in_context(pool: Executor, fn: Callable, *args) -> Future:
+        """提交到线程池并复制当前 contextvars：工作线程不继承上下文，否则 emit_finding 无法上报到作业队列"""
+        return pool.submit(contextvars.copy_context().run, fn, *args)
+
+    def map_shards(self, fn: Callable[[Any], Any], items: Iterable[Any], workers: int, thread_name: str,
+                   deadline: Optional[float] = None, skipped: Any = None) -> Iterator[Tuple[Any, Any]]:
+        """
+        分片并行执行 fn(item)，按完成顺序产出 (item, 结果)。
+        指定 deadline（time.monotonic() 时间）时，截止后才轮到的分片不再执行，结果记为 skipped
+        """
+        items = list(items)
+        if not items:
+            return
+
+        def _run(item):
+            if deadline is not None and time.monotonic() >= deadline:
+                return skipped
+            return fn(item)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(items))), thread_name_prefix=thread_name) as pool:
+            futures = {self.submit_in_context(pool, _run, item): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                yield items[futures[future]], future.result()
 
     def run_tool(self, cmd: list, stage_name: str, timeout: int = None) -> Optional[str]:
         if timeout is None:
             timeout = self._get_budget_timeout()
 
         self.write_log(stage_name, f"执行命令: {' '.join(cmd)}, 超时限制: {timeout}秒")
+        started = time.monotonic()
         try:
             result = subprocess.run(
                 cmd,
@@ -89,13 +176,257 @@ class BaseRunner:
                 stdin=subprocess.DEVNULL
             )
             if result.stdout:
-                self.write_log(stage_name, f"STDOUT 长度: {len(result.stdout)}")
+                self.write_log(stage_name, f"STDOUT 长度: {len(result.stdout)}",
+                               duration=round(time.monotonic() - started, 3), exit_code=result.returncode)
             return result.stdout
 
         except subprocess.TimeoutExpired as e:
-            self.write_log(stage_name, f"错误: 执行超时（> {timeout}秒），保留截断数据")
+            self.write_log(stage_name, f"错误: 执行超时（> {timeout}秒），保留截断数据",
+                           duration=round(time.monotonic() - started, 3))
             self.update_status({"hint": f"警告: {stage_name} 触发超时限制，输出部分结果"})
             return e.stdout.decode(errors="ignore") if e.stdout else None
         except Exception as e:
             self.write_log(stage_name, f"异常: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    async def arun_tool(self, cmd: list, stage_name: str, timeout: int = None) -> Optional[str]:
+        """run_tool 的异步版本：基于 asyncio 子进程执行，等待期间不占用线程，超时保留截断输出"""
+        stdout_lines = []
+        async for name, line in self.astream_tool(cmd, stage_name, timeout):
+            if name == "stdout":
+                stdout_lines.append(line)
+        return "\n".join(stdout_lines) if stdout_lines else None
+
+    def stream_tool(self, cmd: list, stage_name: str, timeout: int = None,
+                    stop: Optional[Callable[[], bool]] = None) -> Iterator[Tuple[str, str]]:
+        """
+        流式执行外部工具：按行产出 ("stdout" | "stderr", line)，不在内存中缓存完整输出。
+        超时、stop() 返回 True（在工具无输出时同样按秒检查）或调用方提前结束迭代时会终止子进程，
+        已产出的行即为截断结果。
+        """
+        if timeout is None:
+            timeout = self._get_budget_timeout()
+
+        self.write_log(stage_name, f"流式执行命令: {' '.join(cmd)}, 超时限制: {timeout}秒")
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                errors="ignore",
+                bufsize=1
+            )
+        except Exception as e:
+            self.write_log(stage_name, f"异常: {str(e)}")
+            return
+
+        started = time.monotonic()
+        lines: queue.Queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        def _pump(pipe, name: str):
+            try:
+                for raw in pipe:
+                    lines.put((name, raw.rstrip("\r\n")))
+            finally:
+                pipe.close()
+                lines.put((name, None))
+
+        readers = [
+            threading.Thread(target=_pump, args=(proc.stdout, "stdout"), daemon=True),
+            threading.Thread(target=_pump, args=(proc.stderr, "stderr"), daemon=True),
+        ]
+        for t in readers:
+            t.start()
+
+        deadline = time.monotonic() + timeout
+        open_streams = len(readers)
+        stdout_lines = 0
+        timed_out = False
+        try:
+            while open_streams:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                if stop is not None and stop():
+                    self.write_log(stage_name, "收到停止信号，终止执行")
+                    break
+                try:
+                    name, line = lines.get(timeout=min(remaining, 1.0))
+                except queue.Empty:
+                    continue
+                if line is None:
+                    open_streams -= 1
+                    continue
+                if name == "stdout":
+                    stdout_lines += 1
+                yield name, line
+        finally:
+            if proc.poll() is None and not open_streams:
+                try:
+                    proc.wait(timeout=STREAM_EXIT_GRACE)
+                except subprocess.TimeoutExpired:
+                    pass
+            if proc.poll() is None:
+                proc.kill()
+            # 排空队列，避免读取线程阻塞在 put 上
+            while any(t.is_alive() for t in readers):
+                try:
+                    lines.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            proc.wait()
+
+            if timed_out:
+                self.write_log(stage_name, f"错误: 执行超时（> {timeout}秒），保留截断数据")
+                self.update_status({"hint": f"警告: {stage_name} 触发超时限制，输出部分结果"})
+            self.write_log(stage_name, f"STDOUT 行数: {stdout_lines}, 退出码: {proc.returncode}",
+                           duration=round(time.monotonic() - started, 3), child_pid=proc.pid,
+                           exit_code=proc.returncode, stdout_lines=stdout_lines)
+
+    async def astream_tool(self, cmd: list, stage_name: str, timeout: int = None) -> AsyncIterator[Tuple[str, str]]:
+        """stream_tool 的异步迭代器版本，基于 asyncio 子进程，不占用线程"""
+        if timeout is None:
+            timeout = self._get_budget_timeout()
+
+        self.write_log(stage_name, f"流式执行命令: {' '.join(cmd)}, 超时限制: {timeout}秒")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                stdin=asyncio.subprocess.DEVNULL
+            )
+        except Exception as e:
+            self.write_log(stage_name, f"异常: {str(e)}")
+            return
+
+        started = time.monotonic()
+        lines: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def _pump(reader: asyncio.StreamReader, name: str):
+            # 按块读取后自行切分行：StreamReader.readline 受 64 KiB 行长限制，
+            # nuclei 等工具输出的超长 JSONL 行会使其抛出异常并丢失后续全部输出
+            buffer = bytearray()
+            try:
+                while True:
+                    chunk = await reader.read(STREAM_READ_CHUNK)
+                    if not chunk:
+                        break
+                    start = len(buffer)
+                    buffer.extend(chunk)
+                    pos = buffer.find(b"\n", start)
+                    begin = 0
+                    while pos != -1:
+                        await lines.put((name, buffer[begin:pos].decode("utf-8", errors="ignore").rstrip("\r")))
+                        begin = pos + 1
+                        pos = buffer.find(b"\n", begin)
+                    del buffer[:begin]
+                if buffer:
+                    await lines.put((name, buffer.decode("utf-8", errors="ignore").rstrip("\r")))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.write_log(stage_name, f"读取 {name} 输出异常: {type(e).__name__}: {e}")
+            finally:
+                await lines.put((name, None))
+
+        readers = [
+            asyncio.create_task(_pump(proc.stdout, "stdout")),
+            asyncio.create_task(_pump(proc.stderr, "stderr")),
+        ]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        open_streams = len(readers)
+        stdout_lines = 0
+        timed_out = False
+        try:
+            while open_streams:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                try:
+                    name, line = await asyncio.wait_for(lines.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    break
+                if line is None:
+                    open_streams -= 1
+                    continue
+                if name == "stdout":
+                    stdout_lines += 1
+                yield name, line
+        finally:
+            if proc.returncode is None and not open_streams:
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout=STREAM_EXIT_GRACE)
+                except asyncio.TimeoutError:
+                    pass
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+            for t in readers:
+                t.cancel()
+            await proc.wait()
+
+            if timed_out:
+                self.write_log(stage_name, f"错误: 执行超时（> {timeout}秒），保留截断数据")
+                self.update_status({"hint": f"警告: {stage_name} 触发超时限制，输出部分结果"})
+            self.write_log(stage_name, f"STDOUT 行数: {stdout_lines}, 退出码: {proc.returncode}",
+                           duration=round(time.monotonic() - started, 3), child_pid=proc.pid,
+                           exit_code=proc.returncode, stdout_lines=stdout_lines)
+
+    @staticmethod
+    def follow_file(path: Path, stop: Callable[[], bool], poll_interval: float = FOLLOW_POLL_INTERVAL) -> Iterator[str]:
+        """
+        追踪由外部工具持续写入的文件，按完整行产出（类似 tail -f）。
+        stop() 为真后读完剩余内容（含末尾不完整的行）即结束，用于工具结束或超时后收尾
+        """
+        f = None
+        pending = ""
+        try:
+            while True:
+                if f is None:
+                    try:
+                        f = open(path, "r", encoding="utf-8", errors="ignore")
+                    except FileNotFoundError:
+                        if stop():
+                            return
+                        time.sleep(poll_interval)
+                        continue
+
+                # 先判断是否结束再读取，保证结束前写入的内容都能被读到
+                finished = stop()
+                chunk = f.read(FOLLOW_CHUNK_SIZE)
+                if chunk:
+                    pending += chunk
+                    *lines, pending = pending.split("\n")
+                    for line in lines:
+                        yield line.rstrip("\r")
+                    continue
+                if finished:
+                    if pending:
+                        yield pending
+                    return
+                time.sleep(poll_interval)
+        finally:
+            if f is not None:
+                f.close()
+
+    @staticmethod
+    def iter_jsonl(lines) -> Iterator[Dict[str, Any]]:
+        """从 stream_tool 的产出中逐行解析 stdout JSONL，跳过 stderr 与非 JSON 行"""
+        for name, line in lines:
+            if name != "stdout" or not line.startswith("{"):
+                continue
+            try:
+                yield json.loads(line)
+            except Exception:
+                continue
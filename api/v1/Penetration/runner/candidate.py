@@ -1,12 +1,119 @@
+import heapq
 import json
+import os
 import re
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
 from .base import BaseRunner
+from .endpoint_index import canonicalize_url
+
+# 自定义规则文件（存在时替换内置规则），格式见 DEFAULT_RULES
+CANDIDATE_RULES_PATH = Path("config/candidate_rules.json")
+# 输出的候选点数量上限
+CANDIDATE_TOP_K = 50
+# 没有端点命中规则时，仍按顺序保留的保底候选数
+CANDIDATE_MIN_COUNT = 3
+
+_PARAM_NAME = re.compile(r"(?:^|&)([^=&]+)")
+
+# 内置风险规则：kind 为 path（路径关键词，正则）/ param（参数名，整名匹配的正则）/
+# status（响应状态码）/ tech（指纹技术栈名称，小写子串），weight 为命中加分
+DEFAULT_RULES: Dict[str, List[Dict[str, Any]]] = {
+    "path": [
+        {"pattern": r"login|signin|auth|sso|oauth", "weight": 5, "reason": "认证入口"},
+        {"pattern": r"admin|manage|console|dashboard", "weight": 5, "reason": "管理后台"},
+        {"pattern": r"config|setting|\.env|\.git|backup|\.bak|\.sql", "weight": 6, "reason": "配置/备份泄露"},
+        {"pattern": r"upload|import|file", "weight": 4, "reason": "文件操作"},
+        {"pattern": r"/api/|/v\d+/|graphql|swagger|openapi", "weight": 3, "reason": "API 接口"},
+        {"pattern": r"debug|actuator|phpinfo|server-status|trace", "weight": 6, "reason": "调试接口"},
+        {"pattern": r"\.php|\.jsp|\.aspx?|\.do|\.action", "weight": 2, "reason": "动态脚本"},
+    ],
+    "param": [
+        {"pattern": r"id|uid|user_?id|item|pid|order", "weight": 3, "reason": "对象 ID 参数"},
+        {"pattern": r"url|uri|redirect|next|return(_?url)?|callback|dest", "weight": 4, "reason": "跳转/SSRF 参数"},
+        {"pattern": r"file|path|page|template|include|dir|doc", "weight": 4, "reason": "文件包含参数"},
+        {"pattern": r"cmd|exec|command|ping|host|ip", "weight": 5, "reason": "命令执行参数"},
+        {"pattern": r"q|query|search|keyword|s|name", "weight": 2, "reason": "查询参数"},
+    ],
+    "status": [
+        {"pattern": "401", "weight": 2, "reason": "需要认证"},
+        {"pattern": "403", "weight": 2, "reason": "访问受限"},
+        {"pattern": "500", "weight": 3, "reason": "服务端错误"},
+    ],
+    "tech": [
+        {"pattern": "php", "weight": 1, "reason": "PHP 技术栈"},
+        {"pattern": "wordpress", "weight": 2, "reason": "WordPress"},
+        {"pattern": "tomcat", "weight": 2, "reason": "Tomcat"},
+        {"pattern": "spring", "weight": 2, "reason": "Spring"},
+        {"pattern": "weblogic", "weight": 3, "reason": "WebLogic"},
+        {"pattern": "thinkphp", "weight": 3, "reason": "ThinkPHP"},
+    ],
+}
+
+
+class RuleSet:
+    """
+    编译后的规则集：同类规则合并为一个正则，每条规则是一个可选的前瞻命名分组，
+    单次扫描即可得到全部命中，同一位置同时命中多条规则（如 /admin/login）时全部计入；
+    开头的整体前瞻让不命中任何规则的位置快速失败
+    """
+
+    def __init__(self, rules: Dict[str, List[Dict[str, Any]]]):
+        self.rules = {kind: list(rules.get(kind, [])) for kind in ("path", "param", "status", "tech")}
+        self.path_matcher = self._compile(self.rules["path"])
+        self.param_matcher = self._compile(self.rules["param"], anchored=True)
+        self.status_rules = {str(r["pattern"]): r for r in self.rules["status"]}
+        self.tech_rules = [(r["pattern"].lower(), r) for r in self.rules["tech"]]
+
+    @staticmethod
+    def _compile(rules: List[Dict[str, Any]], anchored: bool = False) -> Optional[re.Pattern]:
+        if not rules:
+            return None
+        # anchored：参数名整名匹配，只在开头尝试一次
+        patterns = [f"(?:{r['pattern']})\\Z" if anchored else r["pattern"] for r in rules]
+        guard = "(?=" + "|".join(f"(?:{p})" for p in patterns) + ")"
+        groups = "".join(f"(?:(?=(?P<r{i}>{p}))|)" for i, p in enumerate(patterns))
+        return re.compile(guard + groups, re.I)
+
+    def _hits(self, kind: str, matches: Iterable[re.Match]) -> Iterator[Dict[str, Any]]:
+        seen = set()
+        for m in matches:
+            for name, value in m.groupdict().items():
+                if value is not None and name not in seen:
+                    seen.add(name)
+                    yield self.rules[kind][int(name[1:])]
+
+    def match_path(self, path: str) -> Iterator[Dict[str, Any]]:
+        if self.path_matcher is not None:
+            yield from self._hits("path", self.path_matcher.finditer(path))
+
+    def match_param(self, name: str) -> Iterator[Dict[str, Any]]:
+        if self.param_matcher is not None:
+            m = self.param_matcher.match(name)
+            if m:
+                yield from self._hits("param", (m,))
+
+
+@lru_cache(maxsize=4)
+def _load_rules(path: str, mtime: float) -> RuleSet:
+    """按 (路径, 修改时间) 缓存编译结果，规则文件只在变更后重新加载"""
+    if mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            return RuleSet(json.load(f))
+    return RuleSet(DEFAULT_RULES)
+
+
+def load_rules(path: Path = CANDIDATE_RULES_PATH) -> RuleSet:
+    mtime = os.path.getmtime(path) if path.exists() else 0.0
+    return _load_rules(str(path), mtime)
 
 
 class CandidateRunner(BaseRunner):
-    """Stage 4: 精准候选点筛选器"""
+    """Stage 4: 精准候选点筛选器（多信号打分，堆取 Top-K）"""
 
-    def filter_candidates(self):
+    def filter_candidates(self, top_k: int = CANDIDATE_TOP_K):
         self.update_status({"stage": "Stage4_Candidate", "hint": "锁定高价值攻击路径", "percent": 80})
 
         endpoint_path = self.base_dir / "endpoints.json"
@@ -14,34 +121,92 @@ class CandidateRunner(BaseRunner):
 
         with open(endpoint_path, "r", encoding="utf-8") as f:
             endpoints = json.load(f).get("endpoints", [])
+        self.write_log("stage4_candidate", f"开始筛选流程，输入端点数: {len(endpoints)}")
+
+        try:
+            rules = load_rules()
+        except (OSError, ValueError, re.error) as e:
+            self.write_log("stage4_candidate", f"规则文件加载失败，使用内置规则: {e}")
+            rules = _load_rules("", 0.0)
+        host_rules = self._load_host_rules(rules)
 
-        # 风险关键词
-        risk_patterns = [r"login", r"admin", r"config", r"api", r"php"]
+        # 堆中保留得分最高的 top_k 个（得分相同按端点顺序），内存占用与端点总数无关
+        scored = heapq.nlargest(top_k, self._score_all(endpoints, rules, host_rules))
         candidates = []
+        for rank, (score, _, url, method, reasons) in enumerate(scored):
+            # 录入规则：命中规则，或作为保底
+            if score <= 0 and rank >= CANDIDATE_MIN_COUNT:
+                break
+            candidates.append({
+                "url": url,
+                "reason": "; ".join(reasons) if reasons else "Base target",
+                "method": method,
+                "score": score,
+            })
+
+        result = {"task_id": self.task_id, "total_endpoints": len(endpoints), "candidates": candidates}
+        self.save_artifact("candidates.json", result)
+        self.update_status({"percent": 85, "hint": f"锁定 {len(candidates)} 个高价值候选点"})
+        return result
+
+    def _load_host_rules(self, rules: RuleSet) -> Dict[str, List[Dict[str, Any]]]:
+        """从指纹结果建立 host -> 命中的技术栈规则映射（技术栈名小写、去版本号后做子串匹配）"""
+        fp_path = self.base_dir / "http_fingerprints.json"
+        if not fp_path.exists():
+            return {}
+        with open(fp_path, "r", encoding="utf-8") as f:
+            fps = json.load(f).get("fingerprints", [])
+        host_rules: Dict[str, List[Dict[str, Any]]] = {}
+        for fp in fps:
+            if not fp.get("url"):
+                continue
+            matched = host_rules.setdefault(urlsplit(canonicalize_url(fp["url"])).netloc, [])
+            for tech in fp.get("tech") or []:
+                name = tech.split(":")[0].lower()
+                matched.extend(rule for pattern, rule in rules.tech_rules if pattern in name and rule not in matched)
+        return host_rules
+
+    def _score_all(self, endpoints: List[Dict[str, Any]], rules: RuleSet,
+                   host_rules: Dict[str, List[Dict[str, Any]]]) -> Iterator[Tuple[int, int, str, str, List[str]]]:
         seen = set()
+        for i, ep in enumerate(endpoints):
+            request = ep.get("request") or {}
+            url = request.get("url")
+            if not url: continue
+            method = request.get("method", "GET")
+            # endpoints.json 写入时已按 URL 模板去重（见 endpoint_index），此处只需排除完全相同的条目
+            key = (method, url)
+            if key in seen: continue
+            seen.add(key)
+            score, reasons = self._score(ep, url, rules, host_rules)
+            # 第二项为负序号：同分时靠前的端点优先
+            yield score, -i, url, method, reasons
 
-        for ep in endpoints:
-            url = ep.get("request", {}).get("url")
-            if not url or url in seen: continue
-
-            # 检查是否匹配风险模式
-            reason = "Base target"
-            is_match = False
-            for p in risk_patterns:
-                if re.search(p, url, re.I):
-                    reason = f"Matched risk pattern: {p}"
-                    is_match = True
-                    break
-
-            # 录入规则：匹配风险模式或作为保底
-            if is_match or len(candidates) < 3:
-                candidates.append({
-                    "url": url,
-                    "reason": reason,
-                    "method": ep.get("request", {}).get("method", "GET")
-                })
-                seen.add(url)
-
-        self.save_artifact("candidates.json", {"task_id": self.task_id, "candidates": candidates})
-        self.write_log("stage4_candidate", f"开始筛选流程，输入端点数: {len(endpoints)}")
-        self.update_status({"percent": 85, "hint": f"锁定 {len(candidates)} 个高价值候选点"})
\ No newline at end of file
+    @staticmethod
+    def _score(ep: Dict[str, Any], url: str, rules: RuleSet,
+               host_rules: Dict[str, List[Dict[str, Any]]]) -> Tuple[int, List[str]]:
+        # endpoints.json 中的 URL 已规范化，直接按分隔符切分，比 urlsplit 快得多
+        netloc, _, rest = url.partition("://")[2].partition("/")
+        path, _, query = rest.partition("?")
+        hits: Dict[int, Dict[str, Any]] = {}
+
+        # 1. 路径关键词
+        for rule in rules.match_path("/" + path):
+            hits[id(rule)] = rule
+        # 2. 参数名
+        for name in _PARAM_NAME.findall(query):
+            for rule in rules.match_param(name):
+                hits[id(rule)] = rule
+        # 3. 响应状态码（katana: response.status_code；目录扫描: status）
+        status = (ep.get("response") or {}).get("status_code") or ep.get("status")
+        if status is not None and str(status) in rules.status_rules:
+            rule = rules.status_rules[str(status)]
+            hits[id(rule)] = rule
+        # 4. 指纹技术栈（按主机预先匹配）
+        for rule in host_rules.get(netloc, ()):
+            hits[id(rule)] = rule
+
+        # 同一规则多次命中只计一次
+        score = sum(int(r.get("weight", 1)) for r in hits.values())
+        reasons = [r.get("reason") or r["pattern"] for r in hits.values()]
+        return score, reasons
@@ -1,13 +1,86 @@
+import hashlib
 import json
+import math
 import os
-from urllib.parse import urljoin
+import re
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from urllib.parse import urljoin, urlparse
 from .base import BaseRunner
+from .endpoint_index import EndpointIndex
+from .ratelimit import TOOL_RATE_FLAGS, split_rps
+from .status_store import atomic_write_json
+
+# 最大爬取深度：按层推进，每层对上一层新发现的 URL 执行一次 katana -d 1
+CRAWL_MAX_DEPTH = 3
+# 每个 katana 进程处理的 URL 数
+CRAWL_BATCH_SIZE = 200
+# 同时爬取的主机数（同一主机的批次串行执行，避免对单个目标并发过高）
+CRAWL_WORKERS = 4
+# 不再向下爬取的静态资源后缀（仍记录为端点）
+CRAWL_SKIP_EXTENSIONS = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".bmp",
+    ".css", ".woff", ".woff2", ".ttf", ".eot", ".otf",
+    ".mp3", ".mp4", ".avi", ".webm", ".pdf", ".zip", ".gz", ".tar", ".rar",
+)
+
+
+class SortedHashSet:
+    """
+    URL 去重集合：落盘为排序后的 64 位哈希数组（每条 8 字节），查询用二分；
+    新增哈希先放入内存集合，persist 时归并写回
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._sorted = array("Q")
+        self._pending = set()
+        if path.exists():
+            with open(path, "rb") as f:
+                self._sorted.frombytes(f.read())
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    def __contains__(self, value: int) -> bool:
+        if value in self._pending:
+            return True
+        i = bisect_left(self._sorted, value)
+        return i < len(self._sorted) and self._sorted[i] == value
+
+    def add(self, value: int) -> bool:
+        """新增返回 True，已存在返回 False"""
+        if value in self:
+            return False
+        self._pending.add(value)
+        return True
+
+    def persist(self):
+        if self._pending:
+            merged = array("Q", sorted(self._pending))
+            if self._sorted:
+                merged = array("Q", sorted(self._sorted + merged))
+            self._sorted = merged
+            self._pending = set()
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            self._sorted.tofile(f)
+        os.replace(tmp_path, self.path)
 
 
 class CrawlerRunner(BaseRunner):
-    """Stage 3: 强化爬虫执行器"""
+    """
+    Stage 3: 强化爬虫执行器。
+    逐层推进的增量爬取：待爬 URL（frontier）与已见集合持久化在 runs/{task_id}/crawl/ 下，
+    各主机的批次由并行 katana 进程执行，端点边爬边追加到 endpoints.jsonl，超时后可续爬
+    """
 
-    def run_crawl(self):
+    def run_crawl(self, fresh: bool = False):
         self.update_status({"stage": "Stage3_Surface", "hint": "执行深度端点发现", "percent": 65})
 
         fp_path = self.base_dir / "http_fingerprints.json"
@@ -16,38 +89,189 @@ class CrawlerRunner(BaseRunner):
         with open(fp_path, "r", encoding="utf-8") as f:
             fps = json.load(f).get("fingerprints", [])
 
-        urls = [fp.get("url") for fp in fps if fp.get("url")]
+        urls = list(dict.fromkeys(fp.get("url") for fp in fps if fp.get("url")))
         if not urls: return self._save_empty()
 
-        # 执行外部工具
+        self.crawl_dir = self.base_dir / "crawl"
+        state = self._load_state(urls, fresh)
+        self._lock = threading.Lock()
+        self._seen = SortedHashSet(self.crawl_dir / "seen.bin")
+        self._scope = {urlparse(u).netloc for u in urls}
+        self._endpoint_count = state.get("endpoints", 0)
+        self._seed_count = len(urls)
+
+        if state["depth"] == 0 and not state["done"]:
+            # 种子 URL 本身即为端点
+            for url in urls:
+                self._record({"request": {"url": url, "method": "GET"}, "source": "seed"}, 0)
+            self._seen.persist()
+            self._save_state(state)
+
+        deadline = time.monotonic() + self._get_budget_timeout()
+        timed_out = False
+        while not state["completed"]:
+            depth = state["depth"]
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            if not self._crawl_depth(state, depth, deadline):
+                timed_out = True
+                break
+            next_frontier = self.crawl_dir / f"frontier_{depth + 1}.txt"
+            if depth + 1 >= CRAWL_MAX_DEPTH or not next_frontier.exists():
+                state["completed"] = True
+            else:
+                state["depth"] = depth + 1
+                state["done"] = []
+            self._save_state(state)
+
+        return self._finish(fps, state, timed_out)
+
+    def _load_state(self, urls: List[str], fresh: bool) -> Dict[str, Any]:
+        """种子不变且未要求重新开始时从上次的进度续爬"""
+        digest = hashlib.sha1("\n".join(sorted(urls)).encode("utf-8")).hexdigest()
+        state_path = self.crawl_dir / "state.json"
+        if not fresh and state_path.exists():
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if state.get("seeds") == digest:
+                    self.write_log("stage3_crawler", f"从第 {state['depth']} 层续爬，已完成 {len(state['done'])} 个批次",
+                                   depth=state["depth"], done=len(state["done"]))
+                    return state
+            except (OSError, ValueError, KeyError):
+                pass
+        if self.crawl_dir.exists():
+            shutil.rmtree(self.crawl_dir, ignore_errors=True)
+        self.crawl_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.crawl_dir / "frontier_0.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(urls) + "\n")
+        return {"seeds": digest, "depth": 0, "done": [], "completed": False, "endpoints": 0}
+
+    def _save_state(self, state: Dict[str, Any]):
+        state["endpoints"] = self._endpoint_count
+        atomic_write_json(self.crawl_dir / "state.json", state)
+
+    def _crawl_depth(self, state: Dict[str, Any], depth: int, deadline: float) -> bool:
+        """执行一层爬取，全部批次完成返回 True"""
+        batches = self._write_batches(depth)
+        pending: Dict[str, List[tuple]] = {}
+        for batch_id, host, path in batches:
+            if batch_id not in state["done"]:
+                pending.setdefault(host, []).append((batch_id, path))
+        if not pending:
+            return True
+
+        self.write_log("stage3_crawler", f"第 {depth} 层: {len(batches)} 个批次，待执行 {sum(map(len, pending.values()))} 个，"
+                                         f"涉及 {len(pending)} 个主机",
+                       depth=depth, batches=len(batches), hosts=len(pending))
         binary = "./katana.exe" if os.path.exists("./katana.exe") else "katana"
-        cmd = [binary, "-u", ",".join(urls), "-d", "3", "-fl", "-jc", "-jsonl", "-silent"]
-        output = self.run_tool(cmd, "stage3_crawler")
+        # 任务预算在并发的 katana 进程间均分，单个进程另受目标主机速率上限约束
+        workers, share = min(CRAWL_WORKERS, len(pending)), None
+        rps = self.rate_limit_rps()
+        if rps is not None:
+            workers, share = split_rps(rps, workers)
+        complete = True
+        for _, host_complete in self.map_shards(
+                lambda host: self._crawl_host(binary, host, pending[host], state, depth, deadline, share),
+                list(pending), workers, "katana", deadline=deadline, skipped=False):
+            complete = host_complete and complete
+        return complete
 
-        endpoints = []
-        if output:
-            for line in output.strip().split('\n'):
-                try:
-                    endpoints.append(json.loads(line))
-                except:
-                    continue
+    def _write_batches(self, depth: int) -> List[tuple]:
+        """按主机分组切分当前层的 frontier；同一 frontier 每次切分结果一致，批次号可用于续爬"""
+        frontier = self.crawl_dir / f"frontier_{depth}.txt"
+        by_host: Dict[str, List[str]] = {}
+        with open(frontier, "r", encoding="utf-8") as f:
+            for line in f:
+                url = line.strip()
+                if url:
+                    by_host.setdefault(urlparse(url).netloc, []).append(url)
 
+        batch_dir = self.crawl_dir / "batches"
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        batches = []
+        for host in sorted(by_host):
+            host_urls = list(dict.fromkeys(by_host[host]))
+            slug = re.sub(r"[^\w.-]", "_", host)
+            for i in range(0, len(host_urls), CRAWL_BATCH_SIZE):
+                batch_id = f"{depth}:{host}:{i // CRAWL_BATCH_SIZE}"
+                path = batch_dir / f"d{depth}_{slug}_{i // CRAWL_BATCH_SIZE:04d}.txt"
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(host_urls[i:i + CRAWL_BATCH_SIZE]) + "\n")
+                batches.append((batch_id, host, str(path)))
+        return batches
+
+    def _crawl_host(self, binary: str, host: str, host_batches: List[tuple], state: Dict[str, Any],
+                    depth: int, deadline: float, share: Optional[float]) -> bool:
+        rate_flags = TOOL_RATE_FLAGS["katana"](min(share, self.rate_limit_rps(host))) if share else []
+        for batch_id, path in host_batches:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # 向上取整：被超时终止时一定已过截止时间，下方据此判断批次是否完整
+            timeout = math.ceil(remaining)
+            cmd = [binary, "-list", path, "-d", "1", "-fl", "-jc", "-jsonl", "-silent", *rate_flags]
+            for ep in self.iter_jsonl(self.stream_tool(cmd, "stage3_crawler", timeout)):
+                self._record(ep, depth + 1)
+            if time.monotonic() >= deadline:
+                # 超时被终止的批次不标记完成，续爬时重新执行
+                return False
+            with self._lock:
+                state["done"].append(batch_id)
+                self._seen.persist()
+                self._save_state(state)
+            self.update_status({"hint": f"第 {depth} 层爬取中，已发现 {self._endpoint_count} 个端点"})
+        return True
+
+    def _record(self, ep: Dict[str, Any], depth: int):
+        """新端点追加到 endpoints.jsonl 并上报；可继续爬取的同域页面进入下一层 frontier"""
+        url = (ep.get("request") or {}).get("url")
+        if not url:
+            return
+        with self._lock:
+            # 按 URL 模板去重：仅参数值不同的页面只记录、爬取一次
+            if not self._seen.add(EndpointIndex.key(url, ep["request"].get("method", "GET"))):
+                return
+            self._endpoint_count += 1
+            with open(self.crawl_dir / "endpoints.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(ep, ensure_ascii=False) + "\n")
+            parsed = urlparse(url)
+            if (0 < depth < CRAWL_MAX_DEPTH and parsed.netloc in self._scope
+                    and not parsed.path.lower().endswith(CRAWL_SKIP_EXTENSIONS)):
+                with open(self.crawl_dir / f"frontier_{depth}.txt", "a", encoding="utf-8") as f:
+                    f.write(url + "\n")
+        self.emit_finding(ep)
+
+    def _finish(self, fps: List[Dict[str, Any]], state: Dict[str, Any], timed_out: bool):
         # 核心修复：注入指纹中的重定向目标作为端点
-        if not endpoints:
+        if state["completed"] and self._endpoint_count <= self._seed_count:
             self.write_log("stage3_crawler", "爬虫未发现路径，正在从指纹库提取重定向目标")
             for fp in fps:
-                # 添加基础 URL
-                endpoints.append({"request": {"url": fp.get("url"), "method": "GET"}})
                 # 显式提取并合并 Location
-                if fp.get("location"):
+                if fp.get("url") and fp.get("location"):
                     redirect_url = urljoin(fp.get("url"), fp.get("location"))
-                    endpoints.append({"request": {"url": redirect_url, "method": "GET"}})
+                    self._record({"request": {"url": redirect_url, "method": "GET"}}, 0)
+        self._seen.persist()
+        self._save_state(state)
 
-        result = {"task_id": self.task_id, "endpoints": endpoints}
-        self.save_artifact("endpoints.json", result)
-        self.update_status({"percent": 75, "hint": f"发现 {len(endpoints)} 个端点"})
+        # 合并进 endpoints.json（与其他工具产出的端点共用模板去重，续爬重复追加的条目也在此去重）
+        result = self.merge_endpoints(self._iter_endpoints(), crawler="katana", depth=state["depth"],
+                                      timebox=timed_out, partial=not state["completed"])
+        hint = f"发现 {len(result['endpoints'])} 个端点" + ("（已超时，可再次调用续爬）" if timed_out else "")
+        self.update_status({"percent": 75, "hint": hint})
         return result
 
+    def _iter_endpoints(self):
+        path = self.crawl_dir / "endpoints.jsonl"
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # 进程中断留下的残缺行
+
     def _save_empty(self):
-        self.save_artifact("endpoints.json", {"task_id": self.task_id, "endpoints": []})
-        return {"endpoints": []}
\ No newline at end of file
+        return self.merge_endpoints([])
@@ -1,34 +1,218 @@
 # api/v1/Penetration/runner/dirscan.py
+import asyncio
 import json
 import os
-from typing import List, Dict, Any
+import secrets
+import statistics
+import time
+from collections import Counter
+from contextlib import aclosing, closing
+from typing import List, Dict, Any, Optional, Tuple
+
+import httpx
+
 from .base import BaseRunner
+from .validator import PROBE_ERRORS
+from .wordlists import DIRSCAN_WORDLISTS, detect_stacks, get_wordlists
+
+# ffuf 视为命中的状态码
+DIRSCAN_MATCH_CODES = (200, 301, 302, 403)
+# 校准阶段请求的随机路径数（另按扩展名追加随机文件名）
+DIRSCAN_CALIBRATION_PROBES = 6
+DIRSCAN_CALIBRATION_TIMEOUT = 10.0
+# 软 404 聚类最多按几个不同取值过滤（-fs/-fw/-fl 逗号列表），超过视为内容随路径变化
+DIRSCAN_MAX_FILTER_VALUES = 3
+# 线程数：默认值、下限；校准中位延迟超过 DIRSCAN_SLOW_LATENCY_MS 时按比例降低，
+# 错误率超过 DIRSCAN_MAX_ERROR_RATE 时降到下限
+DIRSCAN_THREADS = 50
+DIRSCAN_MIN_THREADS = 5
+DIRSCAN_SLOW_LATENCY_MS = 800
+DIRSCAN_MAX_ERROR_RATE = 0.2
+# 扫描中命中数超过 DIRSCAN_WILDCARD_HITS 且最大的 (状态码, 长度) 聚类占比超过 DIRSCAN_WILDCARD_RATIO 时，
+# 判定为校准未覆盖的通配目标并提前终止
+DIRSCAN_WILDCARD_HITS = 500
+DIRSCAN_WILDCARD_RATIO = 0.9
+# 结果中同一 (状态码, 长度) 聚类超过该数量的条目视为软 404 丢弃
+DIRSCAN_CLUSTER_LIMIT = 50
+
+
+class _HitTracker:
+    """收集 ffuf -json 流式输出的命中，并按 (状态码, 长度) 聚类判断是否为通配目标"""
+
+    def __init__(self):
+        self.hits: List[Dict[str, Any]] = []
+        self.clusters: Counter = Counter()
+        self.aborted = False
+
+    def add(self, line: str) -> bool:
+        """记录一行输出，返回 True 表示应提前终止扫描"""
+        try:
+            res = json.loads(line)
+        except ValueError:
+            return False
+        if not isinstance(res, dict) or "url" not in res:
+            return False
+        self.hits.append(res)
+        self.clusters[(res.get("status"), res.get("length"))] += 1
+        if len(self.hits) >= DIRSCAN_WILDCARD_HITS:
+            largest = self.clusters.most_common(1)[0][1]
+            if largest >= len(self.hits) * DIRSCAN_WILDCARD_RATIO:
+                self.aborted = True
+                return True
+        return False
+
+    def findings(self) -> Tuple[List[dict], int]:
+        """返回 (去除软 404 聚类后的发现, 丢弃条数)"""
+        noisy = {key for key, count in self.clusters.items() if count > DIRSCAN_CLUSTER_LIMIT}
+        findings = [
+            {"url": res.get("url"), "status": res.get("status"), "length": res.get("length"), "title": ""}
+            for res in self.hits if (res.get("status"), res.get("length")) not in noisy
+        ]
+        return findings, len(self.hits) - len(findings)
 
 
 class DirScanRunner(BaseRunner):
-    """独立 FFUF 目录扫描工具执行器 (集成 SecLists)"""
+    """
+    独立 FFUF 目录扫描工具执行器 (集成 SecLists)。
+    扫描前先请求若干随机路径校准：按软 404 响应的大小 / 词数 / 行数聚类生成过滤参数，
+    按延迟与错误率调整线程数，目标对任意路径都返回动态内容时直接判定为通配目标
+    """
 
     def run_scan(self, target_url: str, extensions: str, wordlist_type: str) -> List[dict]:
         if not target_url:
             return []
 
-        self.write_log("tool_dirscan", f"接收到目录爆破请求，目标: {target_url}，字典规模: {wordlist_type}")
+        calibration = asyncio.run(self._calibrate(target_url, extensions))
+        prepared = self._prepare_scan(target_url, extensions, wordlist_type, calibration)
+        if prepared is None:
+            return []
 
-        # 1. 字典路径映射 (基于项目根目录下的 SecLists)
-        wordlist_map = {
-            "small": "SecLists/Discovery/Web-Content/raft-small-directories.txt",
-            "medium": "SecLists/Discovery/Web-Content/raft-medium-directories.txt",
-            "large": "SecLists/Discovery/Web-Content/raft-large-directories.txt",
-            "api": "SecLists/Discovery/Web-Content/api/api-endpoints.txt"
-        }
+        tracker = _HitTracker()
+        # 提前结束迭代时显式关闭生成器，立即终止 ffuf 子进程，而不是等到生成器被垃圾回收
+        with closing(self.stream_tool(prepared, "tool_dirscan")) as lines:
+            for name, line in lines:
+                if name == "stdout" and tracker.add(line):
+                    break
+        return self._collect_findings(tracker, calibration)
 
-        rel_path = wordlist_map.get(wordlist_type.lower(), wordlist_map["small"])
-        wordlist_path = os.path.abspath(os.path.join(os.getcwd(), rel_path))
+    async def arun_scan(self, target_url: str, extensions: str, wordlist_type: str) -> List[dict]:
+        """run_scan 的异步版本"""
+        if not target_url:
+            return []
 
-        if not os.path.exists(wordlist_path):
-            self.write_log("tool_dirscan", f"字典文件缺失: {wordlist_path}。请确认已在项目根目录拉取 SecLists。")
+        calibration = await self._calibrate(target_url, extensions)
+        prepared = self._prepare_scan(target_url, extensions, wordlist_type, calibration)
+        if prepared is None:
             return []
 
+        tracker = _HitTracker()
+        # 提前结束迭代时需显式关闭异步生成器，才能立即终止 ffuf 子进程
+        async with aclosing(self.astream_tool(prepared, "tool_dirscan")) as lines:
+            async for name, line in lines:
+                if name == "stdout" and tracker.add(line):
+                    break
+        return self._collect_findings(tracker, calibration)
+
+    # ========================= 校准 ========================= #
+
+    async def _calibrate(self, target_url: str, extensions: str) -> Dict[str, Any]:
+        base = target_url.rstrip("/")
+        token = lambda: secrets.token_hex(8)
+        paths = [token() for _ in range(DIRSCAN_CALIBRATION_PROBES - 2)] + [f"{token()}/", f".{token()}"]
+        paths += [f"{token()}.{ext.strip()}" for ext in extensions.split(",")[:3] if ext.strip()]
+        self.write_log("tool_dirscan", f"开始校准，请求 {len(paths)} 个随机路径")
+
+        timeout = httpx.Timeout(DIRSCAN_CALIBRATION_TIMEOUT)
+        # 与 ffuf 一致：不跟随重定向，不校验证书
+        async with httpx.AsyncClient(timeout=timeout, verify=False, follow_redirects=False) as client:
+            probes = await asyncio.gather(*(self._probe(client, f"{base}/{path}") for path in paths))
+
+        answered = [p for p in probes if p is not None]
+        hits = [p for p in answered if p["status"] in DIRSCAN_MATCH_CODES]
+        error_rate = 1 - len(answered) / len(probes)
+        latency = statistics.median(p["elapsed_ms"] for p in answered) if answered else None
+
+        filters, dynamic = self._soft404_filters(hits)
+        result = {
+            "probes": probes,
+            "error_rate": round(error_rate, 2),
+            "median_latency_ms": latency,
+            "filters": filters,
+            "threads": self._threads(latency, error_rate),
+            "abort": None,
+        }
+        if not answered:
+            result["abort"] = "校准请求全部失败，目标不可达"
+        elif dynamic and len(hits) == len(answered):
+            # 任意随机路径都命中且响应内容随路径变化，过滤无法生效，扫描结果将全部为误报
+            result["abort"] = "目标对任意路径返回动态内容，判定为通配目标"
+        self.save_artifact("dirscan_calibration.json", {"task_id": self.task_id, "target": target_url, **result})
+        return result
+
+    async def _probe(self, client: httpx.AsyncClient, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            await self.athrottle(url)
+            started = time.monotonic()
+            response = await client.get(url)
+        except PROBE_ERRORS as e:
+            self.write_log("tool_dirscan", f"校准请求失败: {url} ({type(e).__name__})")
+            return None
+        body = response.content
+        # 与 ffuf 的统计口径一致：长度为响应体字节数，词数 / 行数按空格 / 换行切分
+        return {
+            "url": url,
+            "status": response.status_code,
+            "length": len(body),
+            "words": body.count(b" ") + 1,
+            "lines": body.count(b"\n") + 1,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+
+    @staticmethod
+    def _soft404_filters(hits: List[Dict[str, Any]]) -> Tuple[List[str], bool]:
+        """
+        按大小 / 词数 / 行数依次尝试聚类，取值种类不超过 DIRSCAN_MAX_FILTER_VALUES 的第一个维度生成过滤参数；
+        都无法聚类时交给 ffuf -ac 自动校准，并返回 dynamic=True
+        """
+        if not hits:
+            return [], False
+        for field, flag in (("length", "-fs"), ("words", "-fw"), ("lines", "-fl")):
+            values = sorted({h[field] for h in hits})
+            if len(values) <= DIRSCAN_MAX_FILTER_VALUES:
+                return [flag, ",".join(str(v) for v in values)], False
+        return ["-ac"], True
+
+    @staticmethod
+    def _threads(latency: Optional[float], error_rate: float) -> int:
+        if error_rate > DIRSCAN_MAX_ERROR_RATE:
+            return DIRSCAN_MIN_THREADS
+        if latency and latency > DIRSCAN_SLOW_LATENCY_MS:
+            return max(DIRSCAN_MIN_THREADS, int(DIRSCAN_THREADS * DIRSCAN_SLOW_LATENCY_MS / latency))
+        return DIRSCAN_THREADS
+
+    # ========================= 扫描 ========================= #
+
+    def _prepare_scan(self, target_url: str, extensions: str, wordlist_type: str,
+                      calibration: Dict[str, Any]) -> Optional[List[str]]:
+        self.write_log("tool_dirscan", f"接收到目录爆破请求，目标: {target_url}，字典规模: {wordlist_type}")
+
+        if calibration["abort"]:
+            self.write_log("tool_dirscan", f"终止扫描: {calibration['abort']}")
+            self.save_artifact("dirscan_findings.json", {"task_id": self.task_id, "findings": [],
+                                                         "aborted": calibration["abort"]})
+            return None
+
+        # 1. 字典路径映射 (基于项目根目录下的 SecLists)，使用去重并按目标技术栈过滤后的派生字典
+        rel_path = DIRSCAN_WORDLISTS.get(wordlist_type.lower(), DIRSCAN_WORDLISTS["small"])
+        stacks = detect_stacks(self.base_dir, target_url)
+        wordlist_path = get_wordlists().prepare([rel_path], stacks=stacks)
+
+        if wordlist_path is None:
+            self.write_log("tool_dirscan", f"字典文件缺失: {rel_path}。请确认已在项目根目录拉取 SecLists。")
+            return None
+        if stacks:
+            self.write_log("tool_dirscan", f"识别到技术栈 {', '.join(stacks)}，已剔除其他技术栈专属条目")
+
         # 2. 工具路径适配
         binary_path = os.path.abspath(os.path.join(os.getcwd(), "ffuf.exe"))
         binary = binary_path if os.path.exists(binary_path) else "ffuf"
@@ -37,39 +221,43 @@ class DirScanRunner(BaseRunner):
         fuzz_url = f"{target_url}/FUZZ"
         tmp_output = self.base_dir / "ffuf_raw.json"
 
-        # 3. 构造外部命令
+        # 3. 构造外部命令；-json 逐行输出命中，便于边扫描边判断是否为通配目标
         cmd = [
             binary,
             "-u", fuzz_url,
-            "-w", wordlist_path,
+            "-w", str(wordlist_path),
             "-e", f".{extensions.replace(',', ',.')}",
-            "-mc", "200,301,302,403",
-            "-t", "50",  # 增加线程数以应对大字典
+            "-mc", ",".join(str(code) for code in DIRSCAN_MATCH_CODES),
+            *calibration["filters"],
             "-o", str(tmp_output),
             "-of", "json",
-            "-s"
+            "-json", "-s"
         ]
+        # 线程数取校准结果与任务预算中的较小者
+        threads = calibration["threads"]
+        budget_flags = self.rate_limit_flags("ffuf", target_url)
+        if budget_flags:
+            threads = min(threads, int(budget_flags[budget_flags.index("-t") + 1]))
+            cmd.extend(budget_flags[:budget_flags.index("-t")])
+        cmd.extend(["-t", str(threads)])
 
+        self.write_log("tool_dirscan", f"校准完成: 过滤 {' '.join(calibration['filters']) or '无'}，"
+                                       f"中位延迟 {calibration['median_latency_ms']}ms，"
+                                       f"错误率 {calibration['error_rate']}，线程 {threads}")
         self.write_log("tool_dirscan", f"执行命令: {' '.join(cmd)}")
-        self.run_tool(cmd, "tool_dirscan")
-
-        # 4. 结果解析
-        findings = []
-        if tmp_output.exists():
-            try:
-                with open(tmp_output, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    results = data.get("results", [])
-                    for res in results:
-                        findings.append({
-                            "url": res.get("url"),
-                            "status": res.get("status"),
-                            "length": res.get("length"),
-                            "title": ""
-                        })
-            except Exception as e:
-                self.write_log("tool_dirscan", f"解析 FFUF 结果失败: {str(e)}")
-
-        self.save_artifact("dirscan_findings.json", {"task_id": self.task_id, "findings": findings})
+        return cmd
+
+    def _collect_findings(self, tracker: _HitTracker, calibration: Dict[str, Any]) -> List[dict]:
+        # 4. 结果解析：丢弃校准未能过滤的大聚类（软 404）
+        findings, dropped = tracker.findings()
+        result = {"task_id": self.task_id, "findings": findings, "filtered": dropped}
+        if tracker.aborted:
+            result["aborted"] = "命中数过多且集中于同一响应，判定为通配目标"
+            self.write_log("tool_dirscan", f"提前终止扫描: {result['aborted']}")
+        if dropped:
+            self.write_log("tool_dirscan", f"丢弃 {dropped} 条疑似软 404 结果")
+
+        self.save_artifact("dirscan_findings.json", result)
+        self.merge_endpoints(findings, source="dirscan")
         self.write_log("tool_dirscan", f"扫描完成，发现 {len(findings)} 个路径")
-        return findings
\ No newline at end of file
+        return findings
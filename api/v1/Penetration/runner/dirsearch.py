@@ -25,7 +25,8 @@ class DirsearchRunner(BaseRunner):
             "python", script_path,
             "-u", target_url,
             "--format=json",
-            "-o", str(tmp_output)
+            "-o", str(tmp_output),
+            *self.rate_limit_flags("dirsearch", target_url)
         ]
 
         self.run_tool(cmd, "tool_dirsearch")
@@ -0,0 +1,112 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any
+
+from .nmap import NmapRunner, NMAP_SHARD_HOSTS, NMAP_WORKERS, compress_ports
+from .ratelimit import PACKET_RATE_MULTIPLIER
+
+# 待识别的开放端口攒批条件：主机数达到 NMAP_SHARD_HOSTS，或最早一条等待超过该秒数
+PIPELINE_FLUSH_SECONDS = 5.0
+
+# masscan 默认 stdout 格式: Discovered open port 80/tcp on 10.0.0.1
+_MASSCAN_LINE = re.compile(r"Discovered open port (\d+)/(tcp|udp) on (\S+)")
+
+
+class DiscoveryPipelineRunner(NmapRunner):
+    """
+    两阶段资产发现：masscan / naabu 快速扫出开放端口，边扫边按批投递给 nmap -sV，
+    nmap 只对已确认开放的端口做服务识别，结果合并为一份 assets.json
+    """
+
+    def run_pipeline(self, target: str, ports: str = "1-65535", sweeper: str = "naabu",
+                     rate: int = 1000) -> Dict[str, Any]:
+        self.update_status({"stage": "Stage1_Asset", "hint": f"正在快速扫描目标: {target}", "percent": 15})
+        sweeper = sweeper if sweeper in ("masscan", "naabu") else "naabu"
+        deadline = time.monotonic() + self._get_budget_timeout()
+        base_cmd = self._base_cmd()
+
+        sweep_ports: Dict[str, Dict[int, str]] = {}
+        # 快速扫描器报告的请求主机名（IP -> 主机名列表），nmap 分片只拿到 IP，需另行带入 hostnames
+        sweep_names: Dict[str, List[str]] = {}
+        pending: Dict[str, set] = {}
+        pending_since = None
+        futures = []
+        merged: Dict[str, Dict[str, Any]] = {}
+
+        with ThreadPoolExecutor(max_workers=NMAP_WORKERS, thread_name_prefix="nmap-pipeline") as pool:
+            def _flush():
+                batch = list(pending.items())
+                pending.clear()
+                for i in range(0, len(batch), NMAP_SHARD_HOSTS):
+                    hosts = batch[i:i + NMAP_SHARD_HOSTS]
+                    port_spec = compress_ports(sorted(set().union(*(p for _, p in hosts))))
+                    shard = ([ip for ip, _ in hosts], port_spec)
+                    futures.append(self.submit_in_context(pool, self._run_shard, base_cmd, shard, deadline))
+
+            sweep_cmd = self._sweep_cmd(sweeper, target, ports, rate)
+            timeout = max(1, int(deadline - time.monotonic()))
+            for ip, port, protocol, name in self._iter_open_ports(sweeper, sweep_cmd, timeout):
+                if name and name != ip and name not in sweep_names.setdefault(ip, []):
+                    sweep_names[ip].append(name)
+                if port in sweep_ports.setdefault(ip, {}):
+                    continue
+                sweep_ports[ip][port] = protocol
+                if protocol != "tcp":
+                    continue  # UDP 端口不做 -sV 识别，保留快速扫描结果
+                pending.setdefault(ip, set()).add(port)
+                pending_since = pending_since or time.monotonic()
+                if len(pending) >= NMAP_SHARD_HOSTS or time.monotonic() - pending_since >= PIPELINE_FLUSH_SECONDS:
+                    _flush()
+                    pending_since = None
+            _flush()
+
+            open_count = sum(len(p) for p in sweep_ports.values())
+            self.write_log("stage1_asset", f"{sweeper} 发现 {len(sweep_ports)} 个主机 {open_count} 个开放端口，"
+                                           f"投递 {len(futures)} 个 nmap 批次",
+                           hosts=len(sweep_ports), open_ports=open_count, batches=len(futures))
+
+            skipped = 0
+            for done, future in enumerate(as_completed(futures), 1):
+                hosts = future.result()
+                skipped += hosts is None
+                self._merge(merged, hosts or [])
+                self._report_progress(done, len(futures))
+
+        # nmap 未返回（超时等）的开放端口以快速扫描结果兜底
+        self._merge(merged, [
+            {"ip": ip, "hostnames": sweep_names.get(ip, []),
+             "ports": [{"port": port, "protocol": protocol, "service": "unknown", "cpe": []}
+                       for port, protocol in found.items()]}
+            for ip, found in sweep_ports.items()
+        ])
+        return self._finish_scan(target, merged, len(futures), source=f"{sweeper}+nmap", skipped=skipped)
+
+    def _sweep_cmd(self, sweeper: str, target: str, ports: str, rate: int) -> List[str]:
+        targets = ",".join(t for t in re.split(r"[,\s]+", target or "") if t)
+        binary_path = os.path.abspath(os.path.join(os.getcwd(), f"{sweeper}.exe"))
+        binary = binary_path if os.path.exists(binary_path) else sweeper
+
+        if sweeper == "masscan":
+            # 任务设置了预算时，发包速率不超过预算折算值
+            rps = self.rate_limit_rps(targets)
+            if rps is not None:
+                rate = min(int(rate), max(1, int(rps * PACKET_RATE_MULTIPLIER)))
+            return [binary, targets, "-p", ports, "--rate", str(rate)]
+        return [binary, "-host", targets, "-p", ports, "-json", "-silent",
+                *self.rate_limit_flags("naabu", targets)]
+
+    def _iter_open_ports(self, sweeper: str, cmd: List[str], timeout: int):
+        """逐行解析快速扫描器的 stdout，产出 (ip, port, protocol, 请求主机名或 None)"""
+        lines = self.stream_tool(cmd, "stage1_asset", timeout)
+        if sweeper == "masscan":
+            for name, line in lines:
+                match = _MASSCAN_LINE.search(line)
+                if match:
+                    yield match.group(3), int(match.group(1)), match.group(2), None
+        else:
+            for data in self.iter_jsonl(lines):
+                ip = data.get("ip") or data.get("host")
+                if ip and data.get("port"):
+                    yield ip, int(data["port"]), data.get("protocol", "tcp"), data.get("host")
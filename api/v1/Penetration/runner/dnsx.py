@@ -1,47 +1,260 @@
+import hashlib
 import json
+import math
 import os
-from typing import List, Dict, Any
+import secrets
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 from .base import BaseRunner
 
+# 每个 dnsx 进程解析的域名数，以及同时运行的 dnsx 进程数
+DNSX_CHUNK_SIZE = 5000
+DNSX_WORKERS = 4
+# 单个进程的解析线程数（-t）；设置任务预算时按分到的速率下调
+DNSX_THREADS = 100
+# 自定义解析器列表（每行一个 IP[:端口]），请求未指定 resolvers 时使用
+DNSX_RESOLVERS_PATH = Path("config/resolvers.txt")
+
+# 跨任务共享的 DNS 缓存：正向结果按记录 TTL 过期（限制在 [DNSX_MIN_TTL, DNSX_MAX_TTL] 内），
+# 无记录的域名缓存 DNSX_NEGATIVE_TTL 秒
+DNSX_CACHE_PATH = Path("runs/_cache/dns/dns_cache.sqlite3")
+DNSX_DEFAULT_TTL = 3600
+DNSX_MIN_TTL = 60
+DNSX_MAX_TTL = 86400
+DNSX_NEGATIVE_TTL = 600
+
+# 泛解析检测：每个父域名解析的随机子域名数，以及最多检测的父域名数（按子域名数量优先）
+DNSX_WILDCARD_PROBES = 2
+DNSX_WILDCARD_MAX_PARENTS = 1000
+DNSX_WILDCARD_TTL = 3600
+
+
+class DnsCache:
+    """
+    基于 sqlite 的 DNS 结果缓存（WAL 模式，支持多进程读写）。
+    dns_records 表保存域名解析结果（record 为 NULL 表示无记录），dns_wildcards 表保存父域名的泛解析 IP 集合；
+    两表均按 scope（所用解析器集合的哈希）隔离，不同解析器（如内网 DNS 与公共 DNS）的结果互不复用
+    """
+
+    def __init__(self, scope: str, path: Path = DNSX_CACHE_PATH):
+        self.scope = scope
+        self.path = path
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS dns_records "
+                         "(scope TEXT, host TEXT, record TEXT, expires REAL, PRIMARY KEY (scope, host))")
+            conn.execute("CREATE TABLE IF NOT EXISTS dns_wildcards "
+                         "(scope TEXT, domain TEXT, ips TEXT, expires REAL, PRIMARY KEY (scope, domain))")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def _select(self, table: str, key: str, value: str, names: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        now = time.time()
+        with self._connect() as conn:
+            # 分批查询，避免超过 sqlite 的参数个数上限
+            for i in range(0, len(names), 500):
+                batch = names[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT {key}, {value} FROM {table} "
+                    f"WHERE scope = ? AND {key} IN ({','.join('?' * len(batch))}) AND expires > ?",
+                    (self.scope, *batch, now),
+                )
+                for name, data in rows:
+                    found[name] = json.loads(data) if data is not None else None
+        return found
+
+    def get_records(self, hosts: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        return self._select("dns_records", "host", "record", hosts)
+
+    def get_wildcards(self, domains: List[str]) -> Dict[str, List[str]]:
+        return self._select("dns_wildcards", "domain", "ips", domains)
+
+    def put_records(self, items: Iterable[Tuple[str, Optional[Dict[str, Any]], int]]):
+        now = time.time()
+        rows = [(self.scope, host, json.dumps(record) if record is not None else None, now + ttl)
+                for host, record, ttl in items]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO dns_records (scope, host, record, expires) VALUES (?, ?, ?, ?)",
+                             rows)
+
+    def put_wildcards(self, items: Dict[str, List[str]]):
+        expires = time.time() + DNSX_WILDCARD_TTL
+        rows = [(self.scope, domain, json.dumps(ips), expires) for domain, ips in items.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO dns_wildcards (scope, domain, ips, expires) VALUES (?, ?, ?, ?)",
+                             rows)
+
+
+def _parents(host: str) -> List[str]:
+    """host 的各级父域名（至少保留两级），如 a.b.example.com -> [b.example.com, example.com]"""
+    labels = host.split(".")
+    return [".".join(labels[i:]) for i in range(1, len(labels) - 1)]
+
 
 class DnsxRunner(BaseRunner):
-    """独立 Dnsx 多用途 DNS 工具执行器"""
+    """
+    独立 Dnsx 多用途 DNS 工具执行器：命中跨任务 DNS 缓存的域名不再解析，其余按批拆分后由多个 dnsx 进程并行解析；
+    对父域名解析随机子域名识别泛解析，丢弃解析结果落在泛解析 IP 集合内的记录
+    """
 
-    def run_scan(self, subdomains: List[str]) -> List[Dict[str, Any]]:
-        if not subdomains:
+    def run_scan(self, subdomains: List[str], resolvers: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        hosts = list(dict.fromkeys(
+            h.strip().lower().rstrip(".").lstrip("*.") for h in subdomains or [] if h and h.strip()
+        ))
+        if not hosts:
             return []
 
-        self.write_log("tool_dnsx", f"启动 Dnsx，目标数量: {len(subdomains)}")
+        self.write_log("tool_dnsx", f"启动 Dnsx，目标数量: {len(hosts)}")
+        resolver_file = self._resolver_file(resolvers)
+        cache = DnsCache(self._resolver_scope(resolver_file))
+        records = cache.get_records(hosts)
+        misses = [h for h in hosts if h not in records]
+
+        # 泛解析检测：优先检测子域名最多的父域名，已缓存的检测结果直接复用
+        parent_counts = Counter(p for h in hosts for p in _parents(h))
+        parents = [p for p, _ in parent_counts.most_common(DNSX_WILDCARD_MAX_PARENTS)]
+        wildcards = cache.get_wildcards(parents)
+        probes = {f"{secrets.token_hex(6)}.{p}": p for p in parents if p not in wildcards
+                  for _ in range(DNSX_WILDCARD_PROBES)}
+        self.write_log("tool_dnsx", f"缓存命中 {len(records)} 个，待解析 {len(misses)} 个，泛解析探测 {len(probes)} 个",
+                       cached=len(records), misses=len(misses), probes=len(probes))
+
+        resolved, completed = self._resolve(misses + list(probes), resolver_file)
+
+        # 探测结果：任一随机子域名有 A 记录即视为泛解析，记录其 IP 集合
+        probed: Dict[str, List[str]] = {p: [] for p in probes.values()}
+        undecided = set()
+        for probe, parent in probes.items():
+            if probe in resolved:
+                probed[parent] = sorted(set(probed[parent]) | set(resolved[probe].get("a_records") or []))
+            elif not completed.get(probe):
+                undecided.add(parent)
+        # 探测所在批次超时且未发现泛解析时无法下结论，不写入缓存
+        cache.put_wildcards({p: ips for p, ips in probed.items() if ips or p not in undecided})
+        wildcards.update(probed)
+
+        # 写缓存：有结果的按 TTL 缓存，所在批次正常结束但无结果的按无记录缓存
+        fresh = []
+        for host in misses:
+            if host in resolved:
+                ttl = resolved[host].pop("ttl", None) or DNSX_DEFAULT_TTL
+                fresh.append((host, resolved[host], min(max(int(ttl), DNSX_MIN_TTL), DNSX_MAX_TTL)))
+                records[host] = resolved[host]
+            elif completed.get(host):
+                fresh.append((host, None, DNSX_NEGATIVE_TTL))
+        if fresh:
+            cache.put_records(fresh)
+
+        findings, dropped = [], []
+        for host in hosts:
+            record = records.get(host)
+            if not record:
+                continue
+            if self._is_wildcard(host, record, wildcards):
+                dropped.append(host)
+                continue
+            findings.append({"host": host, **record})
+
+        wildcard_domains = sorted(p for p, ips in wildcards.items() if ips)
+        if wildcard_domains:
+            self.write_log("tool_dnsx", f"检测到泛解析域名 {len(wildcard_domains)} 个，丢弃 {len(dropped)} 条泛解析记录",
+                           wildcard_domains=len(wildcard_domains), dropped=len(dropped))
+        self.save_artifact("dnsx_findings.json", {
+            "task_id": self.task_id,
+            "total": len(hosts),
+            "cached": len(hosts) - len(misses),
+            "wildcard_domains": wildcard_domains,
+            "wildcard_dropped": len(dropped),
+            "wildcard_dropped_hosts": dropped,
+            "findings": findings,
+        })
+        return findings
+
+    @staticmethod
+    def _is_wildcard(host: str, record: Dict[str, Any], wildcards: Dict[str, List[str]]) -> bool:
+        ips = set(record.get("a_records") or [])
+        if not ips:
+            return False
+        return any(ips <= set(wildcards[p]) for p in _parents(host) if wildcards.get(p))
+
+    def _resolve(self, names: List[str], resolver_file: Optional[Path]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, bool]]:
+        """分批并行解析，返回 (域名 -> 解析结果, 域名 -> 所在批次是否在超时前正常结束)"""
+        if not names:
+            return {}, {}
 
         binary_path = os.path.abspath(os.path.join(os.getcwd(), "dnsx.exe"))
         binary = binary_path if os.path.exists(binary_path) else "dnsx"
 
-        # 生成输入文件
-        input_file = self.base_dir / "dnsx_input.txt"
-        with open(input_file, "w", encoding="utf-8") as f:
-            f.write("\n".join(subdomains))
-
-        tmp_output = self.base_dir / "dnsx_raw.jsonl"
-
-        # -l: 目标列表文件, -silent: 静默模式, -json: JSON输出, -a: 获取A记录
-        cmd = [binary, "-l", str(input_file), "-silent", "-json", "-a", "-o", str(tmp_output)]
-
-        self.run_tool(cmd, "tool_dnsx")
-
-        findings = []
-        if tmp_output.exists():
-            with open(tmp_output, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        findings.append({
-                            "host": data.get("host"),
-                            "a_records": data.get("a", []),
-                            "cname": data.get("cname", []),
-                            "status_code": data.get("status_code", "")
-                        })
-                    except Exception:
-                        continue
-
-        self.save_artifact("dnsx_findings.json", {"task_id": self.task_id, "findings": findings})
-        return findings
\ No newline at end of file
+        work_dir = self.base_dir / "dnsx"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        chunks = []
+        for i in range(0, len(names), DNSX_CHUNK_SIZE):
+            chunk_file = work_dir / f"chunk_{i // DNSX_CHUNK_SIZE:04d}.txt"
+            with open(chunk_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(names[i:i + DNSX_CHUNK_SIZE]) + "\n")
+            chunks.append((chunk_file, names[i:i + DNSX_CHUNK_SIZE]))
+
+        # -a/-cname: 查询记录类型, -t/-rl: 线程与速率（各进程平分任务预算）, -r: 解析器列表
+        workers, rate_flags = self.rate_limit_workers("dnsx", min(DNSX_WORKERS, len(chunks)))
+        base_cmd = [binary, "-silent", "-json", "-a", "-cname", *rate_flags]
+        if rate_flags:
+            base_cmd += ["-t", str(max(1, min(DNSX_THREADS, int(rate_flags[rate_flags.index("-rl") + 1]))))]
+        else:
+            base_cmd += ["-t", str(DNSX_THREADS)]
+        if resolver_file is not None:
+            base_cmd += ["-r", str(resolver_file)]
+
+        deadline = time.monotonic() + self._get_budget_timeout()
+        resolved: Dict[str, Dict[str, Any]] = {}
+        completed: Dict[str, bool] = {}
+        shards = self.map_shards(lambda chunk: self._run_chunk(base_cmd, chunk[0], deadline), chunks, workers, "dnsx",
+                                 deadline=deadline, skipped=({}, False))
+        for done, ((_, batch), (chunk_resolved, finished)) in enumerate(shards, 1):
+            resolved.update(chunk_resolved)
+            completed.update(dict.fromkeys(batch, finished))
+            self.update_status({"hint": f"DNS 解析进度 {done}/{len(chunks)}，已解析 {len(resolved)} 个"})
+        return resolved, completed
+
+    def _run_chunk(self, base_cmd: List[str], chunk_file: Path, deadline: float) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+        timeout = math.ceil(deadline - time.monotonic())
+        if timeout <= 0:
+            return {}, False
+        resolved: Dict[str, Dict[str, Any]] = {}
+        for data in self.iter_jsonl(self.stream_tool([*base_cmd, "-l", str(chunk_file)], "tool_dnsx", timeout)):
+            host = (data.get("host") or "").lower().rstrip(".")
+            if not host:
+                continue
+            resolved[host] = {
+                "a_records": data.get("a", []),
+                "cname": data.get("cname", []),
+                "status_code": data.get("status_code", ""),
+                "ttl": data.get("ttl"),
+            }
+        # 整批没有任何应答多为解析器不可用（限速 / 不可达）而非域名都不存在，不视为正常结束，避免写入无记录缓存
+        return resolved, bool(resolved) and time.monotonic() < deadline
+
+    def _resolver_file(self, resolvers: Optional[List[str]]) -> Optional[Path]:
+        if not resolvers:
+            return DNSX_RESOLVERS_PATH.resolve() if DNSX_RESOLVERS_PATH.exists() else None
+        path = self.base_dir / "dnsx" / "resolvers.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(r.strip() for r in resolvers if r.strip()) + "\n")
+        return path
+
+    @staticmethod
+    def _resolver_scope(resolver_file: Optional[Path]) -> str:
+        """缓存隔离键：解析器集合（去重排序后）的哈希；未指定解析器时使用 dnsx 默认解析器"""
+        if resolver_file is None:
+            return "default"
+        with open(resolver_file, "r", encoding="utf-8", errors="ignore") as f:
+            servers = sorted({line.strip() for line in f if line.strip() and not line.startswith("#")})
+        return hashlib.sha256("\n".join(servers).encode("utf-8")).hexdigest()[:16]
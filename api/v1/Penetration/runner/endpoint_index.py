@@ -0,0 +1,170 @@
+import hashlib
+import json
+import posixpath
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .status_store import atomic_write_json, file_lock
+
+# 各协议默认端口，规范化时省略
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_INT = re.compile(r"^-?\d+$")
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+# 长度 >= 16 的十六进制串（哈希、会话 ID、MongoDB ObjectId 等）
+_HEX = re.compile(r"^[0-9a-f]{16,}$", re.I)
+_PERCENT = re.compile(r"%([0-9a-fA-F]{2})")
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def url_hash(text: str) -> int:
+    """64 位 blake2b 哈希，用作 URL / 模板的紧凑去重键"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "replace"), digest_size=8).digest(), "big")
+
+
+def _normalize_percent(text: str) -> str:
+    """非保留字符解码，其余转义统一为大写十六进制"""
+    def _sub(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else "%" + match.group(1).upper()
+    return _PERCENT.sub(_sub, text)
+
+
+def _normalize_path(path: str) -> str:
+    path = _normalize_percent(re.sub(r"/{2,}", "/", path or "/"))
+    if not path.startswith("/"):
+        path = "/" + path
+    normalized = posixpath.normpath(path)
+    if path.endswith("/") and normalized != "/":
+        normalized += "/"
+    return normalized
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    URL 规范化：协议与主机名小写、省略默认端口、去除片段与用户信息、
+    路径合并重复斜杠并解析 ./..、查询参数按 (键, 值) 排序；无法解析时原样返回
+    """
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname.rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return urlunsplit((scheme, host, _normalize_path(parts.path), urlencode(query, safe="{}[]:,"), ""))
+
+
+def _value_type(value: str) -> Optional[str]:
+    if _INT.match(value):
+        return "{int}"
+    if _UUID.match(value):
+        return "{uuid}"
+    if _HEX.match(value):
+        return "{hex}"
+    return None
+
+
+def template_url(url: str) -> str:
+    """
+    把参数值变体折叠为模板：路径中的数字 / UUID / 长十六进制段替换为占位符，
+    查询参数只保留参数名与值类型，如 /item/42?id=7&q=abc -> /item/{int}?id={int}&q={str}
+    """
+    canonical = canonicalize_url(url)
+    parts = urlsplit(canonical)
+    if not parts.scheme:
+        return canonical
+    segments = [_value_type(s) or s for s in parts.path.split("/")]
+    params = {}
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        params.setdefault(key, (_value_type(value) or "{str}") if value else "")
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return urlunsplit((parts.scheme, parts.netloc, "/".join(segments), query, ""))
+
+
+class EndpointIndex:
+    """按 (方法, URL 模板) 去重的端点索引，集合中只存 64 位哈希，成员判断 O(1)"""
+
+    def __init__(self, endpoints: Iterable[Dict[str, Any]] = ()):
+        self._hashes = set()
+        for ep in endpoints:
+            request = ep.get("request") or {}
+            if request.get("url"):
+                self.add(request["url"], request.get("method", "GET"))
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    @staticmethod
+    def key(url: str, method: str = "GET") -> int:
+        return url_hash(f"{(method or 'GET').upper()} {template_url(url)}")
+
+    def __contains__(self, url: str) -> bool:
+        return self.key(url) in self._hashes
+
+    def add(self, url: str, method: str = "GET") -> bool:
+        """新模板返回 True，已有同模板端点返回 False"""
+        key = self.key(url, method)
+        if key in self._hashes:
+            return False
+        self._hashes.add(key)
+        return True
+
+
+def _as_endpoint(item: Union[str, Dict[str, Any]], source: Optional[str]) -> Optional[Dict[str, Any]]:
+    """统一为 endpoints.json 条目格式 {"request": {"url", "method"}, ...}，URL 写入规范化形式"""
+    if isinstance(item, str):
+        item = {"request": {"url": item}}
+    elif "request" not in item:
+        item = {"request": {"url": item.get("url"), "method": item.get("method", "GET")}}
+    request = dict(item.get("request") or {})
+    if not request.get("url"):
+        return None
+    request["url"] = canonicalize_url(request["url"])
+    request["method"] = (request.get("method") or "GET").upper()
+    endpoint = {**item, "request": request}
+    if source and "source" not in endpoint:
+        endpoint["source"] = source
+    return endpoint
+
+
+def merge_endpoints(base_dir: Path, task_id: str, items: Iterable[Union[str, Dict[str, Any]]],
+                    source: Optional[str] = None, **fields) -> Dict[str, Any]:
+    """
+    把各工具产出的 URL 合并进 runs/{task_id}/endpoints.json：同模板端点只保留首条，
+    文件锁保证并发工具的合并互不覆盖；fields 写入文件顶层（crawler / partial 等）
+    """
+    path = base_dir / "endpoints.json"
+    with file_lock(base_dir / ".endpoints.lock"):
+        data = {"task_id": task_id, "endpoints": []}
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                pass
+        endpoints = data.get("endpoints", [])
+        index = EndpointIndex(endpoints)
+        added = 0
+        for item in items:
+            endpoint = _as_endpoint(item, source)
+            if endpoint and index.add(endpoint["request"]["url"], endpoint["request"]["method"]):
+                endpoints.append(endpoint)
+                added += 1
+        data.update(fields)
+        data["task_id"] = task_id
+        data["endpoints"] = endpoints
+        atomic_write_json(path, data)
+    data["added"] = added
+    return data
@@ -0,0 +1,16 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# 尚无原生异步实现的工具在独立线程池中执行，
+# 与 Starlette 默认线程池（40）隔离，避免长耗时扫描饿死 /task/status 等轻量接口
+TOOL_EXECUTOR_WORKERS = 256
+
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix="tool-runner")
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在工具专用线程池中执行同步 Runner 方法并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tool_executor, functools.partial(func, *args, **kwargs))
@@ -2,6 +2,7 @@ import json
 import os
 from typing import List, Dict, Any
 from .base import BaseRunner
+from .wordlists import detect_stacks, get_wordlists
 
 
 class FeroxbusterRunner(BaseRunner):
@@ -15,7 +16,12 @@ class FeroxbusterRunner(BaseRunner):
 
         binary_path = os.path.abspath(os.path.join(os.getcwd(), "feroxbuster.exe"))
         binary = binary_path if os.path.exists(binary_path) else "feroxbuster"
-        wordlist_path = os.path.abspath(os.path.join(os.getcwd(), wordlist))
+        # 字典可为相对项目根目录的路径或 SecLists 中的文件名，使用去重并按目标技术栈过滤后的派生字典
+        wordlist_path = get_wordlists().prepare([wordlist], stacks=detect_stacks(self.base_dir, target_url), search=True,
+                                                log=lambda msg: self.write_log("tool_feroxbuster", msg))
+        if wordlist_path is None:
+            self.write_log("tool_feroxbuster", f"字典文件缺失: {wordlist}")
+            return []
 
         tmp_output = self.base_dir / "feroxbuster_raw.jsonl"
 
@@ -23,10 +29,11 @@ class FeroxbusterRunner(BaseRunner):
         cmd = [
             binary,
             "-u", target_url,
-            "-w", wordlist_path,
+            "-w", str(wordlist_path),
             "--json",
             "-o", str(tmp_output),
-            "--silent"
+            "--silent",
+            *self.rate_limit_flags("feroxbuster", target_url)
         ]
 
         self.run_tool(cmd, "tool_feroxbuster")
@@ -50,4 +57,5 @@ class FeroxbusterRunner(BaseRunner):
                         continue
 
         self.save_artifact("feroxbuster_findings.json", {"task_id": self.task_id, "findings": findings})
+        self.merge_endpoints(findings, source="feroxbuster")
         return findings
\ No newline at end of file
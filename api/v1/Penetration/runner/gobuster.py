@@ -2,6 +2,7 @@ import os
 import re
 from typing import List, Dict, Any
 from .base import BaseRunner
+from .wordlists import detect_stacks, get_wordlists
 
 
 class GobusterRunner(BaseRunner):
@@ -15,7 +16,12 @@ class GobusterRunner(BaseRunner):
 
         binary_path = os.path.abspath(os.path.join(os.getcwd(), "gobuster.exe"))
         binary = binary_path if os.path.exists(binary_path) else "gobuster"
-        wordlist_path = os.path.abspath(os.path.join(os.getcwd(), wordlist))
+        # 字典可为相对项目根目录的路径或 SecLists 中的文件名，使用去重并按目标技术栈过滤后的派生字典
+        wordlist_path = get_wordlists().prepare([wordlist], stacks=detect_stacks(self.base_dir, target_url), search=True,
+                                                log=lambda msg: self.write_log("tool_gobuster", msg))
+        if wordlist_path is None:
+            self.write_log("tool_gobuster", f"字典文件缺失: {wordlist}")
+            return []
 
         tmp_output = self.base_dir / "gobuster_raw.txt"
 
@@ -24,9 +30,10 @@ class GobusterRunner(BaseRunner):
         cmd = [
             binary, "dir",
             "-u", target_url,
-            "-w", wordlist_path,
+            "-w", str(wordlist_path),
             "-o", str(tmp_output),
-            "-q", "-z"
+            "-q", "-z",
+            *self.rate_limit_flags("gobuster", target_url)
         ]
 
         self.run_tool(cmd, "tool_gobuster")
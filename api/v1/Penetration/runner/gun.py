@@ -38,4 +38,5 @@ class GauRunner(BaseRunner):
                         continue
 
         self.save_artifact("gau_findings.json", {"task_id": self.task_id, "findings": findings})
+        self.merge_endpoints(findings, source="gau")
         return findings
\ No newline at end of file
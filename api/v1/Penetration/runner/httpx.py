@@ -1,11 +1,18 @@
 # api/v1/Penetration/runner/httpx.py
 import json
 import os
+import time
+from typing import List, Dict, Any
+from urllib.parse import urlparse
 from .base import BaseRunner
 
+# 每个 httpx 进程处理的目标数，以及同时运行的 httpx 进程数
+HTTPX_BATCH_SIZE = 500
+HTTPX_WORKERS = 4
+
 
 class HttpxRunner(BaseRunner):
-    """Stage 2: 调用外部 pd-httpx 工具进行指纹识别"""
+    """Stage 2: 调用外部 pd-httpx 工具进行指纹识别（目标写入 -l 列表文件分批并行执行）"""
 
     def run_fingerprint(self):
         self.update_status({"stage": "Stage2_Fingerprint", "hint": "正在调用外部工具进行指纹嗅探", "percent": 45})
@@ -16,28 +23,66 @@ class HttpxRunner(BaseRunner):
         with open(asset_path, "r", encoding="utf-8") as f:
             assets = json.load(f)
 
-        targets = [f"{h['ip']}:{p['port']}" for h in assets.get("hosts", []) for p in h.get("ports", [])]
+        targets = list(dict.fromkeys(
+            f"{h['ip']}:{p['port']}" for h in assets.get("hosts", []) for p in h.get("ports", [])
+            if p.get("protocol", "tcp") == "tcp"
+        ))
         if not targets: return {"fingerprints": []}
 
-        # 使用相对路径或绝对路径调用，规避 Python 库冲突
-        # 建议将 exe 放在项目根目录
-        binary = "./pd-httpx.exe" if os.path.exists("./pd-httpx.exe") else "httpx"
+        batches = self._write_batches(targets)
+        deadline = time.monotonic() + self._get_budget_timeout()
+        # 任务预算在并发批次间均分
+        workers, rate_flags = self.rate_limit_workers("httpx", min(HTTPX_WORKERS, len(batches)))
+        base_cmd = self._base_cmd() + rate_flags
+        self.write_log("stage2_httpx", f"{len(targets)} 个目标切分为 {len(batches)} 批，并发 {workers}",
+                       targets=len(targets), batches=len(batches))
 
-        target_str = ",".join(targets)
-        cmd = [binary, "-u", target_str, "-title", "-tech-detect", "-status-code", "-json", "-silent"]
-
-        self.write_log("stage2_httpx", f"执行工具命令: {' '.join(cmd)}")
-        output = self.run_tool(cmd, "stage2_httpx")
-
-        fingerprints = []
-        if output:
-            for line in output.strip().split('\n'):
-                try:
-                    fingerprints.append(json.loads(line))
-                except:
+        # 按 URL 去重，并建立 host -> URL 索引
+        fingerprints: List[Dict[str, Any]] = []
+        seen_urls = set()
+        hosts: Dict[str, List[str]] = {}
+        shards = self.map_shards(lambda batch: self._run_batch(base_cmd, batch, deadline), batches, workers,
+                                 "httpx-batch", deadline=deadline, skipped=[])
+        for done, (_, batch_fps) in enumerate(shards, 1):
+            for fp in batch_fps:
+                url = fp.get("url")
+                if not url or url in seen_urls:
                     continue
+                seen_urls.add(url)
+                fingerprints.append(fp)
+                host = fp.get("host") or urlparse(url).hostname or ""
+                hosts.setdefault(host, []).append(url)
+            self.update_status({"percent": 45 + int(10 * done / len(batches)),
+                                "hint": f"指纹识别进度 {done}/{len(batches)}，已发现 {len(fingerprints)} 个 Web 服务"})
 
-        result = {"task_id": self.task_id, "total_found": len(fingerprints), "fingerprints": fingerprints}
+        result = {"task_id": self.task_id, "total_found": len(fingerprints), "fingerprints": fingerprints, "hosts": hosts}
         self.save_artifact("http_fingerprints.json", result)
         self.update_status({"percent": 55, "hint": f"发现 {len(fingerprints)} 个 Web 指纹"})
-        return result
\ No newline at end of file
+        return result
+
+    def _write_batches(self, targets: List[str]) -> List[str]:
+        batch_dir = self.base_dir / "httpx"
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        batches = []
+        for i in range(0, len(targets), HTTPX_BATCH_SIZE):
+            path = batch_dir / f"targets_{i // HTTPX_BATCH_SIZE:04d}.txt"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(targets[i:i + HTTPX_BATCH_SIZE]) + "\n")
+            batches.append(str(path))
+        return batches
+
+    def _base_cmd(self) -> List[str]:
+        # 使用相对路径或绝对路径调用，规避 Python 库冲突
+        # 建议将 exe 放在项目根目录
+        binary = "./pd-httpx.exe" if os.path.exists("./pd-httpx.exe") else "httpx"
+        return [binary, "-title", "-tech-detect", "-status-code", "-json", "-silent"]
+
+    def _run_batch(self, base_cmd: List[str], batch: str, deadline: float) -> List[Dict[str, Any]]:
+        cmd = base_cmd + ["-l", batch]
+        timeout = max(1, int(deadline - time.monotonic()))
+        # 流式逐行解析 JSONL，避免缓存完整 stdout
+        fingerprints = []
+        for fp in self.iter_jsonl(self.stream_tool(cmd, "stage2_httpx", timeout)):
+            fingerprints.append(fp)
+            self.emit_finding(fp)
+        return fingerprints
@@ -1,66 +1,147 @@
+import json
 import os
 import re
-from typing import List, Dict, Any
+import shutil
+import time
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional
 from .base import BaseRunner
+from .ratelimit import TOOL_RATE_FLAGS, split_rps
+from .wordlists import get_wordlists
+
+# 爆破调度：同时运行的 hydra 进程数，以及同一主机上同时运行的服务数
+HYDRA_WORKERS = 8
+HYDRA_HOST_CONCURRENCY = 2
+# 字典文件（相对项目根目录）
+HYDRA_USER_DICT = "users.txt"
+HYDRA_PASS_DICT = "pass.txt"
+
+# nmap 服务名 -> hydra 模块名
+HYDRA_SERVICES: Dict[str, str] = {
+    "ssh": "ssh", "ftp": "ftp", "telnet": "telnet", "mysql": "mysql", "redis": "redis",
+    "ms-sql-s": "mssql", "postgresql": "postgres", "microsoft-ds": "smb", "netbios-ssn": "smb",
+    "ms-wbt-server": "rdp", "vnc": "vnc", "smtp": "smtp", "pop3": "pop3", "imap": "imap",
+    "mongodb": "mongodb", "oracle-tns": "oracle-listener", "ldap": "ldap2",
+}
+# 服务名未识别时按端口推断
+HYDRA_PORT_SERVICES: Dict[int, str] = {
+    21: "ftp", 22: "ssh", 23: "telnet", 445: "smb", 1433: "mssql", 3306: "mysql",
+    3389: "rdp", 5432: "postgres", 5900: "vnc", 6379: "redis", 27017: "mongodb",
+}
+# 各服务的并发任务数（-t）；带账户锁定策略的服务串行并按 -c 间隔尝试，避免锁定账户
+HYDRA_SERVICE_TASKS: Dict[str, int] = {"ssh": 4, "rdp": 1, "smb": 1, "ldap2": 1, "vnc": 1}
+HYDRA_DEFAULT_TASKS = 4
+HYDRA_LOCKOUT_SERVICES = ("smb", "rdp", "ldap2")
+# 带锁定策略的服务每次尝试之间的间隔（秒，对应 hydra -c）
+HYDRA_LOCKOUT_DELAY = 3
+
+_SUCCESS_PATTERN = re.compile(r'host:\s*([^\s]+)\s+login:\s*([^\s]+)\s+password:\s*([^\s]+)', re.IGNORECASE)
 
 
 class HydraRunner(BaseRunner):
     """独立 Hydra 弱口令爆破执行器 (可移植绿色版)"""
 
+    # 批量爆破时每个 hydra 进程分到的任务预算（次/秒）；单次爆破为 None，按完整预算计算
+    _rate_share: Optional[float] = None
+
     def run_bruteforce(self, target_ip: str, service: str, port: int) -> Dict[str, Any]:
         if not target_ip or not service:
             return {"is_cracked": False, "findings": []}
 
+        cmd = self._prepare_bruteforce(target_ip, service, port)
+        if cmd is None:
+            return {"is_cracked": False, "findings": []}
+
+        # 3. 核心执行逻辑
+        # 注意：subprocess 运行时，它会自动在 binary 所在的 hydra/ 目录里找到那些 .dll
+        output = self.run_tool(cmd, "tool_hydra")
+        return self._parse_result(service, port, output)
+
+    async def arun_bruteforce(self, target_ip: str, service: str, port: int) -> Dict[str, Any]:
+        """run_bruteforce 的异步版本"""
+        if not target_ip or not service:
+            return {"is_cracked": False, "findings": []}
+
+        cmd = self._prepare_bruteforce(target_ip, service, port)
+        if cmd is None:
+            return {"is_cracked": False, "findings": []}
+
+        output = await self.arun_tool(cmd, "tool_hydra")
+        return self._parse_result(service, port, output)
+
+    @staticmethod
+    def _resolve_binary() -> Optional[str]:
+        """依次查找项目根目录 hydra/ 下的可移植版（Windows hydra.exe / 其他平台 hydra）与 PATH 中的 hydra"""
+        hydra_dir = os.path.abspath(os.path.join(os.getcwd(), "hydra"))
+        for name in ("hydra.exe", "hydra"):
+            path = os.path.join(hydra_dir, name)
+            if os.path.isfile(path):
+                return path
+        return shutil.which("hydra")
+
+    def _prepare_bruteforce(self, target_ip: str, service: str, port: int):
         self.write_log("tool_hydra", f"接收到弱口令爆破请求，目标: {target_ip}:{port} ({service})")
 
         # 1. 动态定位可移植目录中的工具与字典
         # os.getcwd() 指向项目根目录 AutoPenetrationTools
-        hydra_dir = os.path.abspath(os.path.join(os.getcwd(), "hydra"))
-        binary = os.path.join(hydra_dir, "hydra.exe")
+        binary = self._resolve_binary()
 
-        user_dict = os.path.abspath(os.path.join(os.getcwd(), "users.txt"))
-        pass_dict = os.path.abspath(os.path.join(os.getcwd(), "pass.txt"))
+        # 去除重复条目后的派生字典（按内容哈希缓存，批量爆破时各作业共用）；
+        # 只使用项目根目录的字典，不按文件名到 SecLists 中查找替代
+        user_dict = get_wordlists().prepare([HYDRA_USER_DICT], kind="plain")
+        pass_dict = get_wordlists().prepare([HYDRA_PASS_DICT], kind="plain")
 
         # 健壮性检查
-        if not os.path.exists(binary):
-            error_msg = f"未找到 Hydra 主程序: {binary}。请确认已将 hydra 文件夹放入项目根目录。"
+        if binary is None:
+            error_msg = "未找到 Hydra 主程序。请将 hydra 文件夹放入项目根目录或将 hydra 加入 PATH。"
             self.write_log("tool_hydra", error_msg)
-            return {"is_cracked": False, "findings": []}
+            return None
 
-        if not os.path.exists(user_dict) or not os.path.exists(pass_dict):
-            self.write_log("tool_hydra", "字典文件缺失，请确保项目根目录存在 users.txt 和 pass.txt")
-            return {"is_cracked": False, "findings": []}
+        if user_dict is None or pass_dict is None:
+            self.write_log("tool_hydra", f"字典文件缺失，请确保项目根目录存在 {HYDRA_USER_DICT} 和 {HYDRA_PASS_DICT}")
+            return None
 
         # 2. 构造命令
         # -L: 用户名字典
         # -P: 密码字典
         # -s: 指定端口
         # -f: 爆破成功一个就停止 (极大节约时间)
-        # -t: 线程数 (Windows 下建议不要太高，4-8 即可)
+        # -t / -c: 并发任务数与锁定敏感服务的尝试间隔
         cmd = [
             binary,
-            "-L", user_dict,
-            "-P", pass_dict,
+            "-L", str(user_dict),
+            "-P", str(pass_dict),
             "-s", str(port),
-            "-f", "-t", "4",
+            "-f", *self._pacing_flags(target_ip, service),
             target_ip,
             service
         ]
 
         self.write_log("tool_hydra", f"执行命令: {' '.join(cmd)}")
+        return cmd
 
-        # 3. 核心执行逻辑
-        # 注意：subprocess 运行时，它会自动在 binary 所在的 hydra/ 目录里找到那些 .dll
-        output = self.run_tool(cmd, "tool_hydra")
+    def _pacing_flags(self, target_ip: str, service: str) -> List[str]:
+        """并发取服务默认值与任务预算中的较小者；带锁定策略的服务串行且每次尝试间隔 HYDRA_LOCKOUT_DELAY 秒"""
+        if service in HYDRA_LOCKOUT_SERVICES:
+            return ["-t", "1", "-c", str(HYDRA_LOCKOUT_DELAY)]
+        tasks = HYDRA_SERVICE_TASKS.get(service, HYDRA_DEFAULT_TASKS)
+        if self._rate_share is not None:
+            budget_flags = TOOL_RATE_FLAGS["hydra"](min(self._rate_share, self.rate_limit_rps(target_ip)))
+        else:
+            budget_flags = self.rate_limit_flags("hydra", target_ip)
+        if budget_flags:
+            tasks = min(tasks, int(budget_flags[budget_flags.index("-t") + 1]))
+        return ["-t", str(tasks)]
 
+    def _parse_result(self, service: str, port: int, output) -> Dict[str, Any]:
         # 4. 解析结果 (提取爆破成功的凭证)
         findings = []
         is_cracked = False
 
         if output:
             # 兼容 Hydra 成功时的经典输出格式
-            success_pattern = re.compile(r'host:\s*([^\s]+)\s+login:\s*([^\s]+)\s+password:\s*([^\s]+)', re.IGNORECASE)
-            matches = success_pattern.findall(output)
+            matches = _SUCCESS_PATTERN.findall(output)
 
             for match in matches:
                 is_cracked = True
@@ -81,4 +162,97 @@ class HydraRunner(BaseRunner):
         else:
             self.write_log("tool_hydra", "爆破完成，未发现弱口令。")
 
-        return result
\ No newline at end of file
+        return result
+
+    # ========================= 批量调度 ========================= #
+
+    def run_campaign(self, services: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        对 assets.json 中的开放服务批量爆破：构建 (主机, 服务, 端口) 作业队列，
+        由进程池并行执行，同一主机同时最多 HYDRA_HOST_CONCURRENCY 个作业；
+        凭证边爆破边上报，每个作业完成后刷新 hydra_campaign_findings.json
+        """
+        jobs = self._build_jobs(services)
+        result = {"task_id": self.task_id, "jobs": len(jobs), "completed": 0, "is_cracked": False, "findings": []}
+        if not jobs:
+            self.write_log("tool_hydra", "assets.json 中没有可爆破的服务")
+            self.save_artifact("hydra_campaign_findings.json", result)
+            return result
+
+        deadline = time.monotonic() + self._get_budget_timeout()
+        # 任务预算在并行的 hydra 进程间均分
+        workers = min(HYDRA_WORKERS, len(jobs))
+        rps = self.rate_limit_rps()
+        if rps is not None:
+            workers, self._rate_share = split_rps(rps, workers)
+        self.write_log("tool_hydra", f"批量爆破作业 {len(jobs)} 个，并发 {workers}，单主机上限 {HYDRA_HOST_CONCURRENCY}",
+                       jobs=len(jobs))
+
+        pending = list(jobs)
+        running: Dict[Any, Dict[str, Any]] = {}
+        host_running: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hydra") as pool:
+            while pending or running:
+                # 按队列顺序挑选主机未达上限的作业，保持并发占满
+                for job in list(pending):
+                    if len(running) >= workers:
+                        break
+                    if host_running.get(job["ip"], 0) >= HYDRA_HOST_CONCURRENCY:
+                        continue
+                    pending.remove(job)
+                    host_running[job["ip"]] = host_running.get(job["ip"], 0) + 1
+                    future = self.submit_in_context(pool, self._run_job, job, deadline)
+                    running[future] = job
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    host_running[job["ip"]] -= 1
+                    result["findings"].extend(future.result())
+                    result["completed"] += 1
+                result["is_cracked"] = bool(result["findings"])
+                self.save_artifact("hydra_campaign_findings.json", result)
+                self.update_status({"hint": f"弱口令爆破进度 {result['completed']}/{len(jobs)}，"
+                                            f"发现 {len(result['findings'])} 组凭证"})
+
+        self.write_log("tool_hydra", f"批量爆破完成，{len(jobs)} 个服务发现 {len(result['findings'])} 组有效凭证",
+                       findings=len(result["findings"]))
+        return result
+
+    def _build_jobs(self, services: Optional[List[str]]) -> List[Dict[str, Any]]:
+        asset_path = self.base_dir / "assets.json"
+        if not asset_path.exists():
+            return []
+        with open(asset_path, "r", encoding="utf-8") as f:
+            assets = json.load(f)
+
+        wanted = {s.lower() for s in services} if services else None
+        by_host: Dict[str, List[Dict[str, Any]]] = {}
+        for host in assets.get("hosts", []):
+            for port_info in host.get("ports", []):
+                if port_info.get("protocol", "tcp") != "tcp" or not port_info.get("port"):
+                    continue
+                port = int(port_info["port"])
+                service = HYDRA_SERVICES.get(str(port_info.get("service", "")).lower()) or HYDRA_PORT_SERVICES.get(port)
+                if service is None or (wanted is not None and service not in wanted):
+                    continue
+                by_host.setdefault(host["ip"], []).append({"ip": host["ip"], "service": service, "port": port})
+        # 主机交错排列，使不同主机的作业尽早并行
+        return [job for group in zip_longest(*by_host.values()) for job in group if job is not None]
+
+    def _run_job(self, job: Dict[str, Any], deadline: float) -> List[Dict[str, Any]]:
+        timeout = int(deadline - time.monotonic())
+        if timeout <= 0:
+            return []
+        cmd = self._prepare_bruteforce(job["ip"], job["service"], job["port"])
+        if cmd is None:
+            return []
+        findings = []
+        for name, line in self.stream_tool(cmd, "tool_hydra", timeout):
+            match = _SUCCESS_PATTERN.search(line) if name == "stdout" else None
+            if match:
+                finding = {"service": job["service"], "ip": match.group(1), "port": job["port"],
+                           "username": match.group(2), "password": match.group(3)}
+                findings.append(finding)
+                self.emit_finding(finding)
+        return findings
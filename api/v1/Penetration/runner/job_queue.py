@@ -0,0 +1,281 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+from .base import finding_sink
+from .registry import get_spec
+from .status_store import atomic_write_json, try_lock
+from .tool_dispatcher import ToolDispatcher
+
+# 全局并发上限：同时执行的工具作业数
+JOB_WORKERS = 16
+
+# 按资源类别（见 registry.ToolSpec.resource）的默认单工具并发上限
+RESOURCE_CONCURRENCY: Dict[str, int] = {
+    "scan": 2,
+    "recon": 4,
+    "web": 4,
+    "vuln": 2,
+    "bruteforce": 2,
+}
+DEFAULT_TOOL_CONCURRENCY = 4
+
+# 单工具并发上限，优先级高于资源类别默认值
+TOOL_CONCURRENCY: Dict[str, int] = {
+    "masscan": 1,
+    "naabu": 2,
+    "nuclei": 2,
+    "sqlmap": 4,
+    "hydra": 2,
+    # 批量调度工具内部已并行，作业层面串行
+    "hydra_campaign": 1,
+    "subdomain_enum": 1,
+    "amass": 2,
+    "xray": 1,
+}
+
+# 作业状态中保留的部分结果条数上限，以及落盘节流间隔（秒）
+PARTIAL_FINDINGS_LIMIT = 200
+PERSIST_INTERVAL = 2.0
+# 已结束作业在内存中保留的秒数，过期后只从 runs/{task_id}/jobs/ 读取
+JOB_RETENTION_SECONDS = 600
+# 队列实例的存活锁目录：每个进程内的队列持有 {owner}.lock，进程退出后锁自动释放
+JOB_OWNER_DIR = Path("runs/_jobs")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class ToolJob:
+    """工具作业数据模型"""
+
+    def __init__(self, task_id: str, tool_id: str, args: Dict[str, Any], cache: str = "prefer", owner: str = ""):
+        self.job_id = "j_" + secrets.token_hex(6)
+        self.owner = owner
+        self.task_id = task_id
+        self.tool_id = tool_id
+        self.args = args
+        self.cache = cache
+        self.state = "queued"  # queued | running | succeeded | failed
+        self.created_at = _now_iso()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.partial_findings: List[Dict[str, Any]] = []
+        self.partial_count = 0
+        self._started_ts: Optional[float] = None
+        self._finished_ts: Optional[float] = None
+        self._persisted_ts = 0.0
+        # 保护部分结果与落盘：工具内多个工作线程会同时上报发现
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return Path(f"runs/{self.task_id}/jobs/{self.job_id}.json")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        elapsed = None
+        if self._started_ts is not None:
+            elapsed = round((self._finished_ts or time.time()) - self._started_ts, 2)
+        return {
+            "job_id": self.job_id,
+            "owner": self.owner,
+            "task_id": self.task_id,
+            "tool_id": self.tool_id,
+            "args": self.args,
+            "cache": self.cache,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "elapsed_seconds": elapsed,
+                "partial_findings_count": self.partial_count,
+            },
+            "partial_findings": self.partial_findings,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    工具作业队列：提交即返回 job_id，由有界线程池异步执行 ToolDispatcher，
+    作业状态持久化至 runs/{task_id}/jobs/{job_id}.json；已结束的作业 JOB_RETENTION_SECONDS 后移出内存。
+    从磁盘读到排队 / 执行中的作业时，若其所属队列进程已退出（服务关闭或崩溃），将其标记为失败
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, tool_concurrency: Optional[Dict[str, int]] = None):
+        self.workers = workers
+        self.tool_concurrency = dict(TOOL_CONCURRENCY if tool_concurrency is None else tool_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ToolJob] = {}
+        self._pending: deque = deque()
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        self.owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._owner_lock = None
+
+    def submit(self, task_id: str, tool_id: str, args: Dict[str, Any], cache: str = "prefer") -> ToolJob:
+        """提交作业，立即返回；未注册的 tool_id 抛出 ValueError"""
+        get_spec(tool_id)
+        job = ToolJob(task_id, tool_id, args or {}, cache, owner=self.owner)
+        with self._lock:
+            if self._owner_lock is None:
+                self._owner_lock = try_lock(JOB_OWNER_DIR / f"{self.owner}.lock")
+            self._evict()
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+        self._persist(job, force=True)
+        self._schedule()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询作业状态：优先内存，其次在 runs/*/jobs/ 下查找（跨进程 / 重启后）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            with job._lock:
+                return job.to_dict()
+
+        if not job_id or not job_id.replace("_", "").isalnum():
+            return None
+        for path in Path("runs").glob(f"*/jobs/{job_id}.json"):
+            return self._load(path)
+        return None
+
+    def list_by_task(self, task_id: str) -> List[Dict[str, Any]]:
+        """列出某任务下的全部作业（摘要，不含结果明细）"""
+        jobs = []
+        job_dir = Path(f"runs/{task_id}/jobs")
+        if job_dir.exists():
+            for path in sorted(job_dir.glob("*.json")):
+                data = self._load(path)
+                if data is None:
+                    continue
+                data.pop("result", None)
+                data.pop("partial_findings", None)
+                jobs.append(data)
+        return jobs
+
+    def _load(self, path: Path) -> Optional[Dict[str, Any]]:
+        """读取持久化的作业状态；所属队列进程已退出的未完成作业改记为失败"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return None
+        if data.get("state") in ("queued", "running") and not self._owner_alive(data.get("owner") or ""):
+            data["error"] = f"服务进程在作业{'排队' if data['state'] == 'queued' else '执行'}期间退出，作业未完成"
+            data["state"] = "failed"
+            data["finished_at"] = _now_iso()
+            atomic_write_json(path, data)
+        return data
+
+    def _owner_alive(self, owner: str) -> bool:
+        """作业所属队列是否仍在运行：其存活锁仍被持有即视为存活"""
+        if owner == self.owner:
+            return True
+        lock_path = JOB_OWNER_DIR / f"{owner}.lock"
+        if not owner or not lock_path.exists():
+            return False
+        held = try_lock(lock_path)
+        if held is None:
+            return True
+        held.close()
+        try:
+            lock_path.unlink()
+        except OSError:
+            pass
+        return False
+
+    def _evict(self):
+        """移除结束超过 JOB_RETENTION_SECONDS 的作业（调用方持有 self._lock）"""
+        expired = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j.job_id for j in self._jobs.values() if j._finished_ts and j._finished_ts < expired]:
+            del self._jobs[job_id]
+
+    def _limit_for(self, tool_id: str) -> int:
+        if tool_id in self.tool_concurrency:
+            return self.tool_concurrency[tool_id]
+        return RESOURCE_CONCURRENCY.get(get_spec(tool_id).resource, DEFAULT_TOOL_CONCURRENCY)
+
+    def _schedule(self):
+        """在全局与单工具并发额度内启动排队作业，额度不足的作业继续排队且不占用工作线程"""
+        to_start = []
+        with self._lock:
+            skipped = deque()
+            while self._pending and self._running_total < self.workers:
+                job = self._pending.popleft()
+                if self._running.get(job.tool_id, 0) >= self._limit_for(job.tool_id):
+                    skipped.append(job)
+                    continue
+                self._running[job.tool_id] = self._running.get(job.tool_id, 0) + 1
+                self._running_total += 1
+                to_start.append(job)
+            skipped.extend(self._pending)
+            self._pending = skipped
+
+        for job in to_start:
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: ToolJob):
+        with job._lock:
+            job.state = "running"
+            job.started_at = _now_iso()
+            job._started_ts = time.time()
+        self._persist(job, force=True)
+
+        token = finding_sink.set(lambda finding: self._on_finding(job, finding))
+        try:
+            result = ToolDispatcher.execute(job.task_id, job.tool_id, job.args, job.cache)
+            with job._lock:
+                job.result = result
+                job.state = "succeeded"
+        except Exception as e:
+            with job._lock:
+                job.error = str(e)
+                job.state = "failed"
+        finally:
+            finding_sink.reset(token)
+            with job._lock:
+                job.finished_at = _now_iso()
+                job._finished_ts = time.time()
+            self._persist(job, force=True)
+            with self._lock:
+                self._running[job.tool_id] -= 1
+                self._running_total -= 1
+                self._evict()
+            self._schedule()
+
+    def _on_finding(self, job: ToolJob, finding: Dict[str, Any]):
+        with job._lock:
+            job.partial_count += 1
+            if len(job.partial_findings) < PARTIAL_FINDINGS_LIMIT:
+                job.partial_findings.append(finding)
+        self._persist(job)
+
+    def _persist(self, job: ToolJob, force: bool = False):
+        """作业状态落盘；部分结果更新按 PERSIST_INTERVAL 节流。持有作业锁写入，保证后写的状态不会被旧快照覆盖"""
+        with job._lock:
+            now = time.time()
+            if not force and now - job._persisted_ts < PERSIST_INTERVAL:
+                return
+            job._persisted_ts = now
+            job.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(job.path, job.to_dict())
+
+
+# 全局作业队列实例
+job_queue = JobQueue()
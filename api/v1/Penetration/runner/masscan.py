@@ -1,7 +1,82 @@
+import ipaddress
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from array import array
+from typing import List, Dict, Any, Iterator, Iterable, Optional
 from .base import BaseRunner
+from .ratelimit import PACKET_RATE_MULTIPLIER
+
+# run_scan 返回给调用方的结果条数上限；完整结果见 masscan_findings.json
+MASSCAN_RETURN_LIMIT = 10000
+# 跨行记录拼接的最大长度，超过即丢弃（防止残缺输出无限累积）
+MASSCAN_MAX_RECORD_CHARS = 64 * 1024
+
+_PROTOCOLS = ("tcp", "udp", "sctp", "icmp")
+
+
+class PortTable:
+    """
+    开放端口的列式存储：IPv4 存为 uint32、端口存为 uint16、协议存为 uint8 下标，
+    每条约 7 字节；IPv6 记录较少，单独存放
+    """
+
+    def __init__(self):
+        self.ips = array("I")
+        self.ports = array("H")
+        self.protocols = array("B")
+        self.ipv6: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.ips) + len(self.ipv6)
+
+    def add(self, ip: str, port: int, protocol: str):
+        proto = _PROTOCOLS.index(protocol) if protocol in _PROTOCOLS else 0
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return
+        if address.version == 4:
+            self.ips.append(int(address))
+            self.ports.append(port)
+            self.protocols.append(proto)
+        else:
+            self.ipv6.append((ip, port, proto))
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self.ips)):
+            yield {
+                "ip": str(ipaddress.IPv4Address(self.ips[i])),
+                "port": self.ports[i],
+                "protocol": _PROTOCOLS[self.protocols[i]],
+                "status": "open",
+            }
+        for ip, port, proto in self.ipv6:
+            yield {"ip": ip, "port": port, "protocol": _PROTOCOLS[proto], "status": "open"}
+
+
+def iter_masscan_records(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    容错解析 masscan -oJ 输出：逐条记录解析，忽略数组括号与记录间逗号（含运行中的尾随逗号），
+    跨行记录拼接后再解析，超时截断的残缺记录直接丢弃
+    """
+    buffer = ""
+    for line in lines:
+        text = line.strip()
+        if not buffer:
+            if not text.startswith("{"):
+                continue  # "[" / "]" / 空行 / 非记录内容
+        buffer += text
+        candidate = buffer.rstrip(",")
+        try:
+            record = json.loads(candidate)
+        except ValueError:
+            if len(buffer) > MASSCAN_MAX_RECORD_CHARS:
+                buffer = ""
+            continue
+        buffer = ""
+        if isinstance(record, dict):
+            yield record
 
 
 class MasscanRunner(BaseRunner):
@@ -11,12 +86,20 @@ class MasscanRunner(BaseRunner):
         if not target_ip:
             return []
 
+        # 任务设置了预算时，发包速率不超过预算折算值
+        rps = self.rate_limit_rps(target_ip)
+        if rps is not None:
+            rate = min(int(rate), max(1, int(rps * PACKET_RATE_MULTIPLIER)))
+
         self.write_log("tool_masscan", f"启动 Masscan，目标: {target_ip}, 端口: {ports}, 速率: {rate}")
 
         binary_path = os.path.abspath(os.path.join(os.getcwd(), "masscan.exe"))
         binary = binary_path if os.path.exists(binary_path) else "masscan"
 
         tmp_output = self.base_dir / "masscan_raw.json"
+        # 删除上次的输出，避免追踪到旧内容
+        if tmp_output.exists():
+            tmp_output.unlink()
 
         # 构造命令: masscan <ip> -p <ports> --rate <rate> -oJ <output>
         cmd = [
@@ -26,24 +109,45 @@ class MasscanRunner(BaseRunner):
             "-oJ", str(tmp_output)
         ]
 
-        self.run_tool(cmd, "tool_masscan")
+        # 工具在后台线程运行，当前线程边写边读输出文件；工具结束或超时后读完剩余内容
+        finished = threading.Event()
 
-        findings = []
-        if tmp_output.exists():
+        def _run():
             try:
-                with open(tmp_output, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    for item in data:
-                        ip = item.get("ip")
-                        for port_info in item.get("ports", []):
-                            findings.append({
-                                "ip": ip,
-                                "port": port_info.get("port"),
-                                "protocol": port_info.get("proto"),
-                                "status": port_info.get("status")
-                            })
-            except Exception as e:
-                self.write_log("tool_masscan", f"解析输出失败: {e}")
-
-        self.save_artifact("masscan_findings.json", {"task_id": self.task_id, "findings": findings})
-        return findings
\ No newline at end of file
+                self.run_tool(cmd, "tool_masscan")
+            finally:
+                finished.set()
+
+        threading.Thread(target=_run, name="masscan", daemon=True).start()
+
+        table = PortTable()
+        for record in iter_masscan_records(self.follow_file(tmp_output, finished.is_set)):
+            ip = record.get("ip")
+            for port_info in record.get("ports", []):
+                if port_info.get("status", "open") != "open" or not port_info.get("port"):
+                    continue
+                table.add(ip, int(port_info["port"]), port_info.get("proto", "tcp"))
+                self.emit_finding({"ip": ip, "port": port_info["port"], "protocol": port_info.get("proto")})
+
+        self._save_findings(table)
+        self.write_log("tool_masscan", f"解析完成，共 {len(table)} 个开放端口", open_ports=len(table))
+        return self._to_findings(table, MASSCAN_RETURN_LIMIT)
+
+    def _save_findings(self, table: PortTable):
+        """逐条写出 masscan_findings.json，不在内存中构造完整的字典列表"""
+        file_path = self.base_dir / "masscan_findings.json"
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f'{{"task_id": {json.dumps(self.task_id)}, "total": {len(table)}, "findings": [')
+            for i, row in enumerate(table.rows()):
+                f.write(("," if i else "") + "\n  " + json.dumps(row))
+            f.write("\n]}\n")
+        self.write_log("system", "产物已落盘: masscan_findings.json", artifact="masscan_findings.json")
+
+    def _to_findings(self, table: PortTable, limit: Optional[int]) -> List[Dict[str, Any]]:
+        findings = []
+        for row in table.rows():
+            if limit is not None and len(findings) >= limit:
+                self.write_log("tool_masscan", f"结果超过 {limit} 条，仅返回前 {limit} 条，完整结果见 masscan_findings.json")
+                break
+            findings.append(row)
+        return findings
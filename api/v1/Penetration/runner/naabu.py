@@ -23,7 +23,8 @@ class NaabuRunner(BaseRunner):
             binary,
             "-host", target,
             "-json",
-            "-o", str(tmp_output)
+            "-o", str(tmp_output),
+            *self.rate_limit_flags("naabu", target)
         ]
 
         self.run_tool(cmd, "tool_naabu")
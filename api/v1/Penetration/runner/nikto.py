@@ -25,7 +25,8 @@ class NiktoRunner(BaseRunner):
             "perl", script_path,
             "-h", target_url,
             "-Format", "json",
-            "-o", str(tmp_output)
+            "-o", str(tmp_output),
+            *self.rate_limit_flags("nikto", target_url)
         ]
 
         self.run_tool(cmd, "tool_nikto")
@@ -1,49 +1,294 @@
+import asyncio
+import ipaddress
+import math
+import os
 import re
+import time
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Any, Optional, Tuple
 
 from .base import BaseRunner
 
+# 每个分片包含的主机数与端口数
+NMAP_SHARD_HOSTS = 16
+NMAP_SHARD_PORTS = 5000
+# 同时运行的 nmap 进程数
+NMAP_WORKERS = 4
+# 单次任务允许展开的主机数上限（约一个 /16）
+NMAP_MAX_HOSTS = 65536
+
+_PORT_SPEC = re.compile(r'^([TU]:)?[\d,\-]+(,([TU]:)?[\d,\-]+)*$')
+
+
+def expand_targets(target: str) -> List[str]:
+    """解析目标：支持逗号/空白分隔的 IP、CIDR 与主机名，CIDR 展开为主机地址并去重保序"""
+    hosts: List[str] = []
+    seen = set()
+    for token in re.split(r"[,\s]+", target or ""):
+        if not token:
+            continue
+        try:
+            network = ipaddress.ip_network(token, strict=False)
+            addresses = [str(a) for a in network.hosts()] or [str(network.network_address)]
+        except ValueError:
+            addresses = [token]
+        for addr in addresses:
+            if addr not in seen:
+                seen.add(addr)
+                hosts.append(addr)
+            if len(hosts) >= NMAP_MAX_HOSTS:
+                return hosts
+    return hosts
+
+
+def split_ports(ports: str) -> List[str]:
+    """把纯数字端口表达式按 NMAP_SHARD_PORTS 切分；带 T:/U: 协议前缀的表达式不切分"""
+    if ":" in ports:
+        return [ports]
+    numbers = []
+    for part in ports.split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            numbers.extend(range(int(start or 1), int(end or 65535) + 1))
+        else:
+            numbers.append(int(part))
+    numbers = sorted(set(n for n in numbers if 0 < n <= 65535))
+
+    shards, chunk = [], []
+    for n in numbers:
+        chunk.append(n)
+        if len(chunk) >= NMAP_SHARD_PORTS:
+            shards.append(chunk)
+            chunk = []
+    if chunk:
+        shards.append(chunk)
+    return [compress_ports(c) for c in shards]
+
+
+def compress_ports(numbers: List[int]) -> str:
+    ranges = []
+    start = prev = numbers[0]
+    for n in numbers[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}-{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}-{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+
+class NmapXmlParser:
+    """基于 XMLPullParser 的增量解析器：逐行喂入 -oX 输出，每解析完一个 <host> 即产出结果"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, data: str) -> List[Dict[str, Any]]:
+        try:
+            self._parser.feed(data + "\n")
+            events = list(self._parser.read_events())
+        except ET.ParseError:
+            # 超时截断等导致的残缺 XML：保留已解析的主机
+            return []
+        hosts = []
+        for _, elem in events:
+            if elem.tag == "host":
+                host = self._parse_host(elem)
+                if host is not None:
+                    hosts.append(host)
+                elem.clear()
+        return hosts
+
+    @staticmethod
+    def _parse_host(elem) -> Dict[str, Any]:
+        status = elem.find("status")
+        if status is not None and status.get("state") != "up":
+            return None
+        ip = None
+        for addr in elem.findall("address"):
+            if addr.get("addrtype") in ("ipv4", "ipv6"):
+                ip = addr.get("addr")
+                break
+        if ip is None:
+            return None
+
+        ports = []
+        for port in elem.findall("ports/port"):
+            state = port.find("state")
+            if state is None or state.get("state") != "open":
+                continue
+            service = port.find("service")
+            service_attrs = service.attrib if service is not None else {}
+            ports.append({
+                "port": int(port.get("portid")),
+                "protocol": port.get("protocol", "tcp"),
+                "service": service_attrs.get("name", "unknown"),
+                "product": service_attrs.get("product"),
+                "version": service_attrs.get("version"),
+                "extrainfo": service_attrs.get("extrainfo"),
+                "cpe": [c.text for c in service.findall("cpe")] if service is not None else [],
+            })
+
+        # type="user" 为命令行中请求的目标主机名，排在 PTR 等反查结果之前
+        names = elem.findall("hostnames/hostname")
+        hostnames = list(dict.fromkeys(
+            h.get("name") for h in sorted(names, key=lambda h: h.get("type") != "user") if h.get("name")
+        ))
+        return {"ip": ip, "hostnames": hostnames, "ports": ports}
+
 
 class NmapRunner(BaseRunner):
     """
-    Stage 1 资产发现执行器
+    Stage 1 资产发现执行器：目标按主机 × 端口切分为分片，由有界进程池并行执行 nmap，
+    -oX 输出经 XML 流式解析后合并至 assets.json
     """
 
     def scan(self, target: str, ports: str = "1-1000"):
+        shards, base_cmd = self._prepare_scan(target, ports)
+        deadline = time.monotonic() + self._get_budget_timeout()
+        merged: Dict[str, Dict[str, Any]] = {}
+
+        skipped = 0
+        results = self.map_shards(lambda shard: self._run_shard(base_cmd, shard, deadline), shards,
+                                  NMAP_WORKERS, "nmap-shard")
+        for done, (_, hosts) in enumerate(results, 1):
+            skipped += hosts is None
+            self._merge(merged, hosts or [])
+            self._report_progress(done, len(shards))
+        return self._finish_scan(target, merged, len(shards), skipped=skipped)
+
+    async def ascan(self, target: str, ports: str = "1-1000"):
+        """scan 的异步版本，供 async 路由直接 await"""
+        shards, base_cmd = self._prepare_scan(target, ports)
+        deadline = time.monotonic() + self._get_budget_timeout()
+        merged: Dict[str, Dict[str, Any]] = {}
+        semaphore = asyncio.Semaphore(NMAP_WORKERS)
+
+        async def _run(shard):
+            async with semaphore:
+                return await self._arun_shard(base_cmd, shard, deadline)
+
+        skipped = 0
+        tasks = [asyncio.create_task(_run(shard)) for shard in shards]
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            hosts = await task
+            skipped += hosts is None
+            self._merge(merged, hosts or [])
+            self._report_progress(done, len(shards))
+        return self._finish_scan(target, merged, len(shards), skipped=skipped)
+
+    def _prepare_scan(self, target: str, ports: str) -> Tuple[List[Tuple[List[str], str]], List[str]]:
         self.update_status({"stage": "Stage1_Asset", "hint": f"正在扫描目标: {target}", "percent": 15})
 
-        # 真实调用 Nmap
         # 端口范围合法性校验与兜底
-        if not ports or not re.match(r'^[\d,\-]+$', ports):
+        if not ports or not _PORT_SPEC.match(ports):
             self.write_log("stage1_asset", f"未指定有效端口范围({ports})，降级为 top 100 扫描")
-            cmd = ["nmap", "-sV", "--top-ports", "100", target]
+            base_cmd = self._base_cmd()
+            port_shards = [None]
         else:
-            cmd = ["nmap", "-sV", "-p", ports, target]
+            base_cmd = self._base_cmd(udp="U:" in ports)
+            port_shards = split_ports(ports)
+
+        hosts = expand_targets(target)
+        host_shards = [hosts[i:i + NMAP_SHARD_HOSTS] for i in range(0, len(hosts), NMAP_SHARD_HOSTS)]
+        shards = [(h, p) for h in host_shards for p in port_shards]
+        self.write_log("stage1_asset", f"目标展开为 {len(hosts)} 个主机，切分为 {len(shards)} 个分片",
+                       hosts=len(hosts), shards=len(shards))
+        return shards, base_cmd
+
+    @staticmethod
+    def _base_cmd(udp: bool = False) -> List[str]:
+        binary_path = os.path.abspath(os.path.join(os.getcwd(), "nmap.exe"))
+        binary = binary_path if os.path.exists(binary_path) else "nmap"
+        cmd = [binary, "-sV", "-oX", "-"]
+        if udp:
+            # UDP 需同时指定 TCP 扫描类型，否则 nmap 只扫描 UDP
+            cmd += ["-sS", "-sU"]
+        return cmd
+
+    @staticmethod
+    def _shard_cmd(base_cmd: List[str], shard) -> List[str]:
+        hosts, ports = shard
+        port_args = ["--top-ports", "100"] if ports is None else ["-p", ports]
+        return base_cmd + port_args + hosts
+
+    def _run_shard(self, base_cmd, shard, deadline: float) -> Optional[List[Dict[str, Any]]]:
+        """执行单个分片；轮到该分片时已过截止时间则不再启动 nmap，返回 None"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        timeout = math.ceil(remaining)
+        parser = NmapXmlParser()
+        hosts = []
+        for name, line in self.stream_tool(self._shard_cmd(base_cmd, shard), "stage1_asset", timeout):
+            if name == "stdout":
+                hosts.extend(parser.feed(line))
+        return hosts
+
+    async def _arun_shard(self, base_cmd, shard, deadline: float) -> Optional[List[Dict[str, Any]]]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        timeout = math.ceil(remaining)
+        parser = NmapXmlParser()
+        hosts = []
+        async for name, line in self.astream_tool(self._shard_cmd(base_cmd, shard), "stage1_asset", timeout):
+            if name == "stdout":
+                hosts.extend(parser.feed(line))
+        return hosts
+
+    @staticmethod
+    def _merge(merged: Dict[str, Dict[str, Any]], hosts: List[Dict[str, Any]]):
+        """按 IP 合并分片结果：同一 IP 的各个请求主机名都保留在 hostnames 中，同一 (协议, 端口) 只保留一条"""
+        for host in hosts:
+            entry = merged.setdefault(host["ip"], {"ip": host["ip"], "hostnames": [], "ports": []})
+            for name in host["hostnames"]:
+                if name not in entry["hostnames"]:
+                    entry["hostnames"].append(name)
+            known = {(p["protocol"], p["port"]) for p in entry["ports"]}
+            for port in host["ports"]:
+                if (port["protocol"], port["port"]) not in known:
+                    entry["ports"].append(port)
+
+    def _report_progress(self, done: int, total: int):
+        self.update_status({
+            "percent": 15 + int(20 * done / total),
+            "hint": f"Nmap 分片进度 {done}/{total}"
+        })
 
-        output = self.run_tool(cmd, "stage1_asset")
+    def _finish_scan(self, target: str, merged: Dict[str, Dict[str, Any]], shard_count: int, source: str = "nmap",
+                     skipped: int = 0):
+        hosts = [h for h in merged.values() if h["ports"]]
+        for host in hosts:
+            host["ports"].sort(key=lambda p: (p["protocol"], p["port"]))
+        port_count = sum(len(h["ports"]) for h in hosts)
 
-        # 简单的正则解析：匹配开放端口与服务
-        discovered_ports = []
-        if output:
-            matches = re.findall(r"(\d+)/tcp\s+open\s+([\w-]+)", output)
-            for port, service in matches:
-                discovered_ports.append({"port": int(port), "service": service})
+        # 单目标且未发现端口时保留原有兜底资产，保证后续阶段可继续
+        targets = expand_targets(target)
+        if not hosts and len(targets) == 1:
+            hosts = [{"ip": target, "ports": [{"port": 80, "service": "mock-http"}]}]
 
         # 构造并保存资产清单 assets.json
         assets_data = {
             "task_id": self.task_id,
             "target": target,
-            "hosts": [
-                {
-                    "ip": target,
-                    "ports": discovered_ports if discovered_ports else [{"port": 80, "service": "mock-http"}]
-                }
-            ],
-            "status": "completed"
+            "hosts": hosts,
+            "shards": shard_count,
+            "skipped_shards": skipped,
+            "source": source,
+            # 有分片因超出时间预算未执行时结果不完整
+            "status": "partial" if skipped else "completed"
         }
+        if skipped:
+            self.write_log("stage1_asset", f"{skipped}/{shard_count} 个分片因超出时间预算未执行，资产结果不完整",
+                           skipped_shards=skipped)
 
         self.save_artifact("assets.json", assets_data)
         self.update_status({
             "percent": 35,
-            "hint": f"Stage 1 完成，发现 {len(discovered_ports)} 个端口"
+            "hint": f"Stage 1 完成，{len(hosts)} 个主机发现 {port_count} 个端口"
         })
         return assets_data
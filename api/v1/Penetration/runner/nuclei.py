@@ -1,45 +1,299 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import List
+import re
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
 from .base import BaseRunner
+from .ratelimit import host_of
+
+# 每个 nuclei 进程处理的目标数，以及同时运行的 nuclei 进程数
+NUCLEI_SHARD_SIZE = 200
+NUCLEI_WORKERS = 3
+# 未设置预算时每个进程的模板并发（-c）与单模板并行主机数（-bulk-size）
+NUCLEI_CONCURRENCY = 25
+NUCLEI_BULK_SIZE = 25
+# 模板相对路径（如 cves/）在本地找不到时，到 nuclei 默认模板目录下查找
+NUCLEI_TEMPLATES_HOME = Path.home() / "nuclei-templates"
+# 模板标签索引缓存目录
+NUCLEI_INDEX_DIR = Path("runs/_cache/nuclei")
+
+# 指纹技术栈（小写子串）-> nuclei 模板标签。带有这些标签的模板只在目标识别出对应技术栈时执行，
+# 其余通用模板照常执行
+TECH_TAGS: Dict[str, str] = {
+    "wordpress": "wordpress", "joomla": "joomla", "drupal": "drupal", "magento": "magento",
+    "tomcat": "tomcat", "jboss": "jboss", "weblogic": "weblogic", "websphere": "websphere",
+    "spring": "springboot", "struts": "struts", "thinkphp": "thinkphp", "laravel": "laravel",
+    "jenkins": "jenkins", "gitlab": "gitlab", "confluence": "confluence", "jira": "jira",
+    "grafana": "grafana", "kibana": "kibana", "elasticsearch": "elasticsearch", "nacos": "nacos",
+    "shiro": "shiro", "iis": "iis", "exchange": "exchange", "zabbix": "zabbix", "phpmyadmin": "phpmyadmin",
+}
+
+_TAGS_LINE = re.compile(r"^\s+tags:\s*(.+?)\s*$", re.M)
+# 只读取模板文件头部解析 tags
+_TEMPLATE_HEAD_BYTES = 4096
+
+
+class TemplateIndex:
+    """
+    模板标签索引：扫描模板目录，按文件头部的 info.tags 建立 模板路径 -> 标签 映射。
+    结果按目录签名（文件数 + 最新修改时间）落盘缓存，模板库未更新时不重复解析
+    """
+
+    _lock = threading.Lock()
+    _memory: Dict[str, Tuple[str, Dict[str, List[str]]]] = {}
+
+    @classmethod
+    def load(cls, directory: Path) -> Dict[str, List[str]]:
+        files = []
+        latest = 0.0
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith((".yaml", ".yml")):
+                    path = os.path.join(root, name)
+                    files.append(path)
+                    latest = max(latest, os.path.getmtime(path))
+        signature = f"{len(files)}:{latest}"
+        key = str(directory.resolve())
+
+        with cls._lock:
+            cached = cls._memory.get(key)
+            if cached and cached[0] == signature:
+                return cached[1]
+
+        cache_path = NUCLEI_INDEX_DIR / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+        index = None
+        if cache_path.exists():
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("signature") == signature:
+                    index = data["templates"]
+            except (OSError, ValueError, KeyError):
+                pass
+        if index is None:
+            index = {path: cls._read_tags(path) for path in files}
+            NUCLEI_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "templates": index}, f)
+
+        with cls._lock:
+            cls._memory[key] = (signature, index)
+        return index
+
+    @staticmethod
+    def _read_tags(path: str) -> List[str]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                head = f.read(_TEMPLATE_HEAD_BYTES)
+        except OSError:
+            return []
+        match = _TAGS_LINE.search(head)
+        if not match:
+            return []
+        return [t.strip().strip("'\"").lower() for t in match.group(1).strip("[]").split(",") if t.strip()]
+
+
+def detected_tags(base_dir: Path, targets: List[str]) -> Optional[Set[str]]:
+    """
+    从 http_fingerprints.json 汇总目标的技术栈标签；
+    存在未做过指纹识别的目标时返回 None（不做筛选，避免漏扫）
+    """
+    fp_path = base_dir / "http_fingerprints.json"
+    if not fp_path.exists():
+        return None
+    with open(fp_path, "r", encoding="utf-8") as f:
+        fps = json.load(f).get("fingerprints", [])
+    host_tech: Dict[str, List[str]] = {}
+    for fp in fps:
+        try:
+            host = host_of(fp.get("url") or fp.get("input") or "")
+        except ValueError:
+            # URL 格式错误（如 IPv6 方括号不完整）的指纹记录直接忽略
+            continue
+        host_tech.setdefault(host, []).extend(t.split(":")[0].lower() for t in fp.get("tech") or [])
+
+    tags = set()
+    for target in targets:
+        try:
+            host = host_of(target)
+        except ValueError:
+            return None
+        if host not in host_tech:
+            return None
+        for tech in host_tech[host]:
+            tags.update(tag for name, tag in TECH_TAGS.items() if name in tech)
+    return tags
 
 
 class NucleiRunner(BaseRunner):
-    """独立 Nuclei 漏洞扫描工具执行器"""
+    """
+    独立 Nuclei 漏洞扫描工具执行器：目标写入 -l 列表文件分片，多个 nuclei 进程并行执行，
+    按指纹技术栈预筛模板，stdout 上的 JSONL 结果边扫边解析上报
+    """
 
     def run_scan(self, targets: List[str], templates: List[str]) -> List[dict]:
         if not targets:
             return []
 
+        shards, base_cmd, deadline, workers = self._prepare_scan(targets, templates)
+        findings: Dict[tuple, dict] = {}
+        for _, shard_findings in self.map_shards(lambda shard: self._run_shard(base_cmd, shard, deadline), shards,
+                                                 workers, "nuclei", deadline=deadline, skipped=[]):
+            self._merge(findings, shard_findings)
+        return self._collect_findings(findings)
+
+    async def arun_scan(self, targets: List[str], templates: List[str]) -> List[dict]:
+        """run_scan 的异步版本"""
+        if not targets:
+            return []
+
+        shards, base_cmd, deadline, workers = self._prepare_scan(targets, templates)
+        findings: Dict[tuple, dict] = {}
+        semaphore = asyncio.Semaphore(workers)
+
+        async def _run(shard):
+            async with semaphore:
+                return await self._arun_shard(base_cmd, shard, deadline)
+
+        for task in asyncio.as_completed([asyncio.create_task(_run(shard)) for shard in shards]):
+            self._merge(findings, await task)
+        return self._collect_findings(findings)
+
+    def _prepare_scan(self, targets: List[str], templates: List[str]):
+        targets = list(dict.fromkeys(t.strip() for t in targets if t and t.strip()))
         self.write_log("tool_nuclei", f"接收到独立的 Nuclei 扫描请求，目标数: {len(targets)}")
 
+        work_dir = self.base_dir / "nuclei"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        template_args = self._template_args(targets, templates, work_dir)
+        if template_args is None:
+            # 预筛后没有相关模板，不启动 nuclei
+            return [], [], time.monotonic(), 1
+
+        shards = []
+        for i in range(0, len(targets), NUCLEI_SHARD_SIZE):
+            index = i // NUCLEI_SHARD_SIZE
+            target_file = work_dir / f"targets_{index:04d}.txt"
+            with open(target_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(targets[i:i + NUCLEI_SHARD_SIZE]) + "\n")
+            shards.append((str(target_file), str(work_dir / f"nuclei_raw_{index:04d}.jsonl")))
+
         # 构造外部命令
-        tmp_output = self.base_dir / "nuclei_raw.jsonl"
         binary = "./nuclei.exe" if os.path.exists("./nuclei.exe") else "nuclei"
+        cmd = [binary, "-jsonl", "-silent"]
+        cmd.extend(template_args)
+        workers, flags = self._concurrency_flags(targets, min(NUCLEI_WORKERS, len(shards)))
+        cmd.extend(flags)
+
+        self.write_log("tool_nuclei", f"{len(targets)} 个目标切分为 {len(shards)} 个分片，执行命令: {' '.join(cmd)}",
+                       targets=len(targets), shards=len(shards), workers=workers)
+        return shards, cmd, time.monotonic() + self._get_budget_timeout(), workers
 
-        cmd = [binary, "-u", ",".join(targets), "-jsonl", "-silent", "-o", str(tmp_output)]
+    def _concurrency_flags(self, targets: List[str], workers: int) -> Tuple[int, List[str]]:
+        """
+        返回 (并行进程数, 并发参数)：有预算时按预算在各进程间均分 -rl/-c（必要时减少进程数），
+        -bulk-size 不超过 -c；否则使用默认并发
+        """
+        workers, flags = self.rate_limit_workers("nuclei", workers, targets[0] if len(targets) == 1 else "")
+        if not flags:
+            return workers, ["-c", str(NUCLEI_CONCURRENCY), "-bulk-size", str(NUCLEI_BULK_SIZE)]
+        threads = int(flags[flags.index("-c") + 1])
+        return workers, flags + ["-bulk-size", str(min(NUCLEI_BULK_SIZE, threads))]
+
+    def _template_args(self, targets: List[str], templates: List[str], work_dir: Path) -> Optional[List[str]]:
+        """
+        按技术栈预筛模板：模板目录在本地可解析时，用标签索引挑出相关模板写入列表文件；
+        否则退化为 -etags 排除未识别出的技术栈标签，由 nuclei 自行过滤。
+        未指定模板时使用 nuclei 默认模板集，不做预筛；预筛后没有剩余模板时返回 None
+        """
+        template_args = [arg for t in templates for arg in ("-t", t)]
+        if not templates:
+            return template_args
+        detected = detected_tags(self.base_dir, targets)
+        if detected is None:
+            self.write_log("tool_nuclei", "部分目标缺少指纹结果，不按技术栈筛选模板")
+            return template_args
+        excluded = sorted(set(TECH_TAGS.values()) - detected)
+
+        directories = []
         for t in templates:
-            cmd.extend(["-t", t])
+            path = Path(t) if Path(t).exists() else NUCLEI_TEMPLATES_HOME / t
+            if not path.exists():
+                return template_args + (["-etags", ",".join(excluded)] if excluded else [])
+            directories.append(path)
+
+        selected, total = [], 0
+        for path in directories:
+            index = TemplateIndex.load(path) if path.is_dir() else {str(path): TemplateIndex._read_tags(str(path))}
+            total += len(index)
+            selected.extend(p for p, tags in index.items() if not excluded or not set(tags) & set(excluded))
+        self.write_log("tool_nuclei", f"按技术栈 {sorted(detected) or '无'} 预筛模板: {len(selected)}/{total}",
+                       templates=len(selected), total_templates=total)
+        if not selected:
+            self.write_log("tool_nuclei", "预筛后没有与目标技术栈相关的模板，跳过扫描")
+            return None
+
+        template_list = work_dir / "templates.txt"
+        with open(template_list, "w", encoding="utf-8") as f:
+            f.write("\n".join(selected) + "\n")
+        return ["-t", str(template_list)]
 
-        self.write_log("tool_nuclei", f"执行命令: {' '.join(cmd)}")
-        self.run_tool(cmd, "tool_nuclei")
+    @staticmethod
+    def _shard_cmd(base_cmd: List[str], shard: Tuple[str, str]) -> List[str]:
+        target_file, output = shard
+        return base_cmd + ["-l", target_file, "-o", output]
 
-        # 解析输出并提取关键信息
+    def _run_shard(self, base_cmd: List[str], shard: Tuple[str, str], deadline: float) -> List[dict]:
+        timeout = max(1, int(deadline - time.monotonic()))
+        # -silent 下 stdout 仅输出 JSONL 结果，边扫边解析上报
         findings = []
-        if tmp_output.exists():
-            with open(tmp_output, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        findings.append({
-                            "target": data.get("matched-at", data.get("host")),
-                            "vulnerability": data.get("info", {}).get("name", "Unknown Vuln"),
-                            "severity": data.get("info", {}).get("severity", "info").capitalize(),
-                            "evidence": data.get("extracted-results", [data.get("matcher-name", "")])[0]
-                        })
-                    except:
-                        continue
+        for data in self.iter_jsonl(self.stream_tool(self._shard_cmd(base_cmd, shard), "tool_nuclei", timeout)):
+            finding = self._parse(data)
+            if finding is not None:
+                findings.append(finding)
+                self.emit_finding(finding)
+        return findings
+
+    async def _arun_shard(self, base_cmd: List[str], shard: Tuple[str, str], deadline: float) -> List[dict]:
+        timeout = max(1, int(deadline - time.monotonic()))
+        findings = []
+        async for name, line in self.astream_tool(self._shard_cmd(base_cmd, shard), "tool_nuclei", timeout):
+            if name != "stdout":
+                continue
+            for data in self.iter_jsonl([(name, line)]):
+                finding = self._parse(data)
+                if finding is not None:
+                    findings.append(finding)
+                    self.emit_finding(finding)
+        return findings
+
+    @staticmethod
+    def _parse(data: Dict[str, Any]) -> Optional[dict]:
+        if not isinstance(data, dict) or not data.get("template-id"):
+            return None
+        info = data.get("info") or {}
+        extracted = data.get("extracted-results") or [data.get("matcher-name", "")]
+        return {
+            "target": data.get("matched-at", data.get("host")),
+            "vulnerability": info.get("name", "Unknown Vuln"),
+            "severity": (info.get("severity") or "info").capitalize(),
+            "evidence": extracted[0] or "",
+            "template_id": data.get("template-id"),
+        }
+
+    @staticmethod
+    def _merge(findings: Dict[tuple, dict], shard_findings: List[dict]):
+        """同一模板在同一位置的命中只保留一条"""
+        for finding in shard_findings:
+            findings.setdefault((finding["template_id"], finding["target"]), finding)
 
+    def _collect_findings(self, findings: Dict[tuple, dict]) -> List[dict]:
+        results = list(findings.values())
         # 依然进行证据留存，确保符合部署合规性
-        self.save_artifact("nuclei_findings.json", {"task_id": self.task_id, "findings": findings})
-        return findings
\ No newline at end of file
+        self.save_artifact("nuclei_findings.json", {"task_id": self.task_id, "findings": results})
+        self.write_log("tool_nuclei", f"扫描完成，检测到 {len(results)} 个漏洞", findings=len(results))
+        return results
@@ -19,6 +19,7 @@ class ParamSpiderRunner(BaseRunner):
         wb_url = f"http://web.archive.org/cdx/search/cdx?url=*.{target_domain}/*&collapse=urlkey&output=text&fl=original"
         try:
             self.write_log("tool_paramspider", "正在请求 Wayback Machine API...")
+            self.throttle(wb_url)
             res = requests.get(wb_url, headers=headers, timeout=20)
             if res.status_code == 200:
                 for line in res.text.splitlines():
@@ -32,6 +33,7 @@ class ParamSpiderRunner(BaseRunner):
         otx_url = f"https://otx.alienvault.com/api/v1/indicators/domain/{target_domain}/url_list?limit=500&page=1"
         try:
             self.write_log("tool_paramspider", "正在请求 AlienVault OTX API...")
+            self.throttle(otx_url)
             res = requests.get(otx_url, headers=headers, timeout=20)
             if res.status_code == 200:
                 data = res.json()
@@ -45,6 +47,7 @@ class ParamSpiderRunner(BaseRunner):
         # 格式化输出
         results = [{"url": url} for url in findings]
         self.save_artifact("paramspider_findings.json", {"task_id": self.task_id, "findings": results})
+        self.merge_endpoints(results, source="paramspider")
 
         self.write_log("tool_paramspider", f"提取完成，共捕获 {len(results)} 个带参 URL。")
         return results
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Callable, Tuple
+from urllib.parse import urlparse
+
+from .status_store import get_status_writer
+
+# 全进程请求速率上限（次/秒），所有任务共享
+GLOBAL_RATE_LIMIT_RPS = 200.0
+# 单个目标主机的请求速率上限（次/秒），跨任务共享，防止多个任务同时压垮同一目标或触发 WAF
+HOST_RATE_LIMIT_RPS = 20.0
+# 令牌桶容量（秒）：允许的突发量 = 速率 × 该值
+BUCKET_BURST_SECONDS = 1.0
+# 端口扫描器按包计速：预算中的每个请求折算为多少个探测包
+PACKET_RATE_MULTIPLIER = 100
+# 外部工具线程/并发数上限
+MAX_TOOL_THREADS = 50
+
+
+class TokenBucket:
+    """线程安全令牌桶：reserve 预占令牌并返回需要等待的秒数，同步/异步调用方各自休眠"""
+
+    def __init__(self, rate: float, burst_seconds: float = BUCKET_BURST_SECONDS):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.capacity = max(1.0, rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate: float, burst_seconds: float = BUCKET_BURST_SECONDS):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = max(1.0, rate * burst_seconds)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+def host_of(target: str) -> str:
+    """从 URL / host:port / IP / CIDR 中提取限速用的主机键"""
+    target = (target or "").strip()
+    if not target:
+        return ""
+    if "://" in target:
+        return (urlparse(target).hostname or "").lower()
+    return target.split("/")[0].rsplit(":", 1)[0].lower()
+
+
+def _threads(rps: float, default: int = 10) -> int:
+    return max(1, min(MAX_TOOL_THREADS, default, math.ceil(rps)))
+
+
+def _per_second(rps: float) -> str:
+    return str(max(1, int(rps)))
+
+
+def split_rps(rps: float, workers: int) -> Tuple[int, float]:
+    """
+    任务预算在并发进程间均分，返回 (进程数, 每进程速率)。
+    多数工具的速率参数只接受整数（向下取整、最小为 1），进程数不超过预算的整数部分，
+    保证各进程速率之和不超过预算；预算低于 1 次/秒时只保留一个进程
+    """
+    workers = max(1, min(workers, int(rps)))
+    return workers, rps / workers
+
+
+def _delay_seconds(rps: float) -> str:
+    # 向上取整到 0.01 秒，避免舍入后间隔变短而超出预算
+    return f"{math.ceil(100 / rps) / 100:.2f}"
+
+
+# 预算速率 -> 各工具原生限速参数
+TOOL_RATE_FLAGS: Dict[str, Callable[[float], List[str]]] = {
+    "ffuf": lambda rps: ["-rate", _per_second(rps), "-t", str(_threads(rps, 50))],
+    "nuclei": lambda rps: ["-rl", _per_second(rps), "-c", str(_threads(rps, 25))],
+    "httpx": lambda rps: ["-rl", _per_second(rps), "-threads", str(_threads(rps, 50))],
+    "katana": lambda rps: ["-rl", _per_second(rps), "-c", str(_threads(rps, 10))],
+    "dnsx": lambda rps: ["-rl", _per_second(rps)],
+    "naabu": lambda rps: ["-rate", str(max(1, int(rps * PACKET_RATE_MULTIPLIER)))],
+    "afrog": lambda rps: ["-rl", _per_second(rps), "-c", str(_threads(rps, 25))],
+    "feroxbuster": lambda rps: ["--rate-limit", _per_second(rps), "-t", str(_threads(rps, 50))],
+    "dirsearch": lambda rps: ["--max-rate", _per_second(rps), "-t", str(_threads(rps, 25))],
+    "arjun": lambda rps: ["--rate-limit", _per_second(rps)],
+    # gobuster 无速率参数：按线程数折算每线程请求间隔
+    "gobuster": lambda rps: ["-t", str(_threads(rps)), "--delay", f"{int(_threads(rps) / rps * 1000)}ms"],
+    # hydra 按并发任务数控制
+    "hydra": lambda rps: ["-t", str(_threads(rps, 4))],
+    # sqlmap（默认单线程）/ nikto 按请求间隔控制
+    "sqlmap": lambda rps: ["--delay", _delay_seconds(rps)],
+    "nikto": lambda rps: ["-Pause", _delay_seconds(rps)],
+}
+
+
+class RateLimiter:
+    """
+    全局 / 单任务 / 单主机三级令牌桶。
+    任务速率取自 status.json 中的 budget.rate_limit_rps；任务未设置预算时不做任务级限制，
+    外部工具也不追加限速参数（保持工具默认行为）
+    """
+
+    def __init__(self, global_rps: float = GLOBAL_RATE_LIMIT_RPS, host_rps: float = HOST_RATE_LIMIT_RPS):
+        self.global_rps = global_rps
+        self.host_rps = host_rps
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rps)
+        self._tasks: Dict[str, TokenBucket] = {}
+        self._hosts: Dict[str, TokenBucket] = {}
+
+    def task_rps(self, task_id: str) -> Optional[float]:
+        budget = get_status_writer(task_id).get().get("budget")
+        if not isinstance(budget, dict):
+            return None
+        try:
+            rps = float(budget.get("rate_limit_rps") or 0)
+        except (TypeError, ValueError):
+            return None
+        return rps if rps > 0 else None
+
+    def effective_rps(self, task_id: str, target: str = "") -> Optional[float]:
+        """外部工具可用的速率：任务预算、目标主机与全局上限三者取小；无预算返回 None"""
+        rps = self.task_rps(task_id)
+        if rps is None:
+            return None
+        limits = [rps, self.global_rps]
+        if host_of(target):
+            limits.append(self.host_rps)
+        return min(limits)
+
+    def tool_flags(self, tool: str, task_id: str, target: str = "") -> List[str]:
+        rps = self.effective_rps(task_id, target)
+        if rps is None or tool not in TOOL_RATE_FLAGS:
+            return []
+        return TOOL_RATE_FLAGS[tool](rps)
+
+    def acquire(self, task_id: str, target: str = ""):
+        """Python 原生请求发出前调用，按三级令牌桶阻塞等待"""
+        delay = self._reserve(task_id, target)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, task_id: str, target: str = ""):
+        delay = self._reserve(task_id, target)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _reserve(self, task_id: str, target: str) -> float:
+        buckets = [self._global]
+        rps = self.task_rps(task_id)
+        if rps is not None:
+            buckets.append(self._bucket(self._tasks, task_id, rps))
+        host = host_of(target)
+        if host:
+            buckets.append(self._bucket(self._hosts, host, self.host_rps))
+        return max(bucket.reserve() for bucket in buckets)
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float) -> TokenBucket:
+        with self._lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate)
+                buckets[key] = bucket
+        if bucket.rate != rate:
+            bucket.set_rate(rate)
+        return bucket
+
+
+# 全局限速器实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,428 @@
+import importlib
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .wordlists import DIRSCAN_WORDLISTS, detect_stacks, get_wordlists
+
+RUNNER_PACKAGE = "api.v1.Penetration.runner"
+
+# 结果缓存有效期（秒）：被动侦察结果变化缓慢，主动扫描结果较快过期；0 表示不缓存
+RECON_CACHE_TTL = 6 * 3600
+SCAN_CACHE_TTL = 3600
+PORT_CACHE_TTL = 1800
+
+
+class ToolUnavailableError(RuntimeError):
+    """工具已注册但当前环境无法加载（缺少可选依赖等）"""
+
+
+def _as_list(result: Any) -> List[Dict[str, Any]]:
+    return result or []
+
+
+def _no_inputs(kwargs: Dict[str, Any]) -> List[str]:
+    return []
+
+
+def _wordlist_input(kwargs: Dict[str, Any]) -> List[str]:
+    # 与 Runner 一致地解析并预处理字典（文件名可指向 SecLists 中的字典），缓存键取预处理后的派生字典，
+    # 预处理规则变化时缓存随之失效；按技术栈过滤的差异由 cache_context 区分
+    path = get_wordlists().prepare([kwargs.get("wordlist") or ""], search=True)
+    return [str(path)] if path else []
+
+
+def _no_context(task_dir: Path, kwargs: Dict[str, Any]) -> Any:
+    return None
+
+
+def _always_cacheable(result: Any) -> bool:
+    return True
+
+
+def _stack_context(task_dir: Path, kwargs: Dict[str, Any]) -> Any:
+    # 字典按目标技术栈预筛，技术栈不同则实际使用的字典不同
+    return detect_stacks(task_dir, kwargs.get("target_url") or "")
+
+
+def _nuclei_context(task_dir: Path, kwargs: Dict[str, Any]) -> Any:
+    # 模板按目标技术栈标签预筛；未指定模板时使用 nuclei 默认模板集，不预筛
+    if not kwargs.get("templates"):
+        return None
+    from .nuclei import detected_tags
+    tags = detected_tags(task_dir, list(kwargs.get("targets") or []))
+    return sorted(tags) if tags is not None else None
+
+
+def _replay_endpoints(source: str) -> Callable[[Any, Dict[str, Any], Dict[str, Any]], None]:
+    # endpoints.json 属于任务目录，不随缓存保存；命中时把缓存的 URL 重新合并进当前任务
+    def replay(runner, kwargs: Dict[str, Any], response: Dict[str, Any]):
+        runner.merge_endpoints(response["findings"], source=source)
+    return replay
+
+
+def _replay_assets(runner, kwargs: Dict[str, Any], response: Dict[str, Any]):
+    # assets.json 同样不随缓存保存；命中时按缓存的主机列表为当前任务重写，供 httpx / hydra 等后续步骤读取
+    runner.save_artifact("assets.json", {
+        "task_id": runner.task_id,
+        "target": kwargs.get("target"),
+        "hosts": response["findings"],
+        "source": f"{kwargs.get('sweeper')}+nmap",
+        "status": "completed",
+        "cached": True,
+    })
+
+
+def _wrap_if(result: Any) -> List[Dict[str, Any]]:
+    return [result] if result else []
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    工具声明：tool_id、所在模块与 Runner 类、入口方法、参数表（参数名 -> 默认值）、
+    结果展平方式、摘要格式化函数、资源类别（用于作业队列限流），
+    以及结果缓存参数：可执行文件名（版本指纹）、有效期、参与缓存键的字典/模板路径，
+    以及由任务目录派生、影响实际输入的上下文（如按指纹预筛字典/模板时识别出的技术栈）；
+    cacheable 判断单次结果能否写入缓存（如因时间预算提前结束的不完整结果不应被后续调用复用）；
+    cache_replay 在命中缓存时对当前任务重做 Runner 本应执行的任务级写入（endpoints.json / assets.json）
+    """
+    tool_id: str
+    module: str
+    runner: str
+    method: str
+    args: Dict[str, Any]
+    summary: Callable[[Any, List[Dict[str, Any]]], str]
+    findings: Callable[[Any], List[Dict[str, Any]]] = _as_list
+    resource: str = "web"
+    binary: Optional[str] = None
+    cache_ttl: int = 0
+    cache_inputs: Callable[[Dict[str, Any]], List[str]] = _no_inputs
+    cache_context: Callable[[Path, Dict[str, Any]], Any] = _no_context
+    cacheable: Callable[[Any], bool] = _always_cacheable
+    cache_replay: Optional[Callable[[Any, Dict[str, Any], Dict[str, Any]], None]] = None
+
+    def build_kwargs(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """按参数表从请求 args 中取值，缺省项使用默认值"""
+        args = args or {}
+        return {name: args.get(name, default) for name, default in self.args.items()}
+
+
+TOOL_REGISTRY: Dict[str, ToolSpec] = {}
+
+_runner_classes: Dict[str, type] = {}
+_unavailable: Dict[str, str] = {}
+_load_lock = threading.Lock()
+
+
+def register(spec: ToolSpec) -> ToolSpec:
+    TOOL_REGISTRY[spec.tool_id] = spec
+    return spec
+
+
+def get_spec(tool_id: str) -> ToolSpec:
+    spec = TOOL_REGISTRY.get(tool_id)
+    if spec is None:
+        raise ValueError(f"未注册的 tool_id: {tool_id}")
+    return spec
+
+
+def load_runner(spec: ToolSpec) -> type:
+    """首次使用时才导入 Runner 模块；导入失败只禁用该工具，不影响其他工具"""
+    cls = _runner_classes.get(spec.tool_id)
+    if cls is not None:
+        return cls
+
+    with _load_lock:
+        cls = _runner_classes.get(spec.tool_id)
+        if cls is not None:
+            return cls
+        if spec.tool_id in _unavailable:
+            raise ToolUnavailableError(_unavailable[spec.tool_id])
+        try:
+            module = importlib.import_module(f"{RUNNER_PACKAGE}.{spec.module}")
+            cls = getattr(module, spec.runner)
+        except ImportError as e:
+            _unavailable[spec.tool_id] = f"工具 {spec.tool_id} 不可用: {e}"
+            raise ToolUnavailableError(_unavailable[spec.tool_id])
+        _runner_classes[spec.tool_id] = cls
+        return cls
+
+
+def tool_availability() -> Dict[str, Optional[str]]:
+    """已注册工具及其不可用原因（None 表示可用或尚未加载）"""
+    return {tool_id: _unavailable.get(tool_id) for tool_id in TOOL_REGISTRY}
+
+
+def _waf_summary(result, findings) -> str:
+    detected_wafs = [f.get("firewall") for f in findings if f.get("detected")]
+    waf_status = ", ".join(detected_wafs) if detected_wafs else "未检测到 WAF"
+    return f"Wafw00f 探测完成，目标 WAF 状态: {waf_status}。"
+
+
+def _dirscan_wordlist(kwargs: Dict[str, Any]) -> List[str]:
+    wordlist_type = str(kwargs.get("wordlist_type") or "").lower()
+    path = get_wordlists().prepare([DIRSCAN_WORDLISTS.get(wordlist_type, DIRSCAN_WORDLISTS["small"])])
+    return [str(path)] if path else []
+
+
+# ========================= 工具声明 ========================= #
+
+register(ToolSpec(
+    tool_id="nuclei", module="nuclei", runner="NucleiRunner", method="run_scan",
+    args={"targets": [], "templates": ["cves/", "vulnerabilities/"]},
+    summary=lambda res, findings: f"Nuclei 扫描完成，检测到 {len(findings)} 个漏洞。",
+    resource="vuln",
+    cache_ttl=SCAN_CACHE_TTL,
+    cache_inputs=lambda kw: list(kw.get("templates") or []),
+    cache_context=_nuclei_context,
+))
+
+register(ToolSpec(
+    tool_id="sqlmap", module="sqlmap", runner="SqlmapRunner", method="run_injection_test",
+    args={"target_url": "", "risk_level": 1},
+    findings=lambda res: [res] if res.get("is_vulnerable") else [],
+    summary=lambda res, findings: f"SQLMap 测试完成，漏洞状态: {res.get('is_vulnerable')}。",
+    resource="vuln",
+))
+
+register(ToolSpec(
+    tool_id="sqlmap_batch", module="sqlmap", runner="SqlmapRunner", method="run_batch_test",
+    args={"target_urls": [], "risk_level": 1, "enumerate_dbs": False},
+    findings=lambda res: [f for f in res.get("findings", []) if f.get("is_vulnerable")],
+    summary=lambda res, findings: (
+        f"SQLMap 批量测试完成，{res.get('tested', 0)} 个 URL 中 {len(findings)} 个存在注入。"
+    ),
+    resource="vuln",
+))
+
+register(ToolSpec(
+    tool_id="dirscan", module="dirscan", runner="DirScanRunner", method="run_scan",
+    args={"target_url": "", "extensions": "php,txt,zip", "wordlist_type": "small"},
+    summary=lambda res, findings: f"DirScan 完成，发现 {len(findings)} 个隐藏路径。",
+    binary="ffuf",
+    cache_ttl=SCAN_CACHE_TTL,
+    cache_inputs=_dirscan_wordlist,
+    cache_context=_stack_context,
+    cache_replay=_replay_endpoints("dirscan"),
+))
+
+register(ToolSpec(
+    tool_id="hydra", module="hydra", runner="HydraRunner", method="run_bruteforce",
+    args={"target_ip": "", "service": "", "port": 0},
+    findings=lambda res: res.get("findings", []),
+    summary=lambda res, findings: f"Hydra 爆破完成，破解状态: {res.get('is_cracked')}。",
+    resource="bruteforce",
+))
+
+register(ToolSpec(
+    tool_id="hydra_campaign", module="hydra", runner="HydraRunner", method="run_campaign",
+    args={"services": None},
+    findings=lambda res: res.get("findings", []),
+    summary=lambda res, findings: (
+        f"Hydra 批量爆破完成，{res.get('completed', 0)}/{res.get('jobs', 0)} 个服务，发现 {len(findings)} 组凭证。"
+    ),
+    resource="bruteforce",
+))
+
+register(ToolSpec(
+    tool_id="subfinder", module="subfinder", runner="SubfinderRunner", method="run_scan",
+    args={"target_domain": ""},
+    summary=lambda res, findings: f"Subfinder 枚举完成，发现 {len(findings)} 个子域名。",
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="amass", module="amass", runner="AmassRunner", method="run_scan",
+    args={"target_domain": ""},
+    summary=lambda res, findings: f"Amass 被动测绘完成，发现 {len(findings)} 个相关资产。",
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="subdomain_enum", module="subdomain", runner="SubdomainEnumRunner", method="run_enum",
+    args={"target_domain": "", "sources": [], "max_results": 0, "time_budget": 0},
+    findings=lambda res: res.get("findings", []),
+    summary=lambda res, findings: (
+        f"子域名枚举完成，{len(res.get('sources', {}))} 个数据源去重后发现 {len(findings)} 个子域名"
+        + (f"（达到{'结果数上限' if res.get('stopped') == 'max_results' else '时间预算'}提前结束）"
+           if res.get("stopped") else "") + "。"
+    ),
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+    # 达到时间预算 / 结果数上限提前结束的结果不完整，不缓存
+    cacheable=lambda res: not res.get("stopped"),
+))
+
+register(ToolSpec(
+    tool_id="dnsx", module="dnsx", runner="DnsxRunner", method="run_scan",
+    args={"subdomains": [], "resolvers": []},
+    summary=lambda res, findings: f"Dnsx 存活解析完成，确认存活 {len(findings)} 个记录。",
+    resource="recon",
+    cache_ttl=SCAN_CACHE_TTL,
+    # 未指定 resolvers 时使用的解析器列表（见 dnsx.DNSX_RESOLVERS_PATH）
+    cache_inputs=lambda kw: [] if kw.get("resolvers") else ["config/resolvers.txt"],
+))
+
+register(ToolSpec(
+    tool_id="oneforall", module="oneforall", runner="OneForAllRunner", method="run_scan",
+    args={"target_domain": ""},
+    summary=lambda res, findings: f"OneForAll 扫描完成，发现 {len(findings)} 个子域名。",
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="gau", module="gun", runner="GauRunner", method="run_scan",
+    args={"target_domain": ""},
+    summary=lambda res, findings: f"Gau 历史 URL 提取完成，发现 {len(findings)} 条记录。",
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+    cache_replay=_replay_endpoints("gau"),
+))
+
+register(ToolSpec(
+    tool_id="theharvester", module="theharvester", runner="TheHarvesterRunner", method="run_scan",
+    args={"target_domain": "", "source": "all"},
+    # 展平封装格式以符合 UnifiedToolResponse
+    findings=lambda res: [res],
+    summary=lambda res, findings: (
+        f"theHarvester 收集完成，提取 {len(res.get('emails', []))} 个邮箱及 {len(res.get('hosts', []))} 个主机。"
+    ),
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="trufflehog", module="trufflehog", runner="TrufflehogRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"Trufflehog 扫描完成，发现 {len(findings)} 处代码凭证泄露。",
+    resource="recon",
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="shodan", module="shodan", runner="ShodanRunner", method="run_scan",
+    args={"target_ip": ""},
+    findings=_wrap_if,
+    summary=lambda res, findings: (
+        f"Shodan 检索完成，目标系统: {res.get('os', 'Unknown')}，开放端口: {res.get('ports', [])}。"
+    ),
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="masscan", module="masscan", runner="MasscanRunner", method="run_scan",
+    args={"target_ip": "", "ports": "1-65535", "rate": 1000},
+    summary=lambda res, findings: f"Masscan 扫描完成，发现 {len(findings)} 个开放端口。",
+    resource="scan",
+    cache_ttl=PORT_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="discovery", module="discovery", runner="DiscoveryPipelineRunner", method="run_pipeline",
+    args={"target": "", "ports": "1-65535", "sweeper": "naabu", "rate": 1000},
+    findings=lambda res: res.get("hosts", []),
+    summary=lambda res, findings: (
+        f"资产发现流水线完成，{len(findings)} 个主机共 {sum(len(h.get('ports', [])) for h in findings)} 个开放端口。"
+    ),
+    resource="scan",
+    binary="nmap",
+    cache_ttl=PORT_CACHE_TTL,
+    # 超出时间预算的分片未执行，结果不完整
+    cacheable=lambda res: res.get("status") != "partial",
+    cache_replay=_replay_assets,
+))
+
+register(ToolSpec(
+    tool_id="naabu", module="naabu", runner="NaabuRunner", method="run_scan",
+    args={"target": ""},
+    summary=lambda res, findings: f"Naabu 扫描完成，确认 {len(findings)} 个存活端口。",
+    resource="scan",
+    cache_ttl=PORT_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="whatweb", module="whatweb", runner="WhatWebRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: (
+        f"WhatWeb 指纹识别完成，探测到 {len(findings[0].get('plugins', {})) if findings else 0} 项技术特征。"
+    ),
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="wafw00f", module="wafw00f", runner="Wafw00fRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=_waf_summary,
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="arjun", module="arjun", runner="ArjunRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"Arjun 参数爆破完成，发现 {len(findings)} 个隐藏参数。",
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="paramspider", module="paramspider", runner="ParamSpiderRunner", method="run_scan",
+    args={"target_domain": ""},
+    summary=lambda res, findings: f"ParamSpider 运行完成，捕获 {len(findings)} 个带参 URL。",
+    resource="recon",
+    cache_ttl=RECON_CACHE_TTL,
+    cache_replay=_replay_endpoints("paramspider"),
+))
+
+register(ToolSpec(
+    tool_id="dirsearch", module="dirsearch", runner="DirsearchRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"Dirsearch 扫描完成，发现 {len(findings)} 个路径。",
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="feroxbuster", module="feroxbuster", runner="FeroxbusterRunner", method="run_scan",
+    args={"target_url": "", "wordlist": "common.txt"},
+    summary=lambda res, findings: f"Feroxbuster 递归发现完成，识别 {len(findings)} 个有效资源。",
+    cache_ttl=SCAN_CACHE_TTL,
+    cache_inputs=_wordlist_input,
+    cache_context=_stack_context,
+    cache_replay=_replay_endpoints("feroxbuster"),
+))
+
+register(ToolSpec(
+    tool_id="gobuster", module="gobuster", runner="GobusterRunner", method="run_scan",
+    args={"target_url": "", "wordlist": "common.txt"},
+    summary=lambda res, findings: f"Gobuster 枚举完成，探测到 {len(findings)} 个目录/文件。",
+    cache_ttl=SCAN_CACHE_TTL,
+    cache_inputs=_wordlist_input,
+    cache_context=_stack_context,
+))
+
+register(ToolSpec(
+    tool_id="xray", module="xray", runner="XrayRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"xray 主动扫描完成，发现 {len(findings)} 个潜在漏洞。",
+    resource="vuln",
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="afrog", module="afrog", runner="AfrogRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"afrog 模板扫描完成，命中 {len(findings)} 个有效 POC。",
+    resource="vuln",
+    cache_ttl=SCAN_CACHE_TTL,
+))
+
+register(ToolSpec(
+    tool_id="nikto", module="nikto", runner="NiktoRunner", method="run_scan",
+    args={"target_url": ""},
+    summary=lambda res, findings: f"Nikto 配置扫描完成，识别出 {len(findings)} 个服务器配置风险或过时组件。",
+    cache_ttl=SCAN_CACHE_TTL,
+))
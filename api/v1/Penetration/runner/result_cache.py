@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+from .status_store import atomic_write_json
+
+# 结果缓存目录（跨任务共享）
+CACHE_DIR = Path("runs/_cache/results")
+# 缓存总大小与条目数上限，超过后按最近最少使用淘汰
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_MAX_ENTRIES = 5000
+# 单个产物文件超过该大小时不随缓存保存
+CACHE_MAX_ARTIFACT_BYTES = 32 * 1024 * 1024
+
+CACHE_MODES = ("bypass", "prefer", "only")
+
+# 不随缓存保存的任务目录条目；endpoints.json / assets.json 由多个工具合并写入，
+# 内容属于整个任务而非单次工具执行，不能从其他任务的缓存中恢复
+_SKIP_ARTIFACTS = {"status.json", "logs", "jobs", "endpoints.json", "assets.json"}
+
+
+class CacheMissError(LookupError):
+    """cache=only 且缓存未命中"""
+
+
+def normalize_args(value: Any) -> Any:
+    """参数归一化：字符串去首尾空白，标量列表去重排序，字典按键排序"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: normalize_args(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        items = [normalize_args(v) for v in value]
+        if all(isinstance(v, (str, int, float)) for v in items):
+            return sorted(set(items), key=str)
+        return items
+    return value
+
+
+class _Fingerprints:
+    """可执行文件与输入文件（字典/模板）的指纹，按 (mtime, size) 缓存避免重复计算哈希"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[Any, str]] = {}
+
+    def binary(self, name: Optional[str]) -> str:
+        if not name:
+            return ""
+        candidates = [
+            os.path.abspath(os.path.join(os.getcwd(), f"{name}.exe")),
+            os.path.abspath(os.path.join(os.getcwd(), name)),
+            shutil.which(name),
+        ]
+        for path in candidates:
+            if path and os.path.isfile(path):
+                st = os.stat(path)
+                return f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}"
+        return ""
+
+    def path(self, path: str) -> str:
+        """文件取内容哈希，目录取文件清单（相对路径、大小、修改时间）的哈希"""
+        full = os.path.abspath(os.path.join(os.getcwd(), path))
+        try:
+            st = os.stat(full)
+        except OSError:
+            return ""
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._hashes.get(full)
+            if cached is not None and cached[0] == sig:
+                return cached[1]
+
+        h = hashlib.sha256()
+        if os.path.isdir(full):
+            for root, dirs, files in os.walk(full):
+                dirs.sort()
+                for fn in sorted(files):
+                    fst = os.stat(os.path.join(root, fn))
+                    h.update(f"{os.path.relpath(os.path.join(root, fn), full)}:{fst.st_size}:{fst.st_mtime_ns}\n".encode())
+        else:
+            with open(full, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._hashes[full] = (sig, digest)
+        return digest
+
+
+class ResultCache:
+    """
+    工具结果缓存：键为 (tool_id, 归一化参数, 工具版本指纹, 字典/模板哈希) 的 SHA-256，
+    条目存放于 runs/_cache/results/{key}/，进程内维护 LRU 索引；
+    命中时同时恢复该次执行写入任务目录的产物文件，保证后续阶段可读取
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # key -> (expires_at, size)，按访问顺序排列
+        self._index: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self.fingerprints = _Fingerprints()
+
+    # ------------------------------
+    # 键
+    # ------------------------------
+    def make_key(self, spec, kwargs: Dict[str, Any], task_dir: Path) -> str:
+        inputs = {p: self.fingerprints.path(p) for p in spec.cache_inputs(kwargs)}
+        material = {
+            "tool_id": spec.tool_id,
+            "args": normalize_args(kwargs),
+            "binary": self.fingerprints.binary(spec.binary or spec.tool_id),
+            "inputs": inputs,
+            "context": spec.cache_context(task_dir, kwargs),
+        }
+        raw = json.dumps(material, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------
+    # 读写
+    # ------------------------------
+    def get(self, key: str, task_dir: Path, task_id: str) -> Optional[Dict[str, Any]]:
+        """命中返回缓存结果并把产物恢复到任务目录（覆盖同名文件，使磁盘产物与返回结果一致）"""
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._index.get(key) or self._load_entry(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._drop(key)
+                return None
+            self._index.move_to_end(key)
+
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(entry_dir / "result.json", "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except Exception:
+            with self._lock:
+                self._drop(key)
+            return None
+
+        artifact_dir = entry_dir / "artifacts"
+        if artifact_dir.is_dir():
+            task_dir.mkdir(parents=True, exist_ok=True)
+            for src in artifact_dir.iterdir():
+                if src.name not in _SKIP_ARTIFACTS:
+                    self._restore(src, task_dir / src.name, task_id)
+        return result
+
+    @staticmethod
+    def _restore(src: Path, dst: Path, task_id: str):
+        """JSON 产物中的 task_id 改写为当前任务，其余文件原样复制；均先写临时文件再替换"""
+        if src.suffix == ".json":
+            try:
+                with open(src, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+            if isinstance(data, dict) and "task_id" in data:
+                data["task_id"] = task_id
+                atomic_write_json(dst, data)
+                return
+        tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+    def put(self, key: str, spec, result: Dict[str, Any], artifacts: List[Path]):
+        self._ensure_loaded()
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        (tmp_dir / "artifacts").mkdir(parents=True, exist_ok=True)
+
+        size = 0
+        for path in artifacts:
+            if path.name in _SKIP_ARTIFACTS:
+                continue
+            try:
+                if path.is_file() and path.stat().st_size <= CACHE_MAX_ARTIFACT_BYTES:
+                    shutil.copy2(path, tmp_dir / "artifacts" / path.name)
+                    size += path.stat().st_size
+            except OSError:
+                continue
+
+        expires_at = time.time() + spec.cache_ttl
+        atomic_write_json(tmp_dir / "result.json", result)
+        size += (tmp_dir / "result.json").stat().st_size
+        atomic_write_json(tmp_dir / "meta.json", {
+            "tool_id": spec.tool_id,
+            "created_at": time.time(),
+            "expires_at": expires_at,
+            "size": size,
+        })
+
+        with self._lock:
+            self._drop(key)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # 其他进程已写入同一键，保留对方的条目
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            self._index[key] = (expires_at, size)
+            self._total_bytes += size
+            self._evict()
+
+    # ------------------------------
+    # 索引维护
+    # ------------------------------
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def _ensure_loaded(self):
+        """首次使用时扫描缓存目录重建索引（按创建时间近似访问顺序）"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            entries = []
+            if self.cache_dir.exists():
+                for meta_path in self.cache_dir.glob("*/meta.json"):
+                    if "." in meta_path.parent.name:
+                        continue  # 未完成写入的临时目录
+                    try:
+                        with open(meta_path, "r", encoding="utf-8") as f:
+                            meta = json.load(f)
+                        entries.append((meta["created_at"], meta_path.parent.name, meta["expires_at"], meta["size"]))
+                    except Exception:
+                        continue
+            for _, key, expires_at, size in sorted(entries):
+                self._index[key] = (expires_at, size)
+                self._total_bytes += size
+            self._loaded = True
+            self._evict()
+
+    def _load_entry(self, key: str) -> Optional[Tuple[float, int]]:
+        """索引未命中时检查磁盘，拾取其他 worker 进程写入的条目"""
+        try:
+            with open(self._entry_dir(key) / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            return None
+        entry = (meta["expires_at"], meta["size"])
+        self._index[key] = entry
+        self._total_bytes += entry[1]
+        return entry
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._index.items() if expires_at < now]:
+            self._drop(key)
+        while self._index and (self._total_bytes > CACHE_MAX_BYTES or len(self._index) > CACHE_MAX_ENTRIES):
+            self._drop(next(iter(self._index)))
+
+
+def snapshot_artifacts(task_dir: Path) -> Dict[str, int]:
+    """记录任务目录顶层产物文件的修改时间，用于识别一次工具执行新写入的产物"""
+    snapshot = {}
+    if task_dir.is_dir():
+        for entry in os.scandir(task_dir):
+            if entry.is_file() and not entry.name.startswith(".") and entry.name not in _SKIP_ARTIFACTS:
+                snapshot[entry.name] = entry.stat().st_mtime_ns
+    return snapshot
+
+
+def changed_artifacts(task_dir: Path, before: Dict[str, int]) -> List[Path]:
+    after = snapshot_artifacts(task_dir)
+    return [task_dir / name for name, mtime in after.items() if before.get(name) != mtime]
+
+
+# 全局结果缓存实例
+result_cache = ResultCache()
@@ -1,16 +1,45 @@
-import os
+import asyncio
+import csv
 import re
-from typing import List, Dict, Any
+import secrets
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+from urllib.parse import urlsplit
 from .base import BaseRunner
+from .endpoint_index import template_url
+from .ratelimit import TOOL_RATE_FLAGS
+
+# 每个 sqlmap 进程（-m 批量文件）包含的 URL 数，以及同时运行的 sqlmap 进程数
+SQLMAP_BATCH_SIZE = 20
+SQLMAP_WORKERS = 4
+
+# sqlmap 会话日志中的数据库枚举结果: available databases [2]:\n[*] db1\n[*] db2
+_DATABASES_BLOCK = re.compile(r"available databases \[\d+\]:\s*\n((?:\[\*\] .+\n?)+)")
 
 
 class SqlmapRunner(BaseRunner):
     """独立 SQLMap 注入探测工具执行器"""
 
-    def run_injection_test(self, target_url: str, risk_level: int) -> Dict[str, Any]:
+    def run_injection_test(self, target_url: str, risk_level: int, enumerate_dbs: bool = True) -> Dict[str, Any]:
+        if not target_url:
+            return {"is_vulnerable": False, "databases": [], "evidence_log": "No URL provided."}
+
+        cmd = self._prepare_test(target_url, risk_level, enumerate_dbs)
+        output = self.run_tool(cmd, "tool_sqlmap")
+        return self._parse_result(target_url, output)
+
+    async def arun_injection_test(self, target_url: str, risk_level: int,
+                                  enumerate_dbs: bool = True) -> Dict[str, Any]:
+        """run_injection_test 的异步版本"""
         if not target_url:
             return {"is_vulnerable": False, "databases": [], "evidence_log": "No URL provided."}
 
+        cmd = self._prepare_test(target_url, risk_level, enumerate_dbs)
+        output = await self.arun_tool(cmd, "tool_sqlmap")
+        return self._parse_result(target_url, output)
+
+    def _prepare_test(self, target_url: str, risk_level: int, enumerate_dbs: bool = True) -> list:
         self.write_log("tool_sqlmap", f"接收到 SQLMap 测试请求，目标: {target_url}")
 
         # 构造外部命令
@@ -20,14 +49,17 @@ class SqlmapRunner(BaseRunner):
         binary = "sqlmap"  # 假设 sqlmap 已配置在系统环境变量中
         cmd = [
             binary, "-u", target_url,
-            "--batch", "--dbs",
+            "--batch",
+            *(["--dbs"] if enumerate_dbs else []),
             f"--level={min(risk_level, 5)}",
-            f"--risk={min(risk_level, 3)}"
+            f"--risk={min(risk_level, 3)}",
+            *self.rate_limit_flags("sqlmap", target_url)
         ]
 
         self.write_log("tool_sqlmap", f"执行命令: {' '.join(cmd)}")
-        output = self.run_tool(cmd, "tool_sqlmap")
+        return cmd
 
+    def _parse_result(self, target_url: str, output) -> Dict[str, Any]:
         # 解析 SQLMap 的标准输出
         is_vulnerable = False
         databases = []
@@ -56,4 +88,169 @@ class SqlmapRunner(BaseRunner):
 
         # 证据留存
         self.save_artifact("sqlmap_findings.json", {"task_id": self.task_id, "sqlmap_result": finding})
-        return finding
\ No newline at end of file
+        return finding
+
+    # ========================= 批量模式 ========================= #
+
+    def run_batch_test(self, target_urls: List[str], risk_level: int = 1,
+                       enumerate_dbs: bool = False) -> Dict[str, Any]:
+        """
+        批量注入探测：URL 按参数模板去重后写入 -m 批量文件，多个 sqlmap 进程并行执行，
+        每个进程使用独立的 --output-dir，结果取自 --results-file CSV 与会话日志
+        """
+        shards, dropped = self._prepare_batch(target_urls)
+        if not shards:
+            return self._finish_batch(target_urls, [], {}, dropped)
+
+        deadline = time.monotonic() + self._get_budget_timeout()
+        runs = self.map_shards(lambda shard: self._run_shard(shard, risk_level, enumerate_dbs, deadline), shards,
+                               SQLMAP_WORKERS, "sqlmap", deadline=deadline)
+        for done, _ in enumerate(runs, 1):
+            self.write_log("tool_sqlmap", f"批量探测进度 {done}/{len(shards)}")
+        return self._finish_batch(target_urls, shards, self._collect_batch(shards), dropped)
+
+    async def arun_batch_test(self, target_urls: List[str], risk_level: int = 1,
+                              enumerate_dbs: bool = False) -> Dict[str, Any]:
+        """run_batch_test 的异步版本"""
+        shards, dropped = self._prepare_batch(target_urls)
+        if not shards:
+            return self._finish_batch(target_urls, [], {}, dropped)
+
+        deadline = time.monotonic() + self._get_budget_timeout()
+        semaphore = asyncio.Semaphore(SQLMAP_WORKERS)
+
+        async def _run(shard):
+            async with semaphore:
+                timeout = max(1, int(deadline - time.monotonic()))
+                await self.arun_tool(self._shard_cmd(shard, risk_level, enumerate_dbs), "tool_sqlmap", timeout)
+
+        await asyncio.gather(*(_run(shard) for shard in shards))
+        return self._finish_batch(target_urls, shards, self._collect_batch(shards), dropped)
+
+    def _prepare_batch(self, target_urls: List[str]) -> Tuple[List[Dict[str, Any]], int]:
+        # 只测试带参数的 URL，同一参数模板（如 /item?id={int}）只测一次
+        unique: Dict[str, str] = {}
+        for url in target_urls or []:
+            url = (url or "").strip()
+            if "?" not in url or "=" not in url:
+                continue
+            unique.setdefault(template_url(url), url)
+        urls = list(unique.values())
+        dropped = len(target_urls or []) - len(urls)
+        self.write_log("tool_sqlmap", f"接收到批量 SQLMap 测试请求，{len(target_urls or [])} 个 URL 去重后 {len(urls)} 个",
+                       received=len(target_urls or []), unique=len(urls))
+
+        # 每次批量探测使用独立目录：旧的 log / session.sqlite 不会被解析或被 sqlmap 当作会话续用，
+        # 同一任务内并发的批量作业也互不干扰
+        work_dir = self.base_dir / "sqlmap" / f"run_{time.strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(3)}"
+        shards = []
+        for i in range(0, len(urls), SQLMAP_BATCH_SIZE):
+            shard_dir = work_dir / f"shard_{i // SQLMAP_BATCH_SIZE:04d}"
+            shard_dir.mkdir(parents=True, exist_ok=True)
+            bulk_file = shard_dir / "targets.txt"
+            with open(bulk_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(urls[i:i + SQLMAP_BATCH_SIZE]) + "\n")
+            results_file = shard_dir / "results.csv"
+            shards.append({"dir": shard_dir, "bulk_file": bulk_file, "results_file": results_file,
+                           "urls": urls[i:i + SQLMAP_BATCH_SIZE]})
+
+        # 各进程共享任务预算，请求间隔按并行进程数放大
+        rps = self.rate_limit_rps(urls[0] if len(urls) == 1 else "")
+        rate_flags = TOOL_RATE_FLAGS["sqlmap"](rps / min(SQLMAP_WORKERS, len(shards))) if rps and shards else []
+        for shard in shards:
+            shard["rate_flags"] = rate_flags
+        return shards, dropped
+
+    def _shard_cmd(self, shard: Dict[str, Any], risk_level: int, enumerate_dbs: bool) -> List[str]:
+        binary = "sqlmap"  # 假设 sqlmap 已配置在系统环境变量中
+        cmd = [
+            binary, "-m", str(shard["bulk_file"]),
+            "--batch",
+            f"--output-dir={shard['dir'] / 'output'}",
+            f"--results-file={shard['results_file']}",
+            f"--level={min(risk_level, 5)}",
+            f"--risk={min(risk_level, 3)}",
+        ]
+        if enumerate_dbs:
+            cmd.append("--dbs")
+        return cmd + shard["rate_flags"]
+
+    def _run_shard(self, shard: Dict[str, Any], risk_level: int, enumerate_dbs: bool, deadline: float):
+        timeout = max(1, int(deadline - time.monotonic()))
+        self.run_tool(self._shard_cmd(shard, risk_level, enumerate_dbs), "tool_sqlmap", timeout)
+
+    def _collect_batch(self, shards: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """解析各分片的 CSV 结果与会话日志，返回 参数模板 -> {injections, databases}"""
+        results: Dict[str, Dict[str, Any]] = {}
+        for shard in shards:
+            host_databases = self._read_databases(shard["dir"] / "output")
+            if not shard["results_file"].exists():
+                continue
+            with open(shard["results_file"], "r", encoding="utf-8", errors="replace", newline="") as f:
+                for row in csv.DictReader(f):
+                    url = (row.get("Target URL") or "").strip()
+                    if not url or not row.get("Parameter"):
+                        continue
+                    entry = results.setdefault(template_url(url), {"injections": [], "databases": []})
+                    entry["injections"].append({
+                        "place": row.get("Place"),
+                        "parameter": row.get("Parameter"),
+                        "techniques": row.get("Technique(s)"),
+                        "note": row.get("Note(s)") or None,
+                    })
+                    entry["databases"] = host_databases.get(urlsplit(url).hostname or "", [])
+        return results
+
+    @staticmethod
+    def _read_databases(output_dir: Path) -> Dict[str, List[str]]:
+        """sqlmap 在 --output-dir/<host>/log 中记录每个主机的利用结果，从中提取数据库枚举结果"""
+        databases: Dict[str, List[str]] = {}
+        if not output_dir.exists():
+            return databases
+        for log_path in output_dir.glob("*/log"):
+            try:
+                text = log_path.read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                continue
+            names = []
+            for block in _DATABASES_BLOCK.findall(text):
+                names.extend(line[4:].strip() for line in block.splitlines() if line.startswith("[*] "))
+            if names:
+                databases[log_path.parent.name] = list(dict.fromkeys(names))
+        return databases
+
+    def _finish_batch(self, target_urls: List[str], shards: List[Dict[str, Any]],
+                      results: Dict[str, Dict[str, Any]], dropped: int) -> Dict[str, Any]:
+        findings = []
+        for shard in shards:
+            for url in shard["urls"]:
+                entry = results.get(template_url(url))
+                if entry:
+                    params = ", ".join(f"{i['place']} {i['parameter']} ({i['techniques']})" for i in entry["injections"])
+                    evidence = f"Injection point identified: {params}"
+                    if entry["databases"]:
+                        evidence += f"; databases: {', '.join(entry['databases'])}"
+                else:
+                    evidence = "No injection points found."
+                findings.append({
+                    "url": url,
+                    "is_vulnerable": bool(entry),
+                    "databases": entry["databases"] if entry else [],
+                    "evidence_log": evidence,
+                    "injections": entry["injections"] if entry else [],
+                })
+
+        vulnerable = sum(1 for f in findings if f["is_vulnerable"])
+        result = {
+            "task_id": self.task_id,
+            "total": len(target_urls or []),
+            "tested": len(findings),
+            "skipped": dropped,
+            "vulnerable": vulnerable,
+            "findings": findings,
+        }
+        # 证据留存
+        self.save_artifact("sqlmap_batch_findings.json", result)
+        self.write_log("tool_sqlmap", f"批量探测完成，{len(findings)} 个 URL 中 {vulnerable} 个存在注入",
+                       tested=len(findings), vulnerable=vulnerable)
+        return result
@@ -0,0 +1,191 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 合并写入窗口（秒）：窗口内的多次 update 只触发一次落盘
+FLUSH_DELAY = 0.2
+# Windows 下目标文件被其他进程占用时 os.replace 的重试次数
+REPLACE_RETRIES = 5
+
+
+@contextmanager
+def file_lock(lock_path: Path):
+    """跨进程文件锁（POSIX flock / Windows msvcrt.locking）"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def try_lock(lock_path: Path):
+    """非阻塞获取跨进程文件锁：成功返回持有锁的文件对象（关闭即释放），锁已被其他进程持有时返回 None"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(lock_path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def atomic_write_json(path: Path, data: Dict[str, Any]):
+    """写临时文件后 rename 替换，读者只会看到完整的旧文件或新文件"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                os.remove(tmp_path)
+                raise
+            time.sleep(0.05)
+
+
+class StatusWriter:
+    """
+    单任务 status.json 写入器：进程内保存最新状态，合并短时间内的多次更新为一次原子落盘，
+    落盘时持有文件锁并与磁盘上其他进程写入的字段合并
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.path = Path(f"runs/{task_id}/status.json")
+        self.lock_path = Path(f"runs/{task_id}/.status.lock")
+        self._lock = threading.RLock()
+        self._state: Dict[str, Any] = {}
+        self._pending: Dict[str, Any] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._disk_sig = None
+        self._refresh()
+
+    def exists(self) -> bool:
+        with self._lock:
+            return bool(self._state) or bool(self._pending) or self.path.exists()
+
+    def get(self) -> Dict[str, Any]:
+        """当前状态快照（磁盘被其他进程修改时先合并磁盘内容）"""
+        with self._lock:
+            self._refresh()
+            return dict(self._state)
+
+    def update(self, status_update: Dict[str, Any], flush: bool = False):
+        with self._lock:
+            status_update = dict(status_update)
+            status_update["task_id"] = self.task_id
+            status_update["updated_at"] = datetime.now().isoformat()
+            self._state.update(status_update)
+            self._pending.update(status_update)
+
+            if flush:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(FLUSH_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.lock_path):
+                merged = self._read_disk()
+                if merged is None:
+                    merged = dict(self._state)
+                merged.update(self._pending)
+                atomic_write_json(self.path, merged)
+                self._disk_sig = self._signature()
+            self._state = merged
+            self._pending = {}
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _read_disk(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else None
+        except Exception:
+            return None
+
+    def _refresh(self):
+        sig = self._signature()
+        if sig is None or sig == self._disk_sig:
+            return
+        disk = self._read_disk()
+        self._disk_sig = sig
+        if disk is not None:
+            disk.update(self._pending)
+            self._state = disk
+
+
+_writers: Dict[str, StatusWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_status_writer(task_id: str) -> StatusWriter:
+    """按 task_id 复用同一写入器，同进程内所有 Runner 共享内存状态"""
+    writer = _writers.get(task_id)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(task_id)
+            if writer is None:
+                writer = StatusWriter(task_id)
+                _writers[task_id] = writer
+    return writer
+
+
+@atexit.register
+def flush_all():
+    for writer in list(_writers.values()):
+        try:
+            writer.flush()
+        except Exception:
+            pass
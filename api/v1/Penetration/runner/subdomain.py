@@ -0,0 +1,147 @@
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from .base import BaseRunner
+
+# 默认启用的数据源（按输出速度排列），均为被动收集
+SUBDOMAIN_SOURCES = ("subfinder", "amass", "oneforall", "theharvester")
+# 进度刷新间隔（新增子域名数）
+SUBDOMAIN_FLUSH_EVERY = 50
+
+
+class SubdomainEnumRunner(BaseRunner):
+    """
+    统一子域名枚举：所选数据源并行执行，输出行中的子域名实时汇入共享去重集合并记录来源；
+    达到时间预算或结果数上限时终止全部数据源，耗时取最慢数据源而非各数据源之和
+    """
+
+    def run_enum(self, target_domain: str, sources: Optional[List[str]] = None,
+                 max_results: int = 0, time_budget: int = 0) -> Dict[str, Any]:
+        domain = (target_domain or "").strip().lower().rstrip(".")
+        selected = [s.lower() for s in sources] if sources else list(SUBDOMAIN_SOURCES)
+        result = {"task_id": self.task_id, "domain": domain, "total": 0, "stopped": None,
+                  "sources": {}, "findings": []}
+        if not domain:
+            return result
+
+        unknown = [s for s in selected if s not in SUBDOMAIN_SOURCES]
+        if unknown:
+            raise ValueError(f"未知的子域名数据源: {', '.join(unknown)}，可选: {', '.join(SUBDOMAIN_SOURCES)}")
+
+        budget = min(time_budget, self._get_budget_timeout()) if time_budget else self._get_budget_timeout()
+        self.write_log("tool_subdomain", f"启动子域名枚举，目标: {domain}，数据源: {', '.join(selected)}，"
+                                         f"时间预算 {budget} 秒，结果上限 {max_results or '不限'}")
+
+        # host -> 来源列表（按发现顺序）；所有数据源线程共享
+        self._hosts: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._max_results = max_results
+        # 只允许开头的通配标签 "*."（入库时去掉），标签内部不能出现 *
+        self._pattern = re.compile(r"(?<![a-z0-9_.*-])(?:\*\.)?((?:[a-z0-9_-]+\.)*" + re.escape(domain)
+                                   + r")(?![a-z0-9-])", re.IGNORECASE)
+        deadline = time.monotonic() + budget
+
+        for name, stats in self.map_shards(lambda source: self._run_source(source, domain, deadline), selected,
+                                           len(selected), "subdomain"):
+            result["sources"][name] = stats
+            self.write_log("tool_subdomain", f"数据源 {name} 结束: {stats['status']}，返回 {stats['found']} 个子域名")
+
+        if len(self._hosts) >= max_results > 0:
+            result["stopped"] = "max_results"
+        elif time.monotonic() >= deadline:
+            result["stopped"] = "time_budget"
+        self._finish(result)
+        self.write_log("tool_subdomain", f"子域名枚举完成，去重后 {result['total']} 个", total=result["total"])
+        return result
+
+    def _run_source(self, name: str, domain: str, deadline: float) -> Dict[str, Any]:
+        stats = {"status": "completed", "found": 0, "new": 0}
+        source = self._build_source(name, domain)
+        if source is None:
+            stats["status"] = "unavailable"
+            return stats
+        cmd, output_file = source
+        if output_file is not None and output_file.exists():
+            output_file.unlink()
+
+        # 向上取整，保证数据源运行到截止时间为止
+        timeout = math.ceil(deadline - time.monotonic())
+        if timeout <= 0 or self._stop.is_set():
+            stats["status"] = "skipped"
+            return stats
+
+        seen = set()
+        for stream, line in self.stream_tool(cmd, f"tool_subdomain_{name}", timeout, stop=self._stop.is_set):
+            if stream == "stdout":
+                self._ingest(name, line, seen, stats)
+        # 只在结束时写出结果文件的数据源（oneforall / theHarvester），从文件中提取
+        if output_file is not None and output_file.exists() and not self._stop.is_set():
+            with open(output_file, "r", encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    self._ingest(name, line, seen, stats)
+
+        if self._stop.is_set():
+            stats["status"] = "stopped"
+        elif time.monotonic() >= deadline:
+            stats["status"] = "timeout"
+        return stats
+
+    def _build_source(self, name: str, domain: str):
+        """返回 (命令, 结束后需解析的输出文件或 None)；工具不可用时返回 None"""
+        if name in ("subfinder", "amass"):
+            binary_path = os.path.abspath(os.path.join(os.getcwd(), f"{name}.exe"))
+            binary = binary_path if os.path.exists(binary_path) else shutil.which(name)
+            if binary is None:
+                self.write_log("tool_subdomain", f"未找到 {name}，跳过该数据源")
+                return None
+            if name == "subfinder":
+                # -silent 下每发现一个子域名输出一行
+                return [binary, "-d", domain, "-silent"], None
+            return [binary, "enum", "-passive", "-d", domain], None
+
+        script_dir, script_name, output = {
+            "oneforall": ("oneforall", "oneforall.py", self.base_dir / "subdomain_oneforall.json"),
+            "theharvester": ("theHarvester", "theHarvester.py", self.base_dir / "subdomain_harvester.json"),
+        }[name]
+        script_path = os.path.abspath(os.path.join(os.getcwd(), script_dir, script_name))
+        if not os.path.exists(script_path):
+            self.write_log("tool_subdomain", f"未找到脚本: {script_path}，跳过该数据源")
+            return None
+        if name == "oneforall":
+            return ["python", script_path, "--target", domain, "--fmt", "json", "--path", str(output), "run"], output
+        # theHarvester 会自动在指定路径后追加 .json 后缀
+        return ["python", script_path, "-d", domain, "-b", "all", "-f", str(output.with_suffix(""))], output
+
+    def _ingest(self, source: str, line: str, seen: set, stats: Dict[str, Any]):
+        for match in self._pattern.findall(line):
+            host = match.lower()
+            if host in seen:
+                continue
+            seen.add(host)
+            stats["found"] += 1
+            with self._lock:
+                sources = self._hosts.get(host)
+                if sources is not None:
+                    sources.append(source)
+                    continue
+                if self._stop.is_set():
+                    return
+                self._hosts[host] = [source]
+                total = len(self._hosts)
+                if total >= self._max_results > 0:
+                    self._stop.set()
+            stats["new"] += 1
+            self.emit_finding({"host": host, "source": source})
+            if total % SUBDOMAIN_FLUSH_EVERY == 0:
+                self.update_status({"hint": f"子域名枚举进度：已发现 {total} 个"})
+
+    def _finish(self, result: Dict[str, Any]):
+        result["findings"] = [{"host": host, "sources": sources} for host, sources in self._hosts.items()]
+        result["total"] = len(result["findings"])
+        self.save_artifact("subdomain_findings.json", result)
@@ -0,0 +1,173 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# 日志队列上限：队列满时调用方最多阻塞 LOG_PUT_TIMEOUT 秒，仍无法入队则丢弃并计数
+LOG_QUEUE_SIZE = 10000
+LOG_PUT_TIMEOUT = 1.0
+# 单文件缓冲达到该字节数，或距上次落盘超过该秒数时写入磁盘
+FLUSH_BYTES = 64 * 1024
+FLUSH_INTERVAL = 1.0
+# 按大小轮转：超过 LOG_MAX_BYTES 时 xxx.log -> xxx.log.1 -> ... -> xxx.log.{LOG_BACKUPS}
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+# 后台线程同时保持打开的日志文件数上限
+MAX_OPEN_FILES = 64
+
+
+class _LogFile:
+    """单个日志文件的写缓冲与句柄"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.buffer: List[bytes] = []
+        self.buffered_bytes = 0
+        self.last_flush = time.monotonic()
+        self.handle = None
+        self.size = 0
+
+    def open(self):
+        if self.handle is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 二进制追加：size 与轮转阈值都按字节计算
+            self.handle = open(self.path, "ab")
+            self.size = self.handle.tell()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def rotate(self):
+        self.close()
+        for i in range(LOG_BACKUPS - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.path.exists():
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        self.open()
+
+
+class TaskLogWriter:
+    """
+    结构化任务日志：调用方只把 JSON 行放入有界队列，由单个后台线程按文件缓冲、
+    按大小/时间批量落盘并负责轮转，避免每条日志一次 open/write/close
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._files: "OrderedDict[Path, _LogFile]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._drain, name="task-log", daemon=True)
+                self._thread.start()
+
+    def log(self, path: Path, record: Dict[str, Any]):
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self._ensure_started()
+        try:
+            self._queue.put((path, line), timeout=LOG_PUT_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中已有日志全部落盘"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _drain(self):
+        while True:
+            try:
+                path, item = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                self._flush_due()
+                continue
+
+            if path is None:
+                # flush() 的同步标记
+                self._flush_due(force=True)
+                item.set()
+                continue
+
+            log_file = self._files.get(path)
+            if log_file is None:
+                log_file = _LogFile(path)
+                self._files[path] = log_file
+            self._files.move_to_end(path)
+            log_file.buffer.append(item)
+            log_file.buffered_bytes += len(item)
+            if log_file.buffered_bytes >= FLUSH_BYTES:
+                self._write(log_file)
+            self._flush_due()
+
+    def _flush_due(self, force: bool = False):
+        now = time.monotonic()
+        for log_file in list(self._files.values()):
+            if log_file.buffer and (force or now - log_file.last_flush >= FLUSH_INTERVAL):
+                self._write(log_file)
+
+        # 关闭最久未使用且无缓冲的句柄
+        while len(self._files) > MAX_OPEN_FILES:
+            path, log_file = next(iter(self._files.items()))
+            if log_file.buffer:
+                self._write(log_file)
+            log_file.close()
+            del self._files[path]
+
+    def _write(self, log_file: _LogFile):
+        data = b"".join(log_file.buffer)
+        log_file.buffer = []
+        log_file.buffered_bytes = 0
+        log_file.last_flush = time.monotonic()
+        try:
+            log_file.open()
+            if log_file.size and log_file.size + len(data) > LOG_MAX_BYTES:
+                log_file.rotate()
+            log_file.handle.write(data)
+            log_file.handle.flush()
+            log_file.size += len(data)
+        except Exception as e:
+            log_file.close()
+            print(f"任务日志写入失败 {log_file.path}: {e}")
+
+
+# 全局日志写入器（进程内共享一个后台线程）
+task_log_writer = TaskLogWriter()
+
+
+def log_record(task_id: str, stage: str, message: str, tool: Optional[str] = None, **fields) -> Dict[str, Any]:
+    """构造一条结构化日志记录"""
+    record = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "task_id": task_id,
+        "stage": stage,
+        "tool": tool,
+        "pid": os.getpid(),
+        "msg": message,
+    }
+    record.update(fields)
+    return record
+
+
+atexit.register(task_log_writer.flush)
@@ -1,199 +1,164 @@
-from api.v1.Penetration.runner.afrog import AfrogRunner
-from api.v1.Penetration.runner.amass import AmassRunner
-from api.v1.Penetration.runner.arjun import ArjunRunner
-from api.v1.Penetration.runner.dnsx import DnsxRunner
-from api.v1.Penetration.runner.feroxbuster import FeroxbusterRunner
-from api.v1.Penetration.runner.gobuster import GobusterRunner
-from api.v1.Penetration.runner.gun import GauRunner
-from api.v1.Penetration.runner.masscan import MasscanRunner
-from api.v1.Penetration.runner.naabu import NaabuRunner
-from api.v1.Penetration.runner.nikto import NiktoRunner
-from api.v1.Penetration.runner.nuclei import NucleiRunner
-from api.v1.Penetration.runner.oneforall import OneForAllRunner
-from api.v1.Penetration.runner.paramspider import ParamSpiderRunner
-from api.v1.Penetration.runner.shodan import ShodanRunner
-from api.v1.Penetration.runner.sqlmap import SqlmapRunner
-from api.v1.Penetration.runner.dirscan import DirScanRunner
-from api.v1.Penetration.runner.hydra import HydraRunner
-from api.v1.Penetration.runner.subfinder import SubfinderRunner
-from api.v1.Penetration.runner.theharvester import TheHarvesterRunner
-from api.v1.Penetration.runner.trufflehog import TrufflehogRunner
-from api.v1.Penetration.runner.wafw00f import Wafw00fRunner
-from api.v1.Penetration.runner.whatweb import WhatWebRunner
-from api.v1.Penetration.runner.xray import XrayRunner
+import asyncio
+import hashlib
+import inspect
+import json
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Tuple
+
+from api.v1.Penetration.runner.executor import run_blocking
+from api.v1.Penetration.runner.registry import get_spec, load_runner
+from api.v1.Penetration.runner.result_cache import (
+    result_cache, CacheMissError, CACHE_MODES, snapshot_artifacts, changed_artifacts, normalize_args
+)
+
+
+# 进行中的工具执行：(task_id, tool_id, 归一化参数) 的哈希 -> 共享结果的 Future
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
 
 
 class ToolDispatcher:
+    """
+    按 tool_id 查注册表调度具体 Runner，Runner 模块在首次使用时才导入。
+    cache 控制结果缓存：prefer（默认，命中即返回）、bypass（强制执行并刷新缓存）、only（仅读缓存）。
+    参数相同且时间重叠的调用（如 Dify 超时重试）合并为一次执行，所有调用方共享同一结果
+    """
+
+    @staticmethod
+    def execute(task_id: str, tool_id: str, args: dict, cache: str = "prefer") -> dict:
+        spec = get_spec(tool_id)
+        kwargs = spec.build_kwargs(args)
+        if cache == "only":
+            return ToolDispatcher._execute(spec, task_id, kwargs, cache)
+
+        key = ToolDispatcher._flight_key(task_id, tool_id, kwargs)
+        future, owner = ToolDispatcher._join_flight(key)
+        if not owner:
+            return future.result()
+        try:
+            result = ToolDispatcher._execute(spec, task_id, kwargs, cache)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            ToolDispatcher._leave_flight(key)
+
+    @staticmethod
+    async def aexecute(task_id: str, tool_id: str, args: dict, cache: str = "prefer") -> dict:
+        """
+        execute 的异步入口：Runner 提供原生异步方法（a + 方法名）时直接 await，
+        否则在工具专用线程池中执行，不阻塞事件循环；等待合并结果时同样不占用线程
+        """
+        spec = get_spec(tool_id)
+        kwargs = spec.build_kwargs(args)
+        if cache == "only":
+            return await run_blocking(ToolDispatcher._execute, spec, task_id, kwargs, cache)
+
+        key = ToolDispatcher._flight_key(task_id, tool_id, kwargs)
+        future, owner = ToolDispatcher._join_flight(key)
+        if not owner:
+            # shield：单个调用方断开不应取消其他调用方共享的执行
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await ToolDispatcher._aexecute(spec, task_id, kwargs, cache)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            ToolDispatcher._leave_flight(key)
+
+    @staticmethod
+    def _execute(spec, task_id: str, kwargs: dict, cache: str) -> dict:
+        cache_key, cached = ToolDispatcher._lookup(spec, task_id, kwargs, cache)
+        if cached is not None:
+            return cached
+
+        runner = load_runner(spec)(task_id)
+        before = snapshot_artifacts(runner.base_dir)
+        result = getattr(runner, spec.method)(**kwargs)
+        return ToolDispatcher._store(spec, runner, cache_key, before, result)
+
+    @staticmethod
+    async def _aexecute(spec, task_id: str, kwargs: dict, cache: str) -> dict:
+        runner_cls = load_runner(spec)
+        async_method = getattr(runner_cls, f"a{spec.method}", None)
+        if async_method is None or not inspect.iscoroutinefunction(async_method):
+            return await run_blocking(ToolDispatcher._execute, spec, task_id, kwargs, cache)
+
+        cache_key, cached = await run_blocking(ToolDispatcher._lookup, spec, task_id, kwargs, cache)
+        if cached is not None:
+            return cached
+
+        runner = runner_cls(task_id)
+        before = snapshot_artifacts(runner.base_dir)
+        result = await getattr(runner, f"a{spec.method}")(**kwargs)
+        return await run_blocking(ToolDispatcher._store, spec, runner, cache_key, before, result)
+
+    @staticmethod
+    def _flight_key(task_id: str, tool_id: str, kwargs: dict) -> str:
+        raw = json.dumps([task_id, tool_id, normalize_args(kwargs)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _join_flight(key: str) -> Tuple[Future, bool]:
+        """返回 (Future, 是否为执行者)；已有相同调用在执行时挂到其 Future 上"""
+        with _inflight_lock:
+            future = _inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            _inflight[key] = future
+            return future, True
+
+    @staticmethod
+    def _leave_flight(key: str):
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
     @staticmethod
-    def execute(task_id: str, tool_id: str, args: dict) -> dict:
-        findings = []
-        summary = ""
-
-        if tool_id == "nuclei":
-            runner = NucleiRunner(task_id)
-            findings = runner.run_scan(
-                targets=args.get("targets", []),
-                templates=args.get("templates", ["cves/", "vulnerabilities/"])
-            )
-            summary = f"Nuclei 扫描完成，检测到 {len(findings)} 个漏洞。"
-
-        elif tool_id == "sqlmap":
-            runner = SqlmapRunner(task_id)
-            res = runner.run_injection_test(
-                target_url=args.get("target_url", ""),
-                risk_level=args.get("risk_level", 1)
-            )
-            findings = [res] if res.get("is_vulnerable") else []
-            summary = f"SQLMap 测试完成，漏洞状态: {res.get('is_vulnerable')}。"
-
-        elif tool_id == "dirscan":
-            runner = DirScanRunner(task_id)
-            findings = runner.run_scan(
-                target_url=args.get("target_url", ""),
-                extensions=args.get("extensions", "php,txt,zip"),
-                wordlist_type=args.get("wordlist_type", "small")
-            )
-            summary = f"DirScan 完成，发现 {len(findings)} 个隐藏路径。"
-
-        elif tool_id == "hydra":
-            runner = HydraRunner(task_id)
-            res = runner.run_bruteforce(
-                target_ip=args.get("target_ip", ""),
-                service=args.get("service", ""),
-                port=args.get("port", 0)
-            )
-            findings = res.get("findings", [])
-            summary = f"Hydra 爆破完成，破解状态: {res.get('is_cracked')}。"
-
-        elif tool_id == "subfinder":
-            runner = SubfinderRunner(task_id)
-            findings = runner.run_scan(target_domain=args.get("target_domain", ""))
-            summary = f"Subfinder 枚举完成，发现 {len(findings)} 个子域名。"
-
-        elif tool_id == "amass":
-            runner = AmassRunner(task_id)
-            findings = runner.run_scan(target_domain=args.get("target_domain", ""))
-            summary = f"Amass 被动测绘完成，发现 {len(findings)} 个相关资产。"
-
-        elif tool_id == "dnsx":
-            runner = DnsxRunner(task_id)
-            findings = runner.run_scan(subdomains=args.get("subdomains", []))
-            summary = f"Dnsx 存活解析完成，确认存活 {len(findings)} 个记录。"
-
-        elif tool_id == "oneforall":
-            runner = OneForAllRunner(task_id)
-            findings = runner.run_scan(target_domain=args.get("target_domain", ""))
-            summary = f"OneForAll 扫描完成，发现 {len(findings)} 个子域名。"
-
-        elif tool_id == "gau":
-            runner = GauRunner(task_id)
-            findings = runner.run_scan(target_domain=args.get("target_domain", ""))
-            summary = f"Gau 历史 URL 提取完成，发现 {len(findings)} 条记录。"
-
-        elif tool_id == "theharvester":
-            runner = TheHarvesterRunner(task_id)
-            res = runner.run_scan(
-                target_domain=args.get("target_domain", ""),
-                source=args.get("source", "all")
-            )
-            # 展平封装格式以符合 UnifiedToolResponse
-            findings = [res]
-            summary = f"theHarvester 收集完成，提取 {len(res.get('emails', []))} 个邮箱及 {len(res.get('hosts', []))} 个主机。"
-
-        elif tool_id == "trufflehog":
-            runner = TrufflehogRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"Trufflehog 扫描完成，发现 {len(findings)} 处代码凭证泄露。"
-
-        elif tool_id == "shodan":
-            runner = ShodanRunner(task_id)
-            res = runner.run_scan(target_ip=args.get("target_ip", ""))
-            findings = [res] if res else []
-            summary = f"Shodan 检索完成，目标系统: {res.get('os', 'Unknown')}，开放端口: {res.get('ports', [])}。"
-
-        elif tool_id == "masscan":
-            runner = MasscanRunner(task_id)
-            findings = runner.run_scan(
-                target_ip=args.get("target_ip", ""),
-                ports=args.get("ports", "1-65535"),
-                rate=args.get("rate", 1000)
-            )
-            summary = f"Masscan 扫描完成，发现 {len(findings)} 个开放端口。"
-
-        elif tool_id == "naabu":
-            runner = NaabuRunner(task_id)
-            findings = runner.run_scan(target=args.get("target", ""))
-            summary = f"Naabu 扫描完成，确认 {len(findings)} 个存活端口。"
-
-        elif tool_id == "whatweb":
-            runner = WhatWebRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"WhatWeb 指纹识别完成，探测到 {len(findings[0].get('plugins', {})) if findings else 0} 项技术特征。"
-
-
-        elif tool_id == "wafw00f":
-            runner = Wafw00fRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-
-            # 提取检测到的 WAF 名称用于生成摘要
-            detected_wafs = [f.get("firewall") for f in findings if f.get("detected")]
-            waf_status = ", ".join(detected_wafs) if detected_wafs else "未检测到 WAF"
-
-            summary = f"Wafw00f 探测完成，目标 WAF 状态: {waf_status}。"
-
-
-        elif tool_id == "arjun":
-            runner = ArjunRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"Arjun 参数爆破完成，发现 {len(findings)} 个隐藏参数。"
-
-        elif tool_id == "paramspider":
-            runner = ParamSpiderRunner(task_id)
-            # ParamSpiderRunner 已重写为无需第三方库的原生代码
-            findings = runner.run_scan(target_domain=args.get("target_domain", ""))
-            summary = f"ParamSpider 运行完成，捕获 {len(findings)} 个带参 URL。"
-
-        elif tool_id == "dirsearch":
-            runner = DirsearchRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"Dirsearch 扫描完成，发现 {len(findings)} 个路径。"
-
-        elif tool_id == "feroxbuster":
-            runner = FeroxbusterRunner(task_id)
-            findings = runner.run_scan(
-                target_url=args.get("target_url", ""),
-                wordlist=args.get("wordlist", "common.txt")
-            )
-            summary = f"Feroxbuster 递归发现完成，识别 {len(findings)} 个有效资源。"
-
-        elif tool_id == "gobuster":
-            runner = GobusterRunner(task_id)
-            findings = runner.run_scan(
-                target_url=args.get("target_url", ""),
-                wordlist=args.get("wordlist", "common.txt")
-            )
-            summary = f"Gobuster 枚举完成，探测到 {len(findings)} 个目录/文件。"
-
-        elif tool_id == "xray":
-            runner = XrayRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"xray 主动扫描完成，发现 {len(findings)} 个潜在漏洞。"
-
-        elif tool_id == "afrog":
-            runner = AfrogRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"afrog 模板扫描完成，命中 {len(findings)} 个有效 POC。"
-
-        elif tool_id == "nikto":
-            runner = NiktoRunner(task_id)
-            findings = runner.run_scan(target_url=args.get("target_url", ""))
-            summary = f"Nikto 配置扫描完成，识别出 {len(findings)} 个服务器配置风险或过时组件。"
-
-        else:
-            raise ValueError(f"未注册的 tool_id: {tool_id}")
+    def _lookup(spec, task_id: str, kwargs: dict, cache: str):
+        """返回 (缓存键, 命中结果)；工具不可缓存或 cache=bypass 时不读缓存"""
+        if cache not in CACHE_MODES:
+            raise ValueError(f"cache 取值必须为 {'/'.join(CACHE_MODES)}: {cache}")
+        if not spec.cache_ttl:
+            if cache == "only":
+                raise CacheMissError(f"工具 {spec.tool_id} 不支持结果缓存")
+            return None, None
+
+        task_dir = Path(f"runs/{task_id}")
+        cache_key = result_cache.make_key(spec, kwargs, task_dir)
+        if cache != "bypass":
+            cached = result_cache.get(cache_key, task_dir, task_id)
+            if cached is not None:
+                if spec.cache_replay is not None:
+                    spec.cache_replay(load_runner(spec)(task_id), kwargs, cached)
+                return cache_key, {**cached, "cached": True}
+            if cache == "only":
+                raise CacheMissError(f"工具 {spec.tool_id} 无可用缓存结果")
+        return cache_key, None
 
+    @staticmethod
+    def _store(spec, runner, cache_key, before, result) -> dict:
+        response = ToolDispatcher._format(spec, result)
+        # 空结果多为工具缺失或执行失败，不写入缓存；工具声明为不完整的结果同样不缓存
+        if cache_key is not None and response["findings"] and spec.cacheable(result):
+            try:
+                result_cache.put(cache_key, spec, response, changed_artifacts(runner.base_dir, before))
+            except Exception as e:
+                runner.write_log("system", f"结果缓存写入失败: {e}")
+        return {**response, "cached": False}
+
+    @staticmethod
+    def _format(spec, result) -> dict:
+        findings = spec.findings(result)
         return {
-            "tool_id": tool_id,
-            "summary": summary,
+            "tool_id": spec.tool_id,
+            "summary": spec.summary(result, findings),
             "findings": findings
-        }
\ No newline at end of file
+        }
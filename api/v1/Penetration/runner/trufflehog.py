@@ -1,4 +1,3 @@
-import json
 import os
 from typing import List, Dict, Any
 from .base import BaseRunner
@@ -19,25 +18,19 @@ class TrufflehogRunner(BaseRunner):
         # 构造命令: trufflehog git <url> --json
         cmd = [binary, "git", target_url, "--json"]
 
-        output = self.run_tool(cmd, "tool_trufflehog")
-
         findings = []
-        if output:
-            # Trufflehog 输出为 JSONL 格式（每一行是一个 JSON 对象）
-            for line in output.splitlines():
-                if not line.strip() or not line.startswith("{"):
-                    continue
-                try:
-                    data = json.loads(line.strip())
-                    findings.append({
-                        "detector_name": data.get("DetectorName", "Unknown"),
-                        "decoder_name": data.get("DecoderName", ""),
-                        "redacted_secret": data.get("Redacted", ""),
-                        "file_path": data.get("SourceMetadata", {}).get("Data", {}).get("Git", {}).get("file", ""),
-                        "commit": data.get("SourceMetadata", {}).get("Data", {}).get("Git", {}).get("commit", "")
-                    })
-                except Exception as e:
-                    continue
+        # Trufflehog 输出为 JSONL 格式（每一行是一个 JSON 对象），边执行边解析
+        for data in self.iter_jsonl(self.stream_tool(cmd, "tool_trufflehog")):
+            git_meta = data.get("SourceMetadata", {}).get("Data", {}).get("Git", {})
+            finding = {
+                "detector_name": data.get("DetectorName", "Unknown"),
+                "decoder_name": data.get("DecoderName", ""),
+                "redacted_secret": data.get("Redacted", ""),
+                "file_path": git_meta.get("file", ""),
+                "commit": git_meta.get("commit", "")
+            }
+            findings.append(finding)
+            self.emit_finding(finding)
 
         self.save_artifact("trufflehog_findings.json", {"task_id": self.task_id, "findings": findings})
 
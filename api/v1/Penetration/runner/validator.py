@@ -1,15 +1,46 @@
+import asyncio
 import json
-import subprocess
-import os
+from typing import Any, Dict, List, Optional
+
+import httpx
+
 from .base import BaseRunner
+from .ratelimit import host_of
+
+try:
+    import h2  # noqa: F401  HTTP/2 依赖 h2（随 httpx[http2] 安装）；未按 uv.lock 安装缺少 h2 时退回 HTTP/1.1
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 同时在途的验证请求数，以及单个目标主机的并发上限
+VERIFY_CONCURRENCY = 50
+VERIFY_HOST_CONCURRENCY = 6
+# 连接池中保持的空闲长连接数
+VERIFY_KEEPALIVE = 20
+# 连接超时与读超时（秒）
+VERIFY_CONNECT_TIMEOUT = 5.0
+VERIFY_READ_TIMEOUT = 10.0
+# 判定为有效风险点的状态码
+VERIFY_HIT_STATUS = (200, 302)
+# HEAD 不被支持时改用 GET（只读响应头）
+_HEAD_UNSUPPORTED = (405, 501)
+# 单个探测请求失败时捕获的异常（候选点验证与 DirScan 校准共用）：网络错误，以及 URL 非法（httpx.InvalidURL / IDNA 编码失败 / 解析失败）
+PROBE_ERRORS = (httpx.HTTPError, httpx.InvalidURL, UnicodeError, ValueError)
 
 
 class ValidatorRunner(BaseRunner):
     """
-    Stage 5: 受控验证执行器 (基于 curl 的证据采集)
+    Stage 5: 受控验证执行器（原生 httpx 异步客户端采集证据）。
+    共享连接池与长连接，全局 / 单主机并发有界，请求前经任务预算令牌桶限速，
+    证据记录完整状态行、响应头与耗时
     """
 
     def verify(self):
+        """同步入口（供线程池 / 作业队列调用）"""
+        return asyncio.run(self.averify())
+
+    async def averify(self):
         self.update_status({"stage": "Stage5_Verify", "hint": "执行受控验证并采集证据", "percent": 90})
 
         # 1. 加载 Stage 4 候选点
@@ -19,32 +50,96 @@ class ValidatorRunner(BaseRunner):
         with open(candidate_path, "r", encoding="utf-8") as f:
             candidates = json.load(f).get("candidates", [])
 
-        findings = []
-        for cand in candidates:
-            url = cand.get("url")
-            self.write_log("stage5_verify", f"正在验证高价值目标: {url}")
+        self.write_log("stage5_verify", f"开始验证 {len(candidates)} 个候选点（HTTP/2: {HTTP2_AVAILABLE}）",
+                       candidates=len(candidates), http2=HTTP2_AVAILABLE)
+        semaphore = asyncio.Semaphore(VERIFY_CONCURRENCY)
+        host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        limits = httpx.Limits(max_connections=VERIFY_CONCURRENCY, max_keepalive_connections=VERIFY_KEEPALIVE)
+        timeout = httpx.Timeout(VERIFY_READ_TIMEOUT, connect=VERIFY_CONNECT_TIMEOUT)
 
-            # 2. 调用外部工具采集证据 (curl -I 获取 HTTP 首部)
-            # 这种方式能够证明该路径真实存在且可访问
-            cmd = ["curl", "-I", "-s", "--connect-timeout", "5", url]
+        # 2. 共享客户端并发验证；与原 curl 行为一致，不跟随重定向，302 本身即证据
+        # 渗透目标常见自签名证书，不校验证书
+        async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits, timeout=timeout,
+                                     verify=False, follow_redirects=False) as client:
+            async def _run(cand):
+                url = cand.get("url")
+                if not url:
+                    return None
+                try:
+                    host = host_of(url)
+                except ValueError:
+                    host = ""
+                host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(VERIFY_HOST_CONCURRENCY))
+                async with semaphore, host_semaphore:
+                    return await self._probe(client, cand)
 
-            output = self.run_tool(cmd, "stage5_verify")
+            tasks = [asyncio.create_task(_run(cand)) for cand in candidates]
+            findings = []
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                finding = await task
+                if finding is not None:
+                    findings.append(finding)
+                    self.emit_finding(finding)
+                if done % 50 == 0 or done == len(tasks):
+                    self.update_status({"hint": f"验证进度 {done}/{len(tasks)}，发现 {len(findings)} 个有效风险点"})
 
-            if output and ("200 OK" in output or "302" in output):
-                findings.append({
-                    "url": url,
-                    "vulnerability": "Potential Sensitive Interface",
-                    "evidence_type": "HTTP_HEADER",
-                    "evidence_data": output.strip().split('\n')[0],  # 仅保留首行状态码作为核心证据
-                    "severity": "Medium" if "login" in url else "Low"
-                })
-
-        # 3. 产物保存
-        result = {"task_id": self.task_id, "findings": findings}
+        # 3. 产物保存；验证失败的候选点单独列出，便于区分“未命中”与“未能验证”
+        failed = [{"url": c["url"], "error": c["verify_error"]} for c in candidates if c.get("verify_error")]
+        if failed:
+            self.write_log("stage5_verify", f"{len(failed)} 个候选点验证失败", failed=len(failed))
+        result = {"task_id": self.task_id, "findings": findings, "failed": failed}
         self.save_artifact("findings.json", result)
 
         self.update_status({
             "percent": 95,
             "hint": f"任务全链路已完成，发现 {len(findings)} 个有效风险点"
         })
-        return result
\ No newline at end of file
+        return result
+
+    async def _probe(self, client: httpx.AsyncClient, cand: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """验证单个候选点；请求失败或 URL 非法时把原因记录到候选点的 verify_error 上并返回 None"""
+        url = cand["url"]
+        self.write_log("stage5_verify", f"正在验证高价值目标: {url}")
+        method = "HEAD"
+        try:
+            await self.athrottle(url)
+            response = await client.request(method, url)
+            if response.status_code in _HEAD_UNSUPPORTED:
+                method = "GET"
+                await self.athrottle(url)
+                # 流式请求只读取响应头，不下载响应体
+                async with client.stream(method, url) as response:
+                    pass
+        except PROBE_ERRORS as e:
+            cand["verify_error"] = f"{type(e).__name__}: {e}"
+            self.write_log("stage5_verify", f"验证请求失败: {url} ({cand['verify_error']})", url=url)
+            return None
+        # 从发出请求到响应完成的耗时（不含限速等待）
+        elapsed_ms = round(response.elapsed.total_seconds() * 1000, 1)
+
+        status_line = f"{response.http_version} {response.status_code} {response.reason_phrase}".strip()
+        self.write_log("stage5_verify", f"{url} -> {status_line} ({elapsed_ms}ms)",
+                       url=url, status=response.status_code, elapsed_ms=elapsed_ms)
+        if response.status_code not in VERIFY_HIT_STATUS:
+            return None
+
+        return {
+            "url": url,
+            "vulnerability": "Potential Sensitive Interface",
+            "evidence_type": "HTTP_HEADER",
+            "evidence_data": status_line,  # 首行状态码作为核心证据
+            "evidence": {
+                "method": method,
+                "status_line": status_line,
+                "headers": self._headers(response),
+                "elapsed_ms": elapsed_ms,
+            },
+            "severity": "Medium" if "login" in url else "Low"
+        }
+
+    @staticmethod
+    def _headers(response: httpx.Response) -> Dict[str, List[str]]:
+        headers: Dict[str, List[str]] = {}
+        for name, value in response.headers.multi_items():
+            headers.setdefault(name, []).append(value)
+        return headers
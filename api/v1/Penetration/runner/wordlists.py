@@ -0,0 +1,237 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+# 预处理后的字典缓存目录（跨任务共享），文件名为源字典内容哈希与处理参数的摘要
+WORDLIST_CACHE_DIR = Path("runs/_cache/wordlists")
+# 按文件名查找字典时的搜索目录（相对项目根目录），依次匹配；仅在调用方显式开启 search 时使用
+WORDLIST_SEARCH_DIRS = (
+    ".",
+    "SecLists/Discovery/Web-Content",
+    "SecLists/Passwords",
+    "SecLists/Usernames",
+)
+# DirScan 的字典规模 -> 字典路径（相对项目根目录的 SecLists）
+DIRSCAN_WORDLISTS = {
+    "small": "SecLists/Discovery/Web-Content/raft-small-directories.txt",
+    "medium": "SecLists/Discovery/Web-Content/raft-medium-directories.txt",
+    "large": "SecLists/Discovery/Web-Content/raft-large-directories.txt",
+    "api": "SecLists/Discovery/Web-Content/api/api-endpoints.txt"
+}
+# 预处理规则版本，规则变化后旧缓存自动失效
+_FORMAT_VERSION = 2
+
+# 技术栈 -> (指纹技术名关键词（小写子串）, 专属扩展名)。识别出目标技术栈后，
+# 路径字典中只属于其他技术栈的条目（如 PHP 站点上的 .jsp/.aspx）会被剔除
+WORDLIST_STACKS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "php": (("php", "wordpress", "thinkphp", "laravel", "drupal", "joomla", "magento", "phpmyadmin"),
+            ("php", "php3", "php4", "php5", "php7", "phtml", "phps")),
+    "java": (("java", "tomcat", "jboss", "weblogic", "websphere", "spring", "struts", "jetty", "jsp", "shiro"),
+             ("jsp", "jspx", "jsf", "do", "action", "faces")),
+    "aspnet": (("asp.net", "aspnet", "iis", "exchange"),
+               ("asp", "aspx", "ashx", "asmx", "axd", "cshtml")),
+}
+
+
+def detect_stacks(base_dir: Path, target_url: str = "") -> List[str]:
+    """从任务指纹结果识别技术栈；指定 target_url 时只看同一主机的指纹"""
+    fp_path = base_dir / "http_fingerprints.json"
+    if not fp_path.exists():
+        return []
+    try:
+        with open(fp_path, "r", encoding="utf-8") as f:
+            fps = json.load(f).get("fingerprints", [])
+    except (OSError, ValueError):
+        return []
+
+    host = urlsplit(target_url).hostname if target_url else None
+    stacks: Set[str] = set()
+    for fp in fps:
+        if host and urlsplit(fp.get("url") or "").hostname != host:
+            continue
+        for tech in fp.get("tech") or []:
+            name = tech.split(":")[0].lower()
+            stacks.update(stack for stack, (keywords, _) in WORDLIST_STACKS.items()
+                          if any(k in name for k in keywords))
+    return sorted(stacks)
+
+
+class WordlistManager:
+    """
+    字典服务：按文件名 / 相对路径定位字典，生成去重、规范化（可合并多个字典、按技术栈过滤）的派生字典，
+    派生结果按源文件内容哈希缓存于 runs/_cache/wordlists/，源字典未变化时直接复用；
+    Python 侧通过 mmap 逐行读取，不把整个字典载入内存
+    """
+
+    def __init__(self, root: Optional[str] = None, cache_dir: Path = WORDLIST_CACHE_DIR):
+        self.root = root or os.getcwd()
+        # 派生字典以绝对路径交给外部工具，不受子进程工作目录影响
+        self.cache_dir = Path(self.root) / cache_dir
+        self._lock = threading.Lock()
+        # 绝对路径 -> ((mtime_ns, size), sha256)
+        self._digests: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        # 文件名 -> 绝对路径（首次按文件名查找时建立）
+        self._names: Optional[Dict[str, str]] = None
+
+    # ------------------------------
+    # 定位与索引
+    # ------------------------------
+    def resolve(self, name: str, search: bool = False,
+                log: Optional[Callable[[str], None]] = None) -> Optional[Path]:
+        """
+        绝对路径 / 相对项目根目录的路径直接使用；search=True 时找不到再按文件名在 WORDLIST_SEARCH_DIRS 中查找
+        （同名文件取第一个），实际选用的文件通过 log 回调告知调用方
+        """
+        if not name:
+            return None
+        path = os.path.abspath(os.path.join(self.root, name))
+        if os.path.isfile(path):
+            return Path(path)
+        if not search:
+            return None
+        found = self.index().get(os.path.basename(name))
+        if found and log is not None:
+            log(f"字典 {name} 不存在，按文件名匹配到 {os.path.relpath(found, self.root)}")
+        return Path(found) if found else None
+
+    def index(self) -> Dict[str, str]:
+        """可用字典索引（文件名 -> 绝对路径），每个进程只遍历一次搜索目录"""
+        with self._lock:
+            if self._names is not None:
+                return self._names
+        names: Dict[str, str] = {}
+        for rel in WORDLIST_SEARCH_DIRS:
+            directory = os.path.join(self.root, rel)
+            if not os.path.isdir(directory):
+                continue
+            # 项目根目录只取顶层文件，SecLists 子目录递归
+            walker = [(directory, [], os.listdir(directory))] if rel == "." else os.walk(directory)
+            for root, _, files in walker:
+                for fn in sorted(files):
+                    if fn.endswith(".txt"):
+                        names.setdefault(fn, os.path.join(root, fn))
+        with self._lock:
+            self._names = names
+        return names
+
+    def digest(self, path: Path) -> str:
+        """源字典内容哈希，按 (mtime, size) 缓存避免重复计算"""
+        full = str(path)
+        st = os.stat(full)
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._digests.get(full)
+            if cached is not None and cached[0] == sig:
+                return cached[1]
+        h = hashlib.sha256()
+        with open(full, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[full] = (sig, digest)
+        return digest
+
+    # ------------------------------
+    # 派生字典
+    # ------------------------------
+    def prepare(self, sources: Iterable[str], kind: str = "path", stacks: Iterable[str] = (), search: bool = False,
+                log: Optional[Callable[[str], None]] = None) -> Optional[Path]:
+        """
+        合并 sources 并去重后返回派生字典路径；任一源字典缺失时返回 None（search / log 含义同 resolve）。
+        kind="path"：Web 路径字典，去除首尾空白、注释行与开头的 /，并按 stacks 剔除其他技术栈专属扩展名；
+        kind="plain"：用户名 / 密码字典，只去除行尾换行与重复条目，保留原始内容（空行即空密码，同样保留）
+        """
+        paths = []
+        for name in sources:
+            path = self.resolve(name, search, log)
+            if path is None:
+                return None
+            paths.append(path)
+        if not paths:
+            return None
+
+        stacks = sorted(set(stacks)) if kind == "path" else []
+        excluded = self._excluded_extensions(stacks)
+        key = hashlib.sha256(json.dumps({
+            "version": _FORMAT_VERSION,
+            "kind": kind,
+            "sources": [self.digest(p) for p in paths],
+            "excluded": sorted(ext.decode("ascii") for ext in excluded),
+        }).encode("utf-8")).hexdigest()[:32]
+        # 文件名保留首个源字典名，便于在命令行日志中辨认
+        target = self.cache_dir / f"{paths[0].stem}-{key}.txt"
+        if target.exists():
+            return target
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        seen: Set[bytes] = set()
+        with open(tmp, "wb") as out:
+            for path in paths:
+                for raw in self.iter_lines(path):
+                    word = self._normalize(raw, kind, excluded)
+                    if word is None or word in seen:
+                        continue
+                    seen.add(word)
+                    out.write(word + b"\n")
+        # 并发生成同一派生字典时以最后一次替换为准，内容相同
+        os.replace(tmp, target)
+        return target
+
+    @staticmethod
+    def _excluded_extensions(stacks: List[str]) -> Set[bytes]:
+        if not stacks:
+            return set()
+        return {ext.encode("ascii") for stack, (_, exts) in WORDLIST_STACKS.items()
+                if stack not in stacks for ext in exts}
+
+    @staticmethod
+    def _normalize(raw: bytes, kind: str, excluded: Set[bytes]) -> Optional[bytes]:
+        if kind != "path":
+            return raw.rstrip(b"\r\n")
+        word = raw.strip().lstrip(b"/")
+        if not word or word.startswith(b"#"):
+            return None
+        if excluded:
+            last = word.split(b"?", 1)[0].rstrip(b"/").rsplit(b"/", 1)[-1]
+            if b"." in last and last.rsplit(b".", 1)[1].lower() in excluded:
+                return None
+        return word
+
+    # ------------------------------
+    # mmap 读取
+    # ------------------------------
+    @staticmethod
+    def iter_lines(path: Path) -> Iterator[bytes]:
+        """以 mmap 逐行读取原始字节（含行尾换行）"""
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from iter(mm.readline, b"")
+
+    def iter_words(self, path: Path) -> Iterator[str]:
+        """以 mmap 逐条读取字典条目（供 Python 侧消费者使用）"""
+        for raw in self.iter_lines(path):
+            word = raw.rstrip(b"\r\n")
+            if word:
+                yield word.decode("utf-8", errors="replace")
+
+
+_manager: Optional[WordlistManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_wordlists() -> WordlistManager:
+    """进程内共享的字典服务实例"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WordlistManager()
+        return _manager
@@ -6,6 +6,9 @@ from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import Response
 
 from api.v1.Penetration.runner.tool_dispatcher import ToolDispatcher
+from api.v1.Penetration.runner.registry import ToolUnavailableError
+from api.v1.Penetration.runner.result_cache import CacheMissError
+from api.v1.Penetration.runner.executor import run_blocking
 from api.v1.tasks.schema import (
     TaskCreateRequest, TaskRunRequest, TaskStopRequest,
     TaskApproveRequest, UnifiedToolResponse, UnifiedToolRequest
@@ -134,6 +137,7 @@ def download(
 
 from api.v1.Penetration.runner.httpx import HttpxRunner
 from api.v1.Penetration.runner.nmap import NmapRunner
+from api.v1.Penetration.runner.discovery import DiscoveryPipelineRunner
 from api.v1.Penetration.runner.crawler import CrawlerRunner
 from api.v1.Penetration.runner.candidate import CandidateRunner
 from api.v1.Penetration.runner.validator import ValidatorRunner
@@ -143,7 +147,7 @@ from api.v1.Penetration.reporter import ReporterRunner
 # 可选的其他端点
 
 @penetrationRouter.post("/scan/nmap")
-def scan_nmap(
+async def scan_nmap(
         task_id: str,
         target: str,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
@@ -153,7 +157,24 @@ def scan_nmap(
 
     # 实例化并直接执行
     runner = NmapRunner(task_id)
-    result = runner.scan(target)
+    result = await runner.ascan(target)
+
+    return {"ok": True, "data": result}
+
+
+@penetrationRouter.post("/scan/discovery")
+async def scan_discovery(
+        task_id: str,
+        target: str,
+        ports: str = "1-65535",
+        sweeper: str = "naabu",
+        x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
+):
+    """两阶段资产发现：masscan / naabu 快速扫描开放端口，仅对开放端口执行 nmap -sV，结果写入 assets.json"""
+    require_key(x_api_key)
+
+    runner = DiscoveryPipelineRunner(task_id)
+    result = await run_blocking(runner.run_pipeline, target, ports, sweeper)
 
     return {"ok": True, "data": result}
 
@@ -168,33 +189,35 @@ from api.v1.Penetration.reporter import ReporterRunner
 
 # 1. 补充 /probe/httpx 接口
 @penetrationRouter.post("/probe/httpx")
-def probe_httpx(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def probe_httpx(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_key(x_api_key)
-    return {"ok": True, "data": HttpxRunner(task_id).run_fingerprint()}
+    return {"ok": True, "data": await run_blocking(HttpxRunner(task_id).run_fingerprint)}
 
 # 2. 补充 /crawl 接口
 @penetrationRouter.post("/crawl")
-def crawl_endpoints(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def crawl_endpoints(task_id: str, fresh: bool = False,
+                          x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_key(x_api_key)
-    return {"ok": True, "data": CrawlerRunner(task_id).run_crawl()}
+    return {"ok": True, "data": await run_blocking(CrawlerRunner(task_id).run_crawl, fresh)}
 
 # 3. 补充 /candidate/rule 接口
 @penetrationRouter.post("/candidate/rule")
-def candidate_rule(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def candidate_rule(task_id: str, top_k: int = 50,
+                         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_key(x_api_key)
-    return {"ok": True, "data": CandidateRunner(task_id).filter_candidates()}
+    return {"ok": True, "data": await run_blocking(CandidateRunner(task_id).filter_candidates, top_k)}
 
 # 4. 替换 /verify/controlled 的 Mock 实现
 @penetrationRouter.post("/verify/controlled")
-def verify_controlled(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def verify_controlled(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_key(x_api_key)
-    return {"ok": True, "data": ValidatorRunner(task_id).verify()}
+    return {"ok": True, "data": await ValidatorRunner(task_id).averify()}
 
 # 5. 替换 /report/render 的 Mock 实现
 @penetrationRouter.post("/report/render")
-def render_report(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
+async def render_report(task_id: str, x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")):
     require_key(x_api_key)
-    return {"ok": True, "data": ReporterRunner(task_id).generate_final_package()}
+    return {"ok": True, "data": await run_blocking(ReporterRunner(task_id).generate_final_package)}
 
 
 from api.v1.tasks.schema import (ToolNucleiRequest, ToolNucleiResponse)
@@ -202,7 +225,7 @@ from api.v1.Penetration.runner.nuclei import NucleiRunner
 
 
 @penetrationRouter.post("/tool/nuclei", response_model=ToolNucleiResponse)
-def tool_nuclei_scan(
+async def tool_nuclei_scan(
         req: ToolNucleiRequest,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
 ):
@@ -213,7 +236,7 @@ def tool_nuclei_scan(
     require_key(x_api_key)
 
     runner = NucleiRunner(req.task_id)
-    findings = runner.run_scan(req.targets, req.templates)
+    findings = await runner.arun_scan(req.targets, req.templates)
 
     return ToolNucleiResponse(ok=True, findings=findings)
 
@@ -223,7 +246,7 @@ from api.v1.Penetration.runner.sqlmap import SqlmapRunner
 
 
 @penetrationRouter.post("/tool/sqlmap", response_model=ToolSqlmapResponse)
-def tool_sqlmap_scan(
+async def tool_sqlmap_scan(
         req: ToolSqlmapRequest,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
 ):
@@ -234,13 +257,33 @@ def tool_sqlmap_scan(
     require_key(x_api_key)
 
     runner = SqlmapRunner(req.task_id)
-    result = runner.run_injection_test(req.target_url, req.risk_level)
+    result = await runner.arun_injection_test(req.target_url, req.risk_level)
 
     finding_obj = SqlmapFinding(**result)
 
     return ToolSqlmapResponse(ok=True, finding=finding_obj)
 
 
+from api.v1.tasks.schema import ToolSqlmapBatchRequest, ToolSqlmapBatchResponse
+
+
+@penetrationRouter.post("/tool/sqlmap/batch", response_model=ToolSqlmapBatchResponse)
+async def tool_sqlmap_batch(
+        req: ToolSqlmapBatchRequest,
+        x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
+):
+    """
+    独立工具调用：SQLMap 批量注入探测
+    一次提交 ParamSpider 等工具产出的带参 URL 列表，按参数模板去重后分批并行测试。
+    """
+    require_key(x_api_key)
+
+    runner = SqlmapRunner(req.task_id)
+    result = await runner.arun_batch_test(req.target_urls, req.risk_level, req.enumerate_dbs)
+
+    return ToolSqlmapBatchResponse(ok=True, **{k: v for k, v in result.items() if k != "task_id"})
+
+
 from api.v1.tasks.schema import ToolDirScanRequest, ToolDirScanResponse
 from api.v1.Penetration.runner.dirscan import DirScanRunner
 
@@ -248,7 +291,7 @@ from api.v1.Penetration.runner.dirscan import DirScanRunner
 # api/v1/Penetration/tasks/controller.py (定位并替换 tool_dirscan 函数)
 
 @penetrationRouter.post("/tool/dirscan", response_model=ToolDirScanResponse)
-def tool_dirscan(
+async def tool_dirscan(
         req: ToolDirScanRequest,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
 ):
@@ -258,7 +301,7 @@ def tool_dirscan(
     require_key(x_api_key)
 
     runner = DirScanRunner(req.task_id)
-    findings = runner.run_scan(req.target_url, req.extensions, req.wordlist_type)
+    findings = await runner.arun_scan(req.target_url, req.extensions, req.wordlist_type)
 
     return ToolDirScanResponse(ok=True, findings=findings)
 
@@ -268,7 +311,7 @@ from api.v1.Penetration.runner.hydra import HydraRunner
 
 
 @penetrationRouter.post("/tool/hydra", response_model=ToolHydraResponse)
-def tool_hydra_bruteforce(
+async def tool_hydra_bruteforce(
         req: ToolHydraRequest,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
 ):
@@ -279,7 +322,7 @@ def tool_hydra_bruteforce(
     require_key(x_api_key)
 
     runner = HydraRunner(req.task_id)
-    result = runner.run_bruteforce(req.target_ip, req.service, req.port)
+    result = await runner.arun_bruteforce(req.target_ip, req.service, req.port)
 
     findings_objs = [HydraFinding(**f) for f in result.get("findings", [])]
 
@@ -290,8 +333,28 @@ def tool_hydra_bruteforce(
     )
 
 
+from api.v1.tasks.schema import ToolHydraCampaignRequest, ToolHydraCampaignResponse
+
+
+@penetrationRouter.post("/tool/hydra/campaign", response_model=ToolHydraCampaignResponse)
+async def tool_hydra_campaign(
+        req: ToolHydraCampaignRequest,
+        x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
+):
+    """
+    独立工具调用：Hydra 批量弱口令爆破
+    对任务 assets.json 中识别出的 SSH、FTP、MySQL、Redis 等服务统一调度爆破。
+    """
+    require_key(x_api_key)
+
+    runner = HydraRunner(req.task_id)
+    result = await run_blocking(runner.run_campaign, req.services)
+
+    return ToolHydraCampaignResponse(ok=True, **{k: v for k, v in result.items() if k != "task_id"})
+
+
 @penetrationRouter.post("/tool/execute", response_model=UnifiedToolResponse)
-def execute_unified_tool(
+async def execute_unified_tool(
         req: UnifiedToolRequest,
         x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
 ):
@@ -302,9 +365,49 @@ def execute_unified_tool(
     require_key(x_api_key)
 
     try:
-        result = ToolDispatcher.execute(req.task_id, req.tool_id, req.args)
+        result = await ToolDispatcher.aexecute(req.task_id, req.tool_id, req.args, req.cache)
         return UnifiedToolResponse(ok=True, **result)
+    except CacheMissError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ToolUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"工具执行异常: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"工具执行异常: {str(e)}")
+
+
+from api.v1.tasks.schema import ToolJobSubmitResponse, ToolJobStatusResponse
+from api.v1.Penetration.runner.job_queue import job_queue
+
+
+@penetrationRouter.post("/tool/submit", response_model=ToolJobSubmitResponse)
+async def submit_tool_job(
+        req: UnifiedToolRequest,
+        x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
+):
+    """
+    异步提交工具作业，立即返回 job_id。
+    Dify 通过 /tool/jobs/{job_id} 轮询进度与部分结果，避免长耗时扫描触发 HTTP 超时重试。
+    """
+    require_key(x_api_key)
+
+    try:
+        job = job_queue.submit(req.task_id, req.tool_id, req.args, req.cache)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ToolJobSubmitResponse(ok=True, job_id=job.job_id, state=job.state)
+
+
+@penetrationRouter.get("/tool/jobs/{job_id}", response_model=ToolJobStatusResponse)
+async def get_tool_job(
+        job_id: str,
+        x_api_key: Optional[str] = Header(default=None, alias="X-API-Key")
+):
+    """查询工具作业状态、进度、部分结果及最终结果"""
+    require_key(x_api_key)
+
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return ToolJobStatusResponse(ok=True, job=job)
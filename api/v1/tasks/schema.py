@@ -1,10 +1,11 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, Literal
 
 
 class Budget(BaseModel):
     """预算配置"""
     timeout_seconds: int = 900
+    # 请求速率预算（次/秒）；<= 0 表示不限速
     rate_limit_rps: float = 1.0
 
 
@@ -64,6 +65,7 @@ class UnifiedToolRequest(BaseModel):
     task_id: str
     tool_id: str               # 例如 "nuclei", "sqlmap"
     args: Dict[str, Any]       # 动态参数字典
+    cache: Literal["bypass", "prefer", "only"] = "prefer"  # 结果缓存策略
 
 class UnifiedToolResponse(BaseModel):
     """统一工具调用响应"""
@@ -71,6 +73,18 @@ class UnifiedToolResponse(BaseModel):
     tool_id: str
     summary: str               # 执行结果摘要
     findings: List[Dict[str, Any]] # 统一格式的漏洞/发现列表
+    cached: bool = False       # 是否来自结果缓存
+
+class ToolJobSubmitResponse(BaseModel):
+    """工具作业提交响应"""
+    ok: bool
+    job_id: str
+    state: str
+
+class ToolJobStatusResponse(BaseModel):
+    """工具作业状态响应"""
+    ok: bool
+    job: Dict[str, Any]
 
 class ToolNucleiRequest(BaseModel):
     """Nuclei 工具调用请求"""
@@ -109,6 +123,26 @@ class ToolSqlmapResponse(BaseModel):
     ok: bool
     finding: SqlmapFinding
 
+class ToolSqlmapBatchRequest(BaseModel):
+    """SQLMap 批量注入探测请求"""
+    task_id: str
+    target_urls: List[str]  # 带参数的 URL 列表，同一参数模板只测试一次
+    risk_level: int = 1
+    enumerate_dbs: bool = False  # 发现注入后是否枚举数据库 (--dbs)
+
+class SqlmapBatchFinding(SqlmapFinding):
+    """批量模式下单个 URL 的结果，附带注入点明细"""
+    injections: List[Dict[str, Any]] = []
+
+class ToolSqlmapBatchResponse(BaseModel):
+    """SQLMap 批量注入探测响应"""
+    ok: bool
+    total: int
+    tested: int
+    skipped: int
+    vulnerable: int
+    findings: List[SqlmapBatchFinding]
+
 
 class DirScanFinding(BaseModel):
     """目录扫描发现的路径"""
@@ -150,4 +184,17 @@ class ToolHydraResponse(BaseModel):
     """Hydra 工具调用响应"""
     ok: bool
     is_cracked: bool
+    findings: List[HydraFinding]
+
+class ToolHydraCampaignRequest(BaseModel):
+    """Hydra 批量爆破请求：目标取自任务 assets.json 中的开放服务"""
+    task_id: str
+    services: Optional[List[str]] = None  # 仅爆破指定的 hydra 服务，如 ["ssh", "mysql"]；为空表示全部
+
+class ToolHydraCampaignResponse(BaseModel):
+    """Hydra 批量爆破响应"""
+    ok: bool
+    jobs: int
+    completed: int
+    is_cracked: bool
     findings: List[HydraFinding]
\ No newline at end of file
@@ -92,14 +92,14 @@ class TaskService:
     def create_task(target: str, base_url: Optional[str], budget_obj: Budget) -> Dict[str, Any]:
         """创建新任务"""
         task_id = "t_" + secrets.token_hex(4)
-        task = task_crud.create(task_id, budget_obj.model_dump())
+        task = task_crud.create(task_id, budget_obj.model_dump(), target=target)
 
         # 初始化物理目录并注入预算合同
         runner = BaseRunner(task_id)
         runner.update_status({
             "target": target,
             "budget": budget_obj.model_dump()
-        })
+        }, flush=True)
 
         # 生成 scope.json
         scope_data = {
@@ -401,6 +401,8 @@ class TaskService:
         artifacts = []
         if os.path.exists(base_dir):
             for fn in sorted(os.listdir(base_dir)):
+                if fn.startswith("."):
+                    continue
                 p = os.path.join(base_dir, fn)
                 if os.path.isfile(p):
                     mime = "application/octet-stream"
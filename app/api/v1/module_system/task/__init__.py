@@ -0,0 +1,3 @@
+from .model import Task
+
+__all__ = ["Task"]
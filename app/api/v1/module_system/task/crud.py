@@ -1,11 +1,10 @@
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from typing import Any, Dict
-from sqlalchemy import select
-from fastapi import HTTPException
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, update, delete
 
 from app.config.setting import Settings
-from ..user import User
+from .model import Task
 
 
 # 这里是数据库操作层,我这里的初始化套用的之前的代码，用的异步引擎
@@ -17,6 +16,7 @@ class TaskCRUD:
             config.ASYNC_DB_URI,
             echo=False,
             future=True,
+            pool_pre_ping=True,
         )
 
         # 异步会话
@@ -26,11 +26,57 @@ class TaskCRUD:
             class_=AsyncSession,
         )
 
-    def creat_task(self):
-        """
-            目前感觉你就可能只需要这里一个？
-            把任务写入数据库
-            用SQL alchemy orm！！！跟ai说下，orm！！！不要core风格！！！
-            orm需要模型类，就是model里面定义的那个，跟ai说就行了
-        """
-        pass
+    @asynccontextmanager
+    async def get_db(self):
+        async with self.async_session() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                raise e
+
+    async def init_table(self):
+        """确保任务表存在（生产环境以 alembic 迁移为准，开发环境 sqlite 可直接建表）"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Task.__table__.create, checkfirst=True)
+
+    async def create_task(self, data: Dict[str, Any]) -> Task:
+        """把任务写入数据库"""
+        async with self.get_db() as db:
+            task = Task(**data)
+            db.add(task)
+        return task
+
+    async def get_task(self, task_id: str) -> Optional[Task]:
+        async with self.get_db() as db:
+            result = await db.execute(select(Task).where(Task.task_id == task_id))
+            return result.scalar_one_or_none()
+
+    async def update_task(self, task_id: str, fields: Dict[str, Any]) -> bool:
+        """单条 UPDATE 语句原子更新，多 worker 并发写同一任务时不会互相覆盖未修改的字段"""
+        if not fields:
+            return True
+        async with self.get_db() as db:
+            result = await db.execute(
+                update(Task).where(Task.task_id == task_id).values(**fields).execution_options(synchronize_session=False)
+            )
+            return result.rowcount > 0
+
+    async def delete_task(self, task_id: str) -> bool:
+        async with self.get_db() as db:
+            result = await db.execute(delete(Task).where(Task.task_id == task_id))
+            return result.rowcount > 0
+
+    async def list_tasks(self, state: Optional[str] = None, stage: Optional[str] = None,
+                         limit: int = 100, offset: int = 0) -> List[Task]:
+        """按 state / stage 过滤并按更新时间倒序，走索引，无需扫描 runs/ 目录"""
+        stmt = select(Task)
+        if state:
+            stmt = stmt.where(Task.state == state)
+        if stage:
+            stmt = stmt.where(Task.stage == stage)
+        stmt = stmt.order_by(Task.updated_time.desc()).limit(limit).offset(offset)
+        async with self.get_db() as db:
+            result = await db.execute(stmt)
+            return list(result.scalars().all())
@@ -1,15 +1,25 @@
 from app.core.base_model import ModelMixin
 from sqlalchemy.orm import mapped_column, Mapped, relationship
-from sqlalchemy import String
+from sqlalchemy import String, Integer, Text, JSON
 
 from typing import List
 
 
 class Task(ModelMixin):
     """
-        需要的字段自己看着写
-        ctrl点ModelMixin跳转查看预设好了的一些必要数据（这些不需要重复定义）
-        别到时候给我整出俩个主键几个uuid之类的了！！！！
+        渗透测试任务表（原 api/v1/Penetration/crud.py 中进程内 dict 的持久化版本）
+        主键 / uuid / 创建时间 / 更新时间由 ModelMixin 提供，updated_time 已建索引
     """
     __tablename__: str = "sys_task"
-    __table_args__: dict[str, str] = {"comment": "任务表"}
\ No newline at end of file
+    __table_args__: dict[str, str] = {"comment": "任务表"}
+
+    task_id: Mapped[str] = mapped_column(String(32), nullable=False, unique=True, comment="任务ID", index=True)
+    target: Mapped[str | None] = mapped_column(String(255), nullable=True, comment="扫描目标")
+    state: Mapped[str] = mapped_column(String(32), default="created", nullable=False, comment="任务状态", index=True)
+    stage: Mapped[str] = mapped_column(String(64), default="stage0_create", nullable=False, comment="当前阶段", index=True)
+    percent: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment="进度百分比")
+    hint: Mapped[str | None] = mapped_column(Text, default="Created", nullable=True, comment="进度提示")
+    blocked: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False, comment="阻塞信息")
+    budget: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False, comment="预算配置")
+    approved: Mapped[str | None] = mapped_column(String(16), nullable=True, comment="审批结果(approve/reject)")
+    poll_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False, comment="轮询次数")
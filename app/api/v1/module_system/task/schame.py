@@ -5,6 +5,7 @@ from typing import Optional, Dict, Any, Union, Literal
 class Budget(BaseModel):
     """与 api/v1/tasks/schema.py 保持一致"""
     timeout_seconds: int = 900
+    # 请求速率预算（次/秒）；<= 0 表示不限速
     rate_limit_rps: float = 1.0
 
 